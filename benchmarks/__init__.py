@@ -0,0 +1,5 @@
+"""
+Benchmarks for the authorization service.
+
+Run them from the repository root, e.g. `python -m benchmarks.bench_authorize`.
+"""
@@ -0,0 +1,194 @@
+"""
+bench_authorize.py
+==================
+Authorization Benchmark Suite
+
+Measures how the enforcer behind `casbin_authorize` behaves as the policy
+grows. For every policy size a synthetic hierarchy is generated with
+`PolicyGenerator`, written as a policy CSV and measured in a fresh process
+(so memory numbers are not polluted by earlier sizes):
+
+- cold start: building the enforcer from the model and policy files,
+- memory: resident set size added by the loaded enforcer,
+- enforce latency percentiles and single-thread throughput on cache misses,
+- `add_policy` latency and `save_policy` duration.
+
+Results are printed and saved as JSON, so runs can be compared:
+
+    python -m benchmarks.bench_authorize --sizes 1000 100000 1000000 --output bench.json
+
+`--baseline` runs the same measurements on a plain `casbin.Enforcer`, which
+gets slow quickly at large sizes.
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model.conf")
+
+
+def rss_bytes() -> int:
+    """Returns the current resident set size of the process."""
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak instead of current RSS, in KiB on Linux and bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentiles(samples: list) -> dict:
+    """Summarizes latencies in seconds as microsecond percentiles."""
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1e6
+
+    return {
+        "p50_us": at(0.50),
+        "p95_us": at(0.95),
+        "p99_us": at(0.99),
+        "max_us": ordered[-1] * 1e6,
+        "mean_us": statistics.fmean(ordered) * 1e6,
+    }
+
+
+def run_size(size: int, options: dict) -> dict:
+    """
+    Generates a policy of about `size` rules and measures one enforcer on it.
+
+    Runs in a worker process; `options` holds the parsed command-line options.
+    """
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import casbin
+    from benchmarks.policy_generator import PolicyGenerator
+    from services.enforcer import IndexedEnforcer
+
+    generator = PolicyGenerator(
+        users=options["users"],
+        private_ratio=options["private_ratio"],
+        collaborator_ratio=options["collaborator_ratio"],
+        collaborators=options["collaborators"],
+        fanout=options["fanout"],
+        seed=options["seed"],
+    )
+    enforcer_class = casbin.Enforcer if options["baseline"] else IndexedEnforcer
+
+    with tempfile.TemporaryDirectory() as directory:
+        policy_path = os.path.join(directory, "policy.csv")
+        rules = generator.rules(size)
+        generator.write_csv(rules, policy_path)
+        requests = generator.requests(options["requests"])
+        del rules
+        gc.collect()
+
+        rss_before = rss_bytes()
+        started = time.perf_counter()
+        enforcer = enforcer_class(MODEL_PATH, policy_path)
+        cold_start = time.perf_counter() - started
+        gc.collect()
+        rss_after = rss_bytes()
+        rule_count = len(enforcer.get_policy())
+
+        for request in requests[: options["warmup"]]:
+            enforcer.enforce(*request)
+        latencies, allowed = [], 0
+        started = time.perf_counter()
+        for request in requests:
+            began = time.perf_counter()
+            allowed += enforcer.enforce(*request)
+            latencies.append(time.perf_counter() - began)
+        elapsed = time.perf_counter() - started
+
+        add_latencies = []
+        for i in range(options["adds"]):
+            rule = ["41", f"bench_user_{i}", f"bench_ws.catalog_{i}(\\..*)?$", ".*", ".*", "allow"]
+            began = time.perf_counter()
+            enforcer.add_policy(*rule)
+            add_latencies.append(time.perf_counter() - began)
+
+        began = time.perf_counter()
+        enforcer.save_policy()
+        save_seconds = time.perf_counter() - began
+
+        return {
+            "size": size,
+            "rules": rule_count,
+            "enforcer": enforcer_class.__name__,
+            "cold_start_s": cold_start,
+            "rss_bytes": rss_after - rss_before,
+            "enforce": dict(
+                percentiles(latencies),
+                requests=len(requests),
+                allowed=allowed,
+                throughput_per_s=len(requests) / elapsed,
+            ),
+            "add_policy": percentiles(add_latencies),
+            "save_policy_s": save_seconds,
+        }
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark authorization decisions as the policy grows.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000],
+                        help="policy sizes in rules (default: 1000 100000 1000000)")
+    parser.add_argument("--requests", type=int, default=20000, help="enforce calls measured per size")
+    parser.add_argument("--warmup", type=int, default=1000, help="enforce calls made before measuring")
+    parser.add_argument("--adds", type=int, default=200, help="add_policy calls measured per size")
+    parser.add_argument("--users", type=int, default=1000, help="distinct users in the policy")
+    parser.add_argument("--private-ratio", type=float, default=0.3, help="share of private resources")
+    parser.add_argument("--collaborator-ratio", type=float, default=0.2, help="share of shared resources")
+    parser.add_argument("--collaborators", type=int, default=2, help="collaborators per shared resource")
+    parser.add_argument("--fanout", type=int, default=10, help="children per container")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the generator")
+    parser.add_argument("--baseline", action="store_true", help="measure casbin.Enforcer instead")
+    parser.add_argument("--output", help="file the JSON results are written to")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    options = vars(arguments)
+    results = []
+    for size in arguments.sizes:
+        # A fresh process per size keeps the memory numbers comparable.
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_size, size, options).result()
+        results.append(result)
+        enforce = result["enforce"]
+        print(
+            f"{result['rules']:>9} rules  cold start {result['cold_start_s']:.2f}s  "
+            f"rss {result['rss_bytes'] / 2**20:.1f} MiB  enforce p50 {enforce['p50_us']:.0f}us "
+            f"p99 {enforce['p99_us']:.0f}us  {enforce['throughput_per_s']:.0f}/s  "
+            f"add_policy p50 {result['add_policy']['p50_us']:.0f}us  save {result['save_policy_s']:.2f}s"
+        )
+
+    report = {
+        "benchmark": "authorize",
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": options,
+        "results": results,
+    }
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""
+load_harness.py
+===============
+In-Process HTTP Load Harness
+
+Drives `main.app` through its ASGI interface (no sockets, no server) with a
+number of concurrent clients replaying a realistic mix of requests against
+all six resource routers:
+
+- token login (`POST /token`),
+- list-filter, detail and create-new requests of jobs, catalogs, schemas,
+  tables, buckets and files.
+
+Every request is timed end to end, and the time spent in the stages of the
+request is attributed with a context variable:
+
+- `auth`: the `get_current_active_user` dependency (token to user),
+- `request_body`: `extract_request_body`,
+- `enforce`: `casbin_authorize_async` / `batch_enforce_async` (decision cache,
+  the wait for an enforcement pool worker and the enforcer),
+- `handler`: everything else (routing, validation, the route body, the response).
+
+The report lists p50/p95/p99 latency per route and the share of each stage,
+and can be saved as JSON:
+
+    python -m benchmarks.load_harness --clients 32 --requests 200 --rules 100000 --output load.json
+
+The app runs on a copy of `policy.csv` in a temporary directory, optionally
+extended with `--rules` generated rules, so runs never touch the real policy.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGES = ("auth", "request_body", "enforce", "handler")
+
+# Passwords of the demo users in `UsersDAO`.
+USERS = {"supreme": "secret1", "cto": "secret2", "employee": "secret3", "learner": "secret4"}
+
+_stage_times = contextvars.ContextVar("stage_times", default=None)
+
+
+def _record(stage, seconds):
+    times = _stage_times.get()
+    if times is not None:
+        times[stage] = times.get(stage, 0.0) + seconds
+
+
+def _timed(stage, function):
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            _record(stage, time.perf_counter() - started)
+
+    wrapper.__wrapped__ = function
+    return wrapper
+
+
+def instrument(app):
+    """
+    Installs the stage timers on the app and its authorization service.
+
+    `get_current_active_user` is replaced through FastAPI's dependency
+    overrides; the other stages are module globals of `services.auth_service`
+    that the routes look up at call time.
+    """
+    from fastapi import Depends
+    from services import auth_service
+
+    async def timed_active_user(token: str = Depends(auth_service.oauth2_scheme)):
+        started = time.perf_counter()
+        try:
+            user = await auth_service.get_current_user(token)
+            return await auth_service.get_current_active_user(user)
+        finally:
+            _record("auth", time.perf_counter() - started)
+
+    app.dependency_overrides[auth_service.get_current_active_user] = timed_active_user
+    auth_service.extract_request_body = _timed("request_body", auth_service.extract_request_body)
+    auth_service.casbin_authorize_async = _timed("enforce", auth_service.casbin_authorize_async)
+    auth_service.batch_enforce_async = _timed("enforce", auth_service.batch_enforce_async)
+
+
+class Scenario:
+    """
+    Picks the next request of a client.
+
+    Reads and lists target the resources of `policy.csv` and of the generated
+    hierarchy; creates add new resources under the `default` workspace and the
+    `org_load` organization with names unique to the client.
+    """
+
+    def __init__(self, client_id: int, resources: list, seed: int):
+        self.client_id = client_id
+        self.resources = resources
+        self.random = random.Random(seed * 1000 + client_id)
+        self.created = 0
+
+    def next_request(self, user):
+        """Returns `(route, method, path, params, json, form)` for the next request."""
+        draw = self.random.random()
+        if draw < 0.05:
+            return self._login(user)
+        if draw < 0.30:
+            return self._list()
+        if draw < 0.85:
+            return self._detail()
+        return self._create()
+
+    def _login(self, user):
+        form = {"username": user, "password": USERS[user]}
+        return "POST /token", "POST", "/token", None, None, form
+
+    def _workspace_resource(self):
+        return self.random.choice(self.resources["workspace"])
+
+    def _storage_resource(self):
+        return self.random.choice(self.resources["storage"])
+
+    def _list(self):
+        kind = self.random.choice(("job", "catalog", "schema", "table", "bucket", "file"))
+        ws, catalog, schema, _ = self._workspace_resource()
+        org, bucket, _ = self._storage_resource()
+        if kind == "job":
+            return _get("/workflow-service/v1/job/list-filter", workspaceId=ws)
+        if kind == "catalog":
+            return _get("/workspace-service/v1/catalog/list-filter", workspaceId=ws)
+        if kind == "schema":
+            return _get("/workspace-service/v1/schema/list-filter", workspaceId=ws, catalogId=catalog)
+        if kind == "table":
+            return _get("/workspace-service/v1/table/list-filter", workspaceId=ws, catalogId=catalog, schemaId=schema)
+        if kind == "bucket":
+            return _get("/storage-admin-service/v1/bucket/list-filter", organizationId=org)
+        return _get("/storage-service/v1/file/list-filter", organizationId=org, folder=bucket)
+
+    def _detail(self):
+        kind = self.random.choice(("job", "catalog", "schema", "table", "bucket", "file"))
+        ws, catalog, schema, table = self._workspace_resource()
+        org, bucket, file = self._storage_resource()
+        if kind == "job":
+            return _get("/workflow-service/v1/job/detail", workspaceId=ws, jobId=catalog)
+        if kind == "catalog":
+            return _get("/workspace-service/v1/catalog/detail", workspaceId=ws, catalogId=catalog)
+        if kind == "schema":
+            return _get("/workspace-service/v1/schema/detail", workspaceId=ws, catalogId=catalog, schemaId=schema)
+        if kind == "table":
+            return _get("/workspace-service/v1/table/detail", workspaceId=ws, catalogId=catalog,
+                        schemaId=schema, tableId=table)
+        if kind == "bucket":
+            return _get("/storage-admin-service/v1/bucket/detail", organizationId=org, bucketId=bucket)
+        body = {"organizationId": org, "folder": bucket, "fileId": file}
+        return _post("/storage-service/v1/file/download", body)
+
+    def _create(self):
+        self.created += 1
+        name = f"load_{self.client_id}_{self.created}"
+        private = self.random.random() < 0.3
+        kind = self.random.choice(("job", "catalog", "schema", "table", "bucket", "file"))
+        if kind == "job":
+            body = {"name": name, "workspaceId": "default", "isPrivate": private}
+            return _post("/workflow-service/v1/job/create-new", body)
+        if kind == "catalog":
+            body = {"name": name, "workspaceId": "default", "bucket": "load", "isPrivate": private}
+            return _post("/workspace-service/v1/catalog/create-new", body)
+        if kind == "schema":
+            body = {"name": name, "workspaceId": "default", "catalogId": "catalog_load", "bucket": "load",
+                    "isPrivate": private}
+            return _post("/workspace-service/v1/schema/create-new", body)
+        if kind == "table":
+            body = {"name": name, "workspaceId": "default", "catalogId": "catalog_load", "schemaId": "schema_load",
+                    "columns": "id", "isPrivate": private}
+            return _post("/workspace-service/v1/table/create-new", body)
+        if kind == "bucket":
+            body = {"name": name, "organizationId": "org_load", "isPrivate": private}
+            return _post("/storage-admin-service/v1/bucket/create-new", body)
+        body = {"name": name, "organizationId": "org_load", "folder": "bucket_load", "isPrivate": private}
+        return _post("/storage-service/v1/file/upload", body)
+
+
+def _get(path, **params):
+    return f"GET {path}", "GET", path, params, None, None
+
+
+def _post(path, body):
+    return f"POST {path}", "POST", path, None, body, None
+
+
+def prepare_policy(directory: str, rules: int, seed: int) -> dict:
+    """
+    Writes the policy the app runs on and returns the resources to target.
+
+    Returns:
+        dict: `workspace` resources as `(ws, catalog, schema, table)` and
+            `storage` resources as `(org, bucket, file)` tuples.
+    """
+    sys.path.insert(0, ROOT)
+    from benchmarks.policy_generator import PolicyGenerator
+
+    policy_path = os.path.join(directory, "policy.csv")
+    shutil.copy(os.path.join(ROOT, "policy.csv"), policy_path)
+    resources = {
+        "workspace": [("default", "catalog_1", "schema_1", "table_1"), ("dev_workspace", "job_1", "s", "t")],
+        "storage": [("org_load", "bucket_load", "file_1")],
+    }
+    if rules <= 0:
+        return resources
+
+    generator = PolicyGenerator(seed=seed)
+    generated = generator.rules(rules)[1:-1]  # `policy.csv` already has the global rules.
+    with open(policy_path, "a") as file:
+        file.write("\n")
+        for rule in generated:
+            file.write("p, " + ", ".join(rule) + "\n")
+
+    for rule in generated:
+        pattern = rule[2]
+        if "(\\..*)?$" in pattern:
+            parts = pattern[: -len("(\\..*)?$")].split(".")
+            if len(parts) == 4:
+                resources["workspace"].append(tuple(parts))
+        elif pattern.endswith("(/.*)?$"):
+            org, _, path = pattern[: -len("(/.*)?$")].partition(":")
+            parts = path.split("/")
+            if len(parts) == 3:
+                resources["storage"].append((org, parts[0], parts[1] + "/" + parts[2]))
+    return resources
+
+
+async def run_client(client, scenario, user, requests, samples):
+    for _ in range(requests):
+        route, method, path, params, body, form = scenario.next_request(user)
+        times = {}
+        token = _stage_times.set(times)
+        started = time.perf_counter()
+        try:
+            response = await client.request(
+                method, path, params=params, json=body, data=form,
+                headers={"Authorization": f"Bearer {user}"},
+            )
+            status = response.status_code
+        finally:
+            total = time.perf_counter() - started
+            _stage_times.reset(token)
+        times["handler"] = max(0.0, total - sum(times.values()))
+        samples.append((route, status, total, times))
+
+
+async def run_load(app, resources, arguments):
+    import httpx
+
+    samples = []
+    transport = httpx.ASGITransport(app=app)
+    users = list(USERS)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://harness") as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                run_client(client, Scenario(i, resources, arguments.seed), users[i % len(users)],
+                           arguments.requests, samples)
+                for i in range(arguments.clients)
+            ))
+            elapsed = time.perf_counter() - started
+    return samples, elapsed
+
+
+def summarize(samples, elapsed):
+    """Aggregates the samples into per-route percentiles and stage shares."""
+
+    def percentile(ordered, fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1e3
+
+    by_route = {}
+    for route, status, total, times in samples:
+        by_route.setdefault(route, []).append((status, total, times))
+
+    def describe(entries):
+        totals = sorted(total for _, total, _ in entries)
+        spent = sum(totals)
+        statuses = {}
+        for status, _, _ in entries:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            "requests": len(entries),
+            "statuses": statuses,
+            "p50_ms": percentile(totals, 0.50),
+            "p95_ms": percentile(totals, 0.95),
+            "p99_ms": percentile(totals, 0.99),
+            "stage_share": {
+                stage: (sum(times.get(stage, 0.0) for _, _, times in entries) / spent if spent else 0.0)
+                for stage in STAGES
+            },
+        }
+
+    overall = describe([(status, total, times) for _, status, total, times in samples])
+    overall["throughput_per_s"] = len(samples) / elapsed if elapsed else 0.0
+    return {"overall": overall, "routes": {route: describe(entries) for route, entries in sorted(by_route.items())}}
+
+
+def print_report(summary):
+    header = f"{'route':<58} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  " + "  ".join(
+        f"{stage:>12}" for stage in STAGES
+    )
+    print(header)
+    rows = list(summary["routes"].items()) + [("overall", summary["overall"])]
+    for route, stats in rows:
+        shares = "  ".join(f"{stats['stage_share'][stage]:>11.1%}" for stage in STAGES)
+        print(f"{route:<58} {stats['requests']:>6} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} "
+              f"{stats['p99_ms']:>8.2f}  {shares}")
+    print(f"throughput {summary['overall']['throughput_per_s']:.0f} requests/s")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a request mix against the app in-process.")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument("--rules", type=int, default=0, help="generated rules added to policy.csv")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the request mix and generator")
+    parser.add_argument("--log", action="store_true", help="keep the app's request logging")
+    parser.add_argument("--output", help="file the JSON results are written to")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    with tempfile.TemporaryDirectory() as directory:
+        resources = prepare_policy(directory, arguments.rules, arguments.seed)
+
+        # The app reads its settings at import time.
+        import settings
+
+        settings.MODEL_CONF_PATH = os.path.join(ROOT, "model.conf")
+        settings.POLICY_CSV_PATH = os.path.join(directory, "policy.csv")
+        settings.POLICY_STORAGE = "csv"
+        settings.POLICY_SYNC_PATH = None
+
+        from loguru import logger
+
+        if not arguments.log:
+            logger.remove()
+        import main as app_module
+
+        if not arguments.log:
+            # Casbin configures its loggers when the enforcer is created.
+            for name in list(logging.root.manager.loggerDict):
+                if name.startswith("casbin"):
+                    logging.getLogger(name).setLevel(logging.ERROR)
+
+        instrument(app_module.app)
+        samples, elapsed = asyncio.run(run_load(app_module.app, resources, arguments))
+
+    summary = summarize(samples, elapsed)
+    print_report(summary)
+    report = {
+        "benchmark": "load",
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": vars(arguments),
+        **summary,
+    }
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
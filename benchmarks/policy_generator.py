@@ -0,0 +1,183 @@
+"""
+policy_generator.py
+===================
+Synthetic Resource Hierarchies for Benchmarks
+
+`PolicyGenerator` builds a policy shaped like the one the routes produce:
+organizations with buckets, folders and files (`org:bucket/folder`), and
+workspaces with catalogs, schemas and tables (`ws.catalog.schema.table`).
+Every resource gets the rules its `create-new` route writes, with the same
+`AccessLevel` priorities and object suffixes:
+
+- an owner rule (`*_OWNER`, `.*` actions, allow),
+- for private resources a `*_DENY_ALL` rule for `.*`,
+- for some resources reader (`GET`) and writer (`.*`) collaborator rules.
+
+The two global rules of `policy.csv` (the `root` allow-all and the final
+allow-all) frame the generated rules. Generation is deterministic for a seed.
+
+Classes:
+--------
+- PolicyGenerator: Generates rules and matching authorization requests.
+"""
+
+import random
+
+from constants import (
+    AccessLevel,
+    optional_trailing_colon,
+    optional_trailing_dot,
+    optional_trailing_forward_slash,
+)
+
+# (owner, reader, writer, deny-all) access levels of each kind of resource.
+_ORGANIZATION_LEVELS = (
+    AccessLevel.ORGANIZATION_OWNER, AccessLevel.ORGANIZATION_READER, AccessLevel.ORGANIZATION_WRITER, None
+)
+_BUCKET_LEVELS = (AccessLevel.BUCKET_OWNER, AccessLevel.BUCKET_READER, AccessLevel.BUCKET_WRITER, AccessLevel.BUCKET_DENY_ALL)
+_FILE_LEVELS = (AccessLevel.FILE_OWNER, AccessLevel.FILE_READER, AccessLevel.FILE_WRITER, AccessLevel.FILE_DENY_ALL)
+_WORKSPACE_LEVELS = (AccessLevel.WORKSPACE_OWNER, AccessLevel.WORKSPACE_READER, AccessLevel.WORKSPACE_WRITER, None)
+_CATALOG_LEVELS = (
+    AccessLevel.CATALOG_OWNER, AccessLevel.CATALOG_READER, AccessLevel.CATALOG_WRITER, AccessLevel.CATALOG_DENY_ALL
+)
+_SCHEMA_LEVELS = (AccessLevel.SCHEMA_OWNER, AccessLevel.SCHEMA_READER, AccessLevel.SCHEMA_WRITER, AccessLevel.SCHEMA_DENY_ALL)
+_TABLE_LEVELS = (AccessLevel.TABLE_OWNER, AccessLevel.TABLE_READER, AccessLevel.TABLE_WRITER, AccessLevel.TABLE_DENY_ALL)
+
+# The rules of `policy.csv` that apply to every tenant: `root` first, the default allow last.
+GLOBAL_RULES = [
+    ["10", "root", ".*", ".*", ".*", "allow"],
+    ["1000", ".*", ".*", ".*", ".*", "allow"],
+]
+
+
+class PolicyGenerator:
+    """
+    Generates a synthetic policy and requests against it.
+
+    Attributes:
+    - users (int): Number of distinct users owning or sharing resources.
+    - private_ratio (float): Share of resources that deny everyone but the owner.
+    - collaborator_ratio (float): Share of resources shared with collaborators.
+    - collaborators (int): Collaborators per shared resource.
+    - fanout (int): Children per container (buckets per organization, ...).
+    - storage_ratio (float): Share of tenants that are organizations rather
+        than workspaces.
+    """
+
+    def __init__(self, users: int = 1000, private_ratio: float = 0.3, collaborator_ratio: float = 0.2,
+                 collaborators: int = 2, fanout: int = 10, storage_ratio: float = 0.5, seed: int = 0):
+        self.users = users
+        self.private_ratio = private_ratio
+        self.collaborator_ratio = collaborator_ratio
+        self.collaborators = collaborators
+        self.fanout = fanout
+        self.storage_ratio = storage_ratio
+        self._random = random.Random(seed)
+        self._resources = []
+
+    def rules(self, target: int) -> list:
+        """
+        Generates about `target` rules, tenant by tenant.
+
+        Returns:
+            list: Rules as `[priority, sub, obj, act, req_body, eft]` lists, in
+                the order the routes would have added them.
+        """
+        rules = [list(GLOBAL_RULES[0])]
+        self._resources = []
+        tenant = 0
+        while len(rules) < target - 1:
+            if self._random.random() < self.storage_ratio:
+                resources = self._organization(f"org_{tenant}")
+            else:
+                resources = self._workspace(f"ws_{tenant}")
+            for levels, obj, pattern in resources:
+                self._resource(rules, levels, obj, pattern)
+                if len(rules) >= target - 1:
+                    break
+            tenant += 1
+        rules.append(list(GLOBAL_RULES[1]))
+        return rules
+
+    def requests(self, count: int) -> list:
+        """
+        Generates requests against the resources of the last `rules` call.
+
+        Requests mix owners, collaborators and outsiders, reads and writes,
+        and objects at and below the generated resources.
+
+        Returns:
+            list: `(sub, obj, act, req_body)` tuples.
+        """
+        requests = []
+        for _ in range(count):
+            obj, owner, collaborators = self._random.choice(self._resources)
+            draw = self._random.random()
+            if draw < 0.4:
+                sub = owner
+            elif draw < 0.7 and collaborators:
+                sub = self._random.choice(collaborators)
+            else:
+                sub = self._user()
+            if self._random.random() < 0.3:
+                obj += "/item" if ":" in obj else ".item"
+            act = "GET" if self._random.random() < 0.8 else "POST"
+            requests.append((sub, obj, act, ""))
+        return requests
+
+    def write_csv(self, rules: list, path: str, groupings: list = ()):
+        """Writes rules in the `policy.csv` format."""
+        with open(path, "w") as file:
+            for rule in rules:
+                file.write("p, " + ", ".join(rule) + "\n")
+            for grouping in groupings:
+                file.write("g, " + ", ".join(grouping) + "\n")
+
+    def _organization(self, org):
+        """Yields the resources of an organization, parents first."""
+        yield _ORGANIZATION_LEVELS, org, org + optional_trailing_colon
+        for b in range(self.fanout):
+            bucket = f"{org}:bucket_{b}"
+            yield _BUCKET_LEVELS, bucket, bucket + optional_trailing_forward_slash
+            for f in range(self.fanout):
+                folder = f"{bucket}/folder_{f}"
+                yield _FILE_LEVELS, folder, folder + optional_trailing_forward_slash
+                for n in range(self.fanout):
+                    path = f"{folder}/file_{n}"
+                    yield _FILE_LEVELS, path, path + optional_trailing_forward_slash
+
+    def _workspace(self, workspace):
+        """Yields the resources of a workspace, parents first."""
+        yield _WORKSPACE_LEVELS, workspace, workspace + optional_trailing_dot
+        for c in range(self.fanout):
+            catalog = f"{workspace}.catalog_{c}"
+            yield _CATALOG_LEVELS, catalog, catalog + optional_trailing_dot
+            for s in range(self.fanout):
+                schema = f"{catalog}.schema_{s}"
+                yield _SCHEMA_LEVELS, schema, schema + optional_trailing_dot
+                for t in range(self.fanout):
+                    table = f"{schema}.table_{t}"
+                    yield _TABLE_LEVELS, table, table + optional_trailing_dot
+
+    def _resource(self, rules, levels, obj, pattern):
+        owner_level, reader_level, writer_level, deny_level = levels
+        owner = self._user()
+        rules.append([owner_level.value, owner, pattern, ".*", ".*", "allow"])
+
+        collaborators = []
+        if self._random.random() < self.collaborator_ratio:
+            for i in range(self.collaborators):
+                collaborator = self._user()
+                collaborators.append(collaborator)
+                if i % 2 == 0:
+                    rules.append([reader_level.value, collaborator, pattern, "GET", ".*", "allow"])
+                else:
+                    rules.append([writer_level.value, collaborator, pattern, ".*", ".*", "allow"])
+
+        # Organizations and workspaces are not created by a route, so they are never private.
+        if deny_level is not None and self._random.random() < self.private_ratio:
+            rules.append([deny_level.value, ".*", pattern, ".*", ".*", "deny"])
+        self._resources.append((obj, owner, collaborators))
+
+    def _user(self):
+        return f"user_{self._random.randrange(self.users)}"
@@ -2,12 +2,14 @@
 main.py
 """
 
+from contextlib import asynccontextmanager
 from fastapi import Depends, FastAPI, HTTPException, status, Request, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from starlette.responses import RedirectResponse
 
 # from pydantic import BaseModel
-from settings import MODEL_CONF_PATH, POLICY_CSV_PATH
+from settings import MODEL_CONF_PATH, POLICY_CSV_PATH, METRICS_ENABLED
+from settings import AUTHZ_EXPLAIN_HEADER, AUTHZ_EXPLAIN_SAMPLE_RATE
 import casbin
 from utils import User, UsersDAO, DeleteJobRequest, CreateTaskRequest, CreateCatalogRequest
 from utils import *
@@ -17,15 +19,45 @@ from urllib.parse import unquote
 import json
 from constants import AccessLevel
 from services.auth_service import *
-from routes import jobs, catalogs, schemas, tables, bucket, file
+from routes import jobs, catalogs, schemas, tables, bucket, file, authz, metrics, policy
+from services.explain import ExplainMiddleware
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Application lifespan hook.
+
+    Joins the policy synchronization of the workers and starts the periodic
+    policy compaction on startup. Flushes policy changes that are still waiting
+    in the write-behind persister and stops the enforcement pool before the
+    server shuts down.
+    """
+    if policy_watcher is not None:
+        policy_watcher.start()
+    if policy_compactor is not None:
+        policy_compactor.start()
+    yield
+    if policy_compactor is not None:
+        await policy_compactor.close()
+    if policy_watcher is not None:
+        await policy_watcher.close()
+    await policy_persister.close()
+    enforcement_pool.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(jobs.router)
 app.include_router(catalogs.router)
 app.include_router(schemas.router)
 app.include_router(tables.router)
 app.include_router(bucket.router)
 app.include_router(file.router)
+app.include_router(authz.router)
+app.include_router(policy.router)
+if METRICS_ENABLED:
+    app.include_router(metrics.router)
+if AUTHZ_EXPLAIN_HEADER or AUTHZ_EXPLAIN_SAMPLE_RATE:
+    app.add_middleware(ExplainMiddleware, header=AUTHZ_EXPLAIN_HEADER, sample_rate=AUTHZ_EXPLAIN_SAMPLE_RATE)
 
 @app.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from loguru import logger
+from utils import *
+from services.auth_service import *
+from settings import AUTHZ_BATCH_MAX_SIZE
+
+
+router = APIRouter(tags=["Authorization"])
+
+
+@router.post("/authz/batch-check")
+async def batch_check(
+    request_body: BatchCheckRequest,
+    curr_user: User = Depends(get_current_active_user)
+):
+    """
+    Checks many permissions of the current user in one round trip.
+
+    Args:
+    request_body (BatchCheckRequest): The `(obj, act, req_body)` checks, where `obj` is a
+        policy object such as `default.catalog_1.schema_1`.
+    curr_user (User, optional): The authenticated user making the request.
+        Defaults to Depends(get_current_active_user).
+
+    Returns:
+        dict: `decisions`, one boolean per check in request order.
+
+    Raises:
+        HTTPException: If the batch holds more than `AUTHZ_BATCH_MAX_SIZE` checks.
+    """
+    checks = request_body.checks
+    if len(checks) > AUTHZ_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may hold at most {AUTHZ_BATCH_MAX_SIZE} checks",
+        )
+
+    decisions = await batch_enforce_async(
+        curr_user.username, [(check.obj, check.act, check.req_body) for check in checks]
+    )
+    logger.info(f"Batch check of {len(checks)} permissions for {curr_user.username}")
+    return {"decisions": decisions}
@@ -43,7 +43,7 @@ async def create_new_bucket(
             ".*", f'.*', "deny"
         )
     
-    casbin_enforcer.save_policy()
+    policy_persister.request_save()
     
     return {f"bucket {bucketId} created!"}
     
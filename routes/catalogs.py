@@ -3,6 +3,7 @@ from loguru import logger
 from utils import *
 from services.auth_service import *
 from constants import *
+from services.resource_registry import CATALOG
 
 
 router = APIRouter(tags=["Catalog"])
@@ -12,21 +13,27 @@ router = APIRouter(tags=["Catalog"])
 async def list_all_catalog(
     req: Request,
     workspaceId: str,
+    cursor: Optional[str] = None,
+    limit: int = 100,
     curr_user: User = Depends(get_current_active_user)
 ):
     """
     Mock API for "/catalog". 
     
     Args:
+    cursor (str, optional): The `nextCursor` returned by the previous page.
+    limit (int, optional): The maximum number of catalogs in the page.
     curr_user (User, optional): The authenticated user making the request. 
         Defaults to Depends(get_current_active_user).
 
     Returns:
-        dict: A message confirming the retrieval of all jobs. (mock)
+        dict: The catalogs of the workspace the user may access (`items`) and the cursor of
+        the next page (`nextCursor`).
     """
     await check_workspace_authorization(req, curr_user, workspaceId)
     logger.info(f"List all catalog in workspace {workspaceId}")
-    return {"message": f"List all catalog in workspace {workspaceId}"}
+    page = await list_accessible_children(req, curr_user, CATALOG, (workspaceId,), cursor, limit)
+    return {"message": f"List all catalog in workspace {workspaceId}", **page}
 
 @router.post("/workspace-service/v1/catalog/create-new")
 async def create_new_catalog(
@@ -53,9 +60,36 @@ async def create_new_catalog(
             ".*", f'.*', "deny"
         )
     
-    casbin_enforcer.save_policy()
+    mark_resource_kinds([(CATALOG, (workspaceId, catalogId))])
+    resource_registry.register(CATALOG, (workspaceId, catalogId))
+    policy_persister.request_save()
     
     return {f"Catalog {catalogId} created!"}
+
+
+@router.post("/workspace-service/v1/catalog/batch-create")
+async def batch_create_catalogs(
+    req: Request,
+    request_body: List[CreateCatalogRequest],
+    curr_user: User = Depends(get_current_active_user)
+):
+    """
+    Creates many catalogs in one request (see `create_resources`).
+
+    Returns:
+        dict: `results`, one `{"name", "status"}` per catalog in request order.
+    """
+    creations = []
+    for catalog in request_body:
+        obj = f"{catalog.workspaceId}.{catalog.name}{optional_trailing_dot}"
+        rules = [[AccessLevel.CATALOG_OWNER.value, curr_user.username, obj, ".*", ".*", "allow"]]
+        if catalog.isPrivate:
+            rules.append([AccessLevel.CATALOG_DENY_ALL.value, ".*", obj, ".*", ".*", "deny"])
+        creations.append((catalog, catalog.workspaceId, rules, (CATALOG, (catalog.workspaceId, catalog.name))))
+
+    results = await create_resources(req, curr_user, creations)
+    logger.info(f"{len(results)} catalogs requested in one batch")
+    return {"message": f"{len(results)} catalogs processed", "results": results}
     
 @router.get("/workspace-service/v1/catalog/detail")
 async def read_catalog(
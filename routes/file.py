@@ -45,9 +45,34 @@ async def upload_new_file(
             ".*", f'.*', "deny"
         )
     
-    casbin_enforcer.save_policy()
+    policy_persister.request_save()
     
     return {f"file {fileId} created!"}
+
+
+@router.post("/storage-service/v1/file/batch-upload")
+async def batch_upload_files(
+    req: Request,
+    request_body: List[UploadFileRequest],
+    curr_user: User = Depends(get_current_active_user)
+):
+    """
+    Creates many files in one request (see `create_resources`).
+
+    Returns:
+        dict: `results`, one `{"name", "status"}` per file in request order.
+    """
+    creations = []
+    for file in request_body:
+        obj = f"{file.organizationId}:{file.folder}/{file.name}{optional_trailing_forward_slash}"
+        rules = [[AccessLevel.FILE_OWNER.value, curr_user.username, obj, ".*", ".*", "allow"]]
+        if file.isPrivate:
+            rules.append([AccessLevel.FILE_DENY_ALL.value, ".*", obj, ".*", ".*", "deny"])
+        creations.append((file, f"{file.organizationId}:{file.folder}", rules, None))
+
+    results = await create_resources(req, curr_user, creations)
+    logger.info(f"{len(results)} files requested in one batch")
+    return {"message": f"{len(results)} files processed", "results": results}
     
 @router.post("/storage-service/v1/file/download")
 async def read_file(
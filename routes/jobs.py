@@ -3,6 +3,7 @@ from loguru import logger
 from utils import *
 from services.auth_service import *
 from constants import *
+from services.resource_registry import JOB
 
 router = APIRouter(tags=["Jobs"])
 
@@ -10,6 +11,8 @@ router = APIRouter(tags=["Jobs"])
 async def list_all_job(
     req: Request,
     workspaceId: str,
+    cursor: Optional[str] = None,
+    limit: int = 100,
     curr_user: User = Depends(get_current_active_user)
 ):
     """
@@ -18,16 +21,20 @@ async def list_all_job(
     This endpoint is used to check authorization. All users may access this API
     
     Args:
+    cursor (str, optional): The `nextCursor` returned by the previous page.
+    limit (int, optional): The maximum number of jobs in the page.
     curr_user (User, optional): The authenticated user making the request. 
         Defaults to Depends(get_current_active_user).
 
     Returns:
-        dict: A message confirming the retrieval of all jobs. (mock)
+        dict: The jobs of the workspace the user may access (`items`) and the cursor of
+        the next page (`nextCursor`).
     """
     await check_workspace_authorization(req, curr_user, workspaceId)
     
     logger.info(f"List all job in workspace {workspaceId}")
-    return {"message": f"List all job in workspace {workspaceId}"}
+    page = await list_accessible_children(req, curr_user, JOB, (workspaceId,), cursor, limit)
+    return {"message": f"List all job in workspace {workspaceId}", **page}
     
 @router.get("/workflow-service/v1/job/detail")
 async def read_job(
@@ -87,6 +94,8 @@ async def create_new_job(
             ".*", f'.*', "deny"
         )
     
-    casbin_enforcer.save_policy()
+    mark_resource_kinds([(JOB, (workspaceId, jobId))])
+    resource_registry.register(JOB, (workspaceId, jobId))
+    policy_persister.request_save()
     
     return {f"Job {jobId} created!"}
\ No newline at end of file
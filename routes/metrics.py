@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Response
+from services.metrics import REGISTRY
+
+
+router = APIRouter(tags=["Metrics"])
+
+# The content type of the Prometheus text exposition format.
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Serves the authorization metrics for Prometheus.
+
+    Returns:
+        Response: Every metric of `services.metrics.REGISTRY` in the text exposition format.
+    """
+    return Response(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from utils import *
+from services.auth_service import *
+from services.policy_transfer import MEDIA_TYPES
+
+
+router = APIRouter(tags=["Policy"])
+
+
+@router.get("/admin/v1/policy/export")
+async def export_policy_rules(
+    format: str = "csv",
+    curr_user: User = Depends(get_current_active_user)
+):
+    """
+    Streams every policy rule as CSV (`policy.csv` lines) or NDJSON, in chunks.
+    """
+    check_policy_admin(curr_user, format)
+    return StreamingResponse(
+        export_policy(format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="policy.{format}"'},
+    )
+
+
+@router.post("/admin/v1/policy/import")
+async def import_policy_rules(
+    req: Request,
+    format: str = "csv",
+    curr_user: User = Depends(get_current_active_user)
+):
+    """
+    Adds the rules of a CSV or NDJSON policy dump sent as the request body.
+    Existing rules are kept; invalid rows are skipped and reported.
+    """
+    check_policy_admin(curr_user, format)
+    report = await import_policy(req, format)
+    return {"message": f"Imported {report['added']} policy rules", "report": report}
@@ -3,6 +3,7 @@ from loguru import logger
 from utils import *
 from services.auth_service import *
 from constants import *
+from services.resource_registry import SCHEMA
 
 
 router = APIRouter(tags=["Schemas"])
@@ -12,11 +13,14 @@ async def list_schema_in_catalog(
     req: Request,
     workspaceId: str,
     catalogId: str,
+    cursor: Optional[str] = None,
+    limit: int = 100,
     curr_user: str = Depends(get_current_active_user)
 ):
     await check_catalog_authorization(req, curr_user, workspaceId, catalogId)
     logger.info(f"Catalog {catalogId} access granted! List schemas")
-    return {"message": f"Catalog {catalogId} access granted! List schemas"}
+    page = await list_accessible_children(req, curr_user, SCHEMA, (workspaceId, catalogId), cursor, limit)
+    return {"message": f"Catalog {catalogId} access granted! List schemas", **page}
 
 
 @router.post("/workspace-service/v1/schema/create-new")
@@ -44,10 +48,37 @@ async def create_new_schema(
             ".*", f'.*', "deny"
         )
     
-    casbin_enforcer.save_policy()
+    resource_registry.register(SCHEMA, (workspaceId, catalogId, schemaId))
+    policy_persister.request_save()
     
     return {"message": f"Schema {schemaId} created!"}
 
+
+@router.post("/workspace-service/v1/schema/batch-create")
+async def batch_create_schemas(
+    req: Request,
+    request_body: List[CreateSchemaRequest],
+    curr_user: User = Depends(get_current_active_user)
+):
+    """
+    Creates many schemas in one request (see `create_resources`).
+
+    Returns:
+        dict: `results`, one `{"name", "status"}` per schema in request order.
+    """
+    creations = []
+    for schema in request_body:
+        obj = f"{schema.workspaceId}.{schema.catalogId}.{schema.name}{optional_trailing_dot}"
+        rules = [[AccessLevel.SCHEMA_OWNER.value, curr_user.username, obj, ".*", ".*", "allow"]]
+        if schema.isPrivate:
+            rules.append([AccessLevel.SCHEMA_DENY_ALL.value, ".*", obj, ".*", ".*", "deny"])
+        parent = f"{schema.workspaceId}.{schema.catalogId}"
+        creations.append((schema, parent, rules, (SCHEMA, (schema.workspaceId, schema.catalogId, schema.name))))
+
+    results = await create_resources(req, curr_user, creations)
+    logger.info(f"{len(results)} schemas requested in one batch")
+    return {"message": f"{len(results)} schemas processed", "results": results}
+
 @router.get("/workspace-service/v1/schema/detail")
 async def read_schema(
     req: Request,
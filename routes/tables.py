@@ -3,6 +3,7 @@ from loguru import logger
 from utils import *
 from services.auth_service import *
 from constants import *
+from services.resource_registry import TABLE
 
 
 router = APIRouter(tags=["Tables"])
@@ -13,11 +14,14 @@ async def list_table_in_schema(
     workspaceId: str,
     catalogId: str,
     schemaId: str,
+    cursor: Optional[str] = None,
+    limit: int = 100,
     curr_user: str = Depends(get_current_active_user)
 ):
     await check_schema_authorization(req, curr_user, workspaceId, catalogId, schemaId)
     logger.info(f"Schema {schemaId} access granted! List tables")
-    return {"message": f"Schema {schemaId} access granted! List tables"}
+    page = await list_accessible_children(req, curr_user, TABLE, (workspaceId, catalogId, schemaId), cursor, limit)
+    return {"message": f"Schema {schemaId} access granted! List tables", **page}
 
 
 @router.post("/workspace-service/v1/table/create-new")
@@ -47,10 +51,37 @@ async def create_new_table(
             ".*", f'.*', "deny"
         )
     
-    casbin_enforcer.save_policy()
+    resource_registry.register(TABLE, (workspaceId, catalogId, schemaId, tableId))
+    policy_persister.request_save()
     
     return {"message": f"Table {tableId} created!"}
 
+
+@router.post("/workspace-service/v1/table/batch-create")
+async def batch_create_tables(
+    req: Request,
+    request_body: List[CreateTableRequest],
+    curr_user: User = Depends(get_current_active_user)
+):
+    """
+    Creates many tables in one request (see `create_resources`).
+
+    Returns:
+        dict: `results`, one `{"name", "status"}` per table in request order.
+    """
+    creations = []
+    for table in request_body:
+        path = (table.workspaceId, table.catalogId, table.schemaId, table.name)
+        obj = f"{'.'.join(path)}{optional_trailing_dot}"
+        rules = [[AccessLevel.TABLE_OWNER.value, curr_user.username, obj, ".*", ".*", "allow"]]
+        if table.isPrivate:
+            rules.append([AccessLevel.TABLE_DENY_ALL.value, ".*", obj, ".*", ".*", "deny"])
+        creations.append((table, ".".join(path[:3]), rules, (TABLE, path)))
+
+    results = await create_resources(req, curr_user, creations)
+    logger.info(f"{len(results)} tables requested in one batch")
+    return {"message": f"{len(results)} tables processed", "results": results}
+
 @router.get("/workspace-service/v1/table/detail")
 async def read_table(
     req: Request,
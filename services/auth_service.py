@@ -1,9 +1,19 @@
 # from pydantic import BaseModel
 
 from fastapi import Depends, FastAPI, HTTPException, status, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from starlette.responses import RedirectResponse
-from settings import MODEL_CONF_PATH, POLICY_CSV_PATH
+from settings import MODEL_CONF_PATH, POLICY_CSV_PATH, DECISION_CACHE_SIZE, DECISION_CACHE_TTL
+from settings import POLICY_FLUSH_INTERVAL, POLICY_FLUSH_BATCH_SIZE
+from settings import POLICY_STORAGE, POLICY_JOURNAL_COMPACT_THRESHOLD
+from settings import POLICY_SQLITE_PATH, POLICY_LOAD_OBJECT_PREFIXES
+from settings import ENFORCER_SHARDING, ENFORCER_MAX_SHARDS, ENFORCER_SHARD_IDLE_TIMEOUT
+from settings import ENFORCE_POOL_WORKERS, ENFORCE_POOL_MAX_QUEUE
+from settings import RESOURCE_LIST_MAX_LIMIT, RESOURCE_LIST_MAX_SCAN, BULK_CREATE_MAX_ITEMS
+from settings import POLICY_SYNC_PATH, POLICY_SYNC_INTERVAL, POLICY_SYNC_MAX_LOG_BYTES
+from settings import POLICY_COMPACT_INTERVAL
+from settings import POLICY_ADMIN_USERS, POLICY_IMPORT_BATCH_SIZE
 import casbin
 from utils import User, UsersDAO, DeleteJobRequest, CreateTaskRequest, CreateCatalogRequest
 from utils import *
@@ -12,42 +22,246 @@ import json
 from constants import AccessLevel
 from fastapi import Depends, FastAPI, HTTPException, status, Request, Response
 from fastapi import Request, HTTPException, status
+import asyncio
 import json
+import time
 from utils import extract_request_body
-import casbin_pymongo_adapter
+from services.enforcer import IndexedEnforcer, distinct_rules
+from services.enforcer_router import EnforcerRouter
+from services.decision_cache import DecisionCache, body_fingerprint
+from services.policy_persister import PolicyPersister
+from services.journal_adapter import JournalAdapter
+from services.sqlite_adapter import PolicyFilter, SqliteAdapter
+from services.enforcement_pool import EnforcementPool
+from services.resource_registry import CATALOG, JOB, KIND_PTYPE, ResourceRegistry, has_kind_markers, kind_marker
+from services.policy_watcher import FileDeltaLog, PolicyWatcher
+from services.policy_compactor import PolicyCompactor
+from services.policy_transfer import MEDIA_TYPES, PolicyImporter, export_chunks, iter_policy
+from services.metrics import REGISTRY, DECISIONS, ENFORCE_SECONDS, route_family
+from services.explain import current_trace
 
 users_dao = UsersDAO()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-casbin_enforcer = casbin.Enforcer(MODEL_CONF_PATH, POLICY_CSV_PATH, True)
+def create_policy_adapter():
+    """
+    Creates the policy storage selected by `POLICY_STORAGE`.
+
+    Returns:
+    - str | casbin.persist.Adapter: A file path for casbin's own file adapter, or an adapter instance.
+    """
+    if POLICY_STORAGE == "journal":
+        if POLICY_SYNC_PATH:
+            # Every worker would compact and delete segments the others still append to and replay.
+            raise ValueError('POLICY_STORAGE = "journal" cannot be combined with POLICY_SYNC_PATH')
+        return JournalAdapter(POLICY_CSV_PATH, POLICY_JOURNAL_COMPACT_THRESHOLD)
+    if POLICY_STORAGE == "sqlite":
+        default_filter = None
+        if POLICY_LOAD_OBJECT_PREFIXES:
+            default_filter = PolicyFilter(POLICY_LOAD_OBJECT_PREFIXES)
+        return SqliteAdapter(POLICY_SQLITE_PATH, POLICY_CSV_PATH, default_filter)
+    return POLICY_CSV_PATH
+
+
+def create_enforcer():
+    """
+    Creates the enforcer, or the per-tenant router when `ENFORCER_SHARDING` is set.
+
+    Returns:
+    - IndexedEnforcer | EnforcerRouter: The object every check and policy change goes through.
+    """
+    adapter = create_policy_adapter()
+    if not ENFORCER_SHARDING:
+        return IndexedEnforcer(MODEL_CONF_PATH, adapter, True)
+    if not isinstance(adapter, SqliteAdapter) or adapter.default_filter is not None:
+        raise ValueError('ENFORCER_SHARDING requires POLICY_STORAGE = "sqlite" without POLICY_LOAD_OBJECT_PREFIXES')
+    if POLICY_SYNC_PATH:
+        raise ValueError("ENFORCER_SHARDING cannot be combined with POLICY_SYNC_PATH")
+    # Kind markers only matter to the resource registry, so no shard loads them.
+    return EnforcerRouter(
+        MODEL_CONF_PATH, adapter, ENFORCER_MAX_SHARDS, ENFORCER_SHARD_IDLE_TIMEOUT, stored_ptypes=(KIND_PTYPE,)
+    )
+
+
+casbin_enforcer = create_enforcer()
+
+decision_cache = DecisionCache(DECISION_CACHE_SIZE, DECISION_CACHE_TTL)
+
+policy_persister = PolicyPersister(casbin_enforcer, POLICY_FLUSH_INTERVAL, POLICY_FLUSH_BATCH_SIZE)
+
+enforcement_pool = EnforcementPool(casbin_enforcer, ENFORCE_POOL_WORKERS, ENFORCE_POOL_MAX_QUEUE)
+
+resource_registry = ResourceRegistry()
+if isinstance(casbin_enforcer, EnforcerRouter):
+    if has_kind_markers(casbin_enforcer.get_model()):
+        resource_registry.set_kinds(casbin_enforcer.policy_rules(KIND_PTYPE))
+    resource_registry.register_objects(casbin_enforcer.policy_objects())
+else:
+    resource_registry.rebuild(casbin_enforcer)
+
+
+def sync_resource_registry(record):
+    """Registers the resources created by other workers (a `PolicyWatcher` listener)."""
+    if record["op"] == "snapshot":
+        resource_registry.rebuild(casbin_enforcer)
+    elif record["op"] == "+" and record["ptype"] == KIND_PTYPE:
+        resource_registry.set_kinds(record["rules"])
+    elif record["op"] == "+" and record["sec"] == "p":
+        obj_index = casbin_enforcer.get_model()["p"][record["ptype"]].tokens.index("p_obj")
+        resource_registry.register_objects(rule[obj_index] for rule in record["rules"])
+
+
+def mark_resource_kinds(registrations) -> bool:
+    """
+    Stores the kind of new jobs and catalogs next to their rules.
+
+    The registry tells jobs from catalogs by these markers when it is rebuilt
+    (see `services.resource_registry`); a model without the `KIND_PTYPE` role
+    keeps them in the registry only.
+
+    Args:
+        registrations (Iterable): `(kind, path)` of new resources, e.g.
+            `(JOB, ("default", "job_1"))`; other kinds are ignored.
+
+    Returns:
+        bool: Whether markers were added to the policy.
+    """
+    markers = [kind_marker(kind, path) for kind, path in registrations if kind in (JOB, CATALOG)]
+    resource_registry.set_kinds(markers)
+    if not has_kind_markers(casbin_enforcer.get_model()):
+        return False
+    markers = [
+        marker for marker in distinct_rules(markers)
+        if not casbin_enforcer.has_named_grouping_policy(KIND_PTYPE, *marker)
+    ]
+    if not markers:
+        return False
+    return casbin_enforcer.add_named_grouping_policies(KIND_PTYPE, markers)
+
+
+policy_watcher = None
+if POLICY_SYNC_PATH:
+    policy_watcher = PolicyWatcher(
+        casbin_enforcer, FileDeltaLog(POLICY_SYNC_PATH, POLICY_SYNC_MAX_LOG_BYTES), POLICY_SYNC_INTERVAL
+    )
+    policy_watcher.listeners.append(sync_resource_registry)
+
+policy_compactor = None
+if POLICY_COMPACT_INTERVAL:
+    if POLICY_STORAGE != "csv" or POLICY_SYNC_PATH:
+        raise ValueError('POLICY_COMPACT_INTERVAL requires POLICY_STORAGE = "csv" without POLICY_SYNC_PATH')
+    policy_compactor = PolicyCompactor(casbin_enforcer, policy_persister, POLICY_COMPACT_INTERVAL)
+
+
+def collect_service_metrics():
+    """
+    Reports the counters of the authorization services (a `REGISTRY` collector).
+
+    Runs at scrape time only, so the services keep their own counters and the
+    hot paths pay nothing for these samples.
+    """
+    cache = decision_cache.stats()
+    yield "authz_decision_cache_lookups_total", "counter", "Decision cache lookups by result.", [
+        ({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"]),
+    ]
+    yield "authz_decision_cache_hit_ratio", "gauge", "Share of decision cache lookups that hit.", [
+        ({}, cache["hit_ratio"]),
+    ]
+    yield "authz_decision_cache_entries", "gauge", "Cached decisions.", [({}, cache["size"])]
+
+    pool = enforcement_pool.stats()
+    yield "authz_enforcement_pool_queued", "gauge", "Checks waiting for a pool worker.", [({}, pool["queued"])]
+    yield "authz_enforcement_pool_in_flight", "gauge", "Checks being evaluated.", [({}, pool["in_flight"])]
+    yield "authz_enforcement_pool_completed_total", "counter", "Checks evaluated on the pool.", [
+        ({}, pool["completed"]),
+    ]
+    yield "authz_enforcement_pool_wait_seconds", "gauge", "Average and maximum queue wait.", [
+        ({"stat": "avg"}, pool["avg_wait"]), ({"stat": "max"}, pool["max_wait"]),
+    ]
+
+    bands = casbin_enforcer.priority_bands()
+    if bands is not None:
+        yield "authz_policy_rules", "gauge", "Policy rules by priority band (band to band + 9).", [
+            ({"band": str(band)}, count) for band, count in sorted(bands.items())
+        ]
+
+    if isinstance(casbin_enforcer, EnforcerRouter):
+        router = casbin_enforcer.stats()
+        yield "authz_router_shards", "gauge", "Loaded tenant shards.", [({}, router["shards"])]
+        yield "authz_router_shard_loads_total", "counter", "Tenant shards loaded.", [({}, router["loads"])]
+        yield "authz_router_shard_evictions_total", "counter", "Tenant shards evicted.", [
+            ({}, router["evictions"]),
+        ]
+        yield "authz_router_global_rules", "gauge", "Rules of the global shard.", [({}, router["global_rules"])]
+    else:
+        resolver = casbin_enforcer.subject_resolver
+        if resolver is not None:
+            stats = resolver.stats()
+            yield "authz_subject_resolver_lookups_total", "counter", "Subject resolutions by result.", [
+                ({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"]),
+            ]
+            yield "authz_subject_resolver_policy_subjects", "gauge", "Distinct subjects in the policy.", [
+                ({}, stats["policy_subjects"]),
+            ]
+        buckets = casbin_enforcer.bucket_stats(1)
+        if buckets is not None:
+            largest = buckets["largest"][0][1] if buckets["largest"] else 0
+            yield "authz_subject_buckets", "gauge", "Subject buckets of the policy index.", [
+                ({}, buckets["buckets"]),
+            ]
+            yield "authz_subject_bucket_rules", "gauge", "Rules in the shared and the largest subject bucket.", [
+                ({"bucket": "shared"}, buckets["shared"]), ({"bucket": "largest"}, largest),
+            ]
+
+    if policy_watcher is not None:
+        watcher = policy_watcher.stats()
+        yield "authz_policy_watcher_version", "gauge", "Last policy log version applied.", [
+            ({}, watcher["version"]),
+        ]
+        yield "authz_policy_watcher_resyncs_total", "counter", "Full policy reloads by the watcher.", [
+            ({}, watcher["resyncs"]),
+        ]
+
+    if policy_compactor is not None:
+        compactor = policy_compactor.stats()
+        yield "authz_policy_compacted_rules_total", "counter", "Redundant policy rules removed.", [
+            ({}, compactor["removed"]),
+        ]
+
+    yield "authz_policy_flushes_total", "counter", "Completed policy flushes.", [
+        ({}, policy_persister.flush_count),
+    ]
+
+
+REGISTRY.register_collector(collect_service_metrics)
 
 async def check_organization_authorization(req: Request, curr_user, organizationId: str):
     sub = curr_user.username  # The user ID
     obj = organizationId  # The workspace being accessed
     act = req.method  # The action (GET, POST, etc.)
     
-    req_body = await extract_request_body(req)  # Extract request body as JSON string
+    req_body = await authorization_body(req, sub, obj)  # Extract request body only if a rule inspects it
     
-    casbin_authorize(sub, obj, act, req_body)
+    await casbin_authorize_async(sub, obj, act, req_body, route_family(req.scope["path"]))
     
 async def check_bucket_authorization(req: Request, curr_user, organizationId: str, bucketId: str):
     sub = curr_user.username  # The user ID
     obj = f"{organizationId}:{bucketId}"  # The workspace being accessed
     act = req.method  # The action (GET, POST, etc.)
     
-    req_body = await extract_request_body(req)  # Extract request body as JSON string
+    req_body = await authorization_body(req, sub, obj)  # Extract request body only if a rule inspects it
     
-    casbin_authorize(sub, obj, act, req_body)
+    await casbin_authorize_async(sub, obj, act, req_body, route_family(req.scope["path"]))
     
 async def check_folder_authorization(req: Request, curr_user, organizationId: str, folder: str):
     sub = curr_user.username  # The user ID
     obj = f"{organizationId}:{folder}"  # The workspace being accessed
     act = req.method  # The action (GET, POST, etc.)
     
-    req_body = await extract_request_body(req)  # Extract request body as JSON string
+    req_body = await authorization_body(req, sub, obj)  # Extract request body only if a rule inspects it
     
-    casbin_authorize(sub, obj, act, req_body)
+    await casbin_authorize_async(sub, obj, act, req_body, route_family(req.scope["path"]))
 
 async def check_workspace_authorization(req: Request, curr_user, workspaceId: str):
     """
@@ -68,9 +282,9 @@ async def check_workspace_authorization(req: Request, curr_user, workspaceId: st
     obj = workspaceId  # The workspace being accessed
     act = req.method  # The action (GET, POST, etc.)
     
-    req_body = await extract_request_body(req)  # Extract request body as JSON string
+    req_body = await authorization_body(req, sub, obj)  # Extract request body only if a rule inspects it
     
-    casbin_authorize(sub, obj, act, req_body)
+    await casbin_authorize_async(sub, obj, act, req_body, route_family(req.scope["path"]))
 
 async def check_job_authorization(req: Request, curr_user, workspaceId: str, jobId: str):
     """
@@ -92,27 +306,27 @@ async def check_job_authorization(req: Request, curr_user, workspaceId: str, job
     obj = f"{workspaceId}.{jobId}"  # The workspace being accessed
     act = req.method  # The action (GET, POST, etc.)
     
-    req_body = await extract_request_body(req)  # Extract request body as JSON string
+    req_body = await authorization_body(req, sub, obj)  # Extract request body only if a rule inspects it
     
-    casbin_authorize(sub, obj, act, req_body)
+    await casbin_authorize_async(sub, obj, act, req_body, route_family(req.scope["path"]))
     
 async def check_catalog_authorization(req: Request, curr_user, workspaceId: str, catalogId: str):
     sub = curr_user.username  # The user ID
     obj = f"{workspaceId}.{catalogId}"  # The workspace being accessed
     act = req.method  # The action (GET, POST, etc.)
     
-    req_body = await extract_request_body(req)  # Extract request body as JSON string
+    req_body = await authorization_body(req, sub, obj)  # Extract request body only if a rule inspects it
     
-    casbin_authorize(sub, obj, act, req_body)
+    await casbin_authorize_async(sub, obj, act, req_body, route_family(req.scope["path"]))
     
 async def check_schema_authorization(req: Request, curr_user, workspaceId: str, catalogId: str, schemaId: str):
     sub = curr_user.username  # The user ID
     obj = f"{workspaceId}.{catalogId}.{schemaId}"  # The workspace being accessed
     act = req.method  # The action (GET, POST, etc.)
     
-    req_body = await extract_request_body(req)  # Extract request body as JSON string
+    req_body = await authorization_body(req, sub, obj)  # Extract request body only if a rule inspects it
     
-    casbin_authorize(sub, obj, act, req_body)
+    await casbin_authorize_async(sub, obj, act, req_body, route_family(req.scope["path"]))
     
 async def check_table_authorization(req: Request, curr_user, workspaceId: str, 
                                     catalogId: str, schemaId: str, tableId: str):
@@ -120,20 +334,351 @@ async def check_table_authorization(req: Request, curr_user, workspaceId: str,
     obj = f"{workspaceId}.{catalogId}.{schemaId}.{tableId}"  # The workspace being accessed
     act = req.method  # The action (GET, POST, etc.)
     
-    req_body = await extract_request_body(req)  # Extract request body as JSON string
+    req_body = await authorization_body(req, sub, obj)  # Extract request body only if a rule inspects it
     
-    casbin_authorize(sub, obj, act, req_body)
+    await casbin_authorize_async(sub, obj, act, req_body, route_family(req.scope["path"]))
 
 
-def casbin_authorize(sub: str, obj: str, act: str, req_body: str):
+def casbin_authorize(sub: str, obj: str, act: str, req_body: str, family: str = "other"):
     """Casbin Authorization Middleware"""
-    eft = casbin_enforcer.enforce(sub, obj, act, req_body)
+    started = time.perf_counter()
+    key = (sub, obj, act, body_fingerprint(req_body))
+    generation = casbin_enforcer.policy_generation
+    eft = decision_cache.get(key, generation)
+    if eft is None:
+        eft = casbin_enforcer.enforce(sub, obj, act, req_body)
+        decision_cache.put(key, eft, generation)
+    record_decision(family, eft, started)
+    if not eft:
+        raise_unauthorized()
+
+
+async def casbin_authorize_async(sub: str, obj: str, act: str, req_body: str, family: str = "other"):
+    """
+    Casbin authorization for coroutines.
+
+    Cached decisions are answered inline; everything else is evaluated on the
+    enforcement pool so the event loop keeps serving other requests.
+
+    Args:
+        family (str): The route family the check is recorded under in the
+            metrics, see `services.metrics.route_family`.
+
+    Raises:
+        HTTPException: If the user is not authorized.
+    """
+    started = time.perf_counter()
+    trace = current_trace.get()
+    if trace is not None:
+        await explain_authorize(trace, sub, obj, act, req_body, family, started)
+        return
+    key = (sub, obj, act, body_fingerprint(req_body))
+    generation = casbin_enforcer.policy_generation
+    eft = decision_cache.get(key, generation)
+    if eft is None:
+        eft = await enforcement_pool.enforce(sub, obj, act, req_body)
+        decision_cache.put(key, eft, generation)
+    record_decision(family, eft, started)
+    if not eft:
+        raise_unauthorized()
+
+
+async def explain_authorize(trace, sub: str, obj: str, act: str, req_body: str, family: str, started: float):
+    """
+    `casbin_authorize_async` for a traced request (see `services.explain`).
+
+    The decision is always evaluated with `explain`, even when it is cached,
+    so the trace names the deciding rule; the cache is only consulted to
+    report whether it held the decision.
+    """
+    key = (sub, obj, act, body_fingerprint(req_body))
+    generation = casbin_enforcer.policy_generation
+    cached = decision_cache.get(key, generation)
+    check = await enforcement_pool.explain(sub, obj, act, req_body)
+    eft = check["allowed"]
+    decision_cache.put(key, eft, generation)
+    record_decision(family, eft, started)
+
+    check.update(request=[sub, obj, act], cached=cached is not None)
+    check["timings"]["total"] = time.perf_counter() - started
+    trace.add_check(check)
     if not eft:
+        raise_unauthorized()
+
+
+def record_decision(family: str, eft: bool, started: float):
+    """Records the latency and outcome of one authorization check."""
+    ENFORCE_SECONDS.observe(time.perf_counter() - started, (family,))
+    DECISIONS.inc(1, (family, "allow" if eft else "deny"))
+
+
+async def authorization_body(req: Request, sub: str, obj: str) -> str:
+    """
+    Returns the serialized request body for an authorization check.
+
+    The body is only read when a candidate rule of `sub` for `obj` constrains
+    `req_body`; otherwise an empty string is returned without touching it.
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        started = time.perf_counter()
+        try:
+            if not casbin_enforcer.needs_request_body(obj, sub):
+                return ""
+            return await extract_request_body(req)
+        finally:
+            trace.record_body(time.perf_counter() - started)
+
+    if not casbin_enforcer.needs_request_body(obj, sub):
+        return ""
+    return await extract_request_body(req)
+
+
+def batch_enforce(sub: str, requests: list, family: str = "other") -> list:
+    """
+    Decides many requests of one subject in a single pass.
+
+    Cached decisions and duplicate requests are answered without the enforcer.
+    The remaining requests are evaluated together by
+    `IndexedEnforcer.batch_enforce`, which shares the compiled matcher,
+    role-link lookups and candidate rules across the batch.
+
+    Args:
+        sub (str): The subject, usually the current user's username.
+        requests (list): `(obj, act, req_body)` tuples.
+        family (str): The route family the decisions are counted under.
+
+    Returns:
+        list: One bool per request, in order.
+    """
+    keys, decisions, pending, generation = lookup_batch(sub, requests)
+    if pending:
+        results = casbin_enforcer.batch_enforce([(sub,) + request for request in pending.values()])
+        store_batch(decisions, pending, results, generation)
+    return count_batch(family, [decisions[key] for key in keys])
+
+
+async def batch_enforce_async(sub: str, requests: list, family: str = "other") -> list:
+    """Same as `batch_enforce`, but evaluates cache misses on the enforcement pool."""
+    keys, decisions, pending, generation = lookup_batch(sub, requests)
+    if pending:
+        results = await enforcement_pool.batch_enforce([(sub,) + request for request in pending.values()])
+        store_batch(decisions, pending, results, generation)
+    return count_batch(family, [decisions[key] for key in keys])
+
+
+def count_batch(family: str, results: list) -> list:
+    """Counts the outcomes of a batch in the decision metrics and returns it."""
+    allowed = sum(results)
+    if allowed:
+        DECISIONS.inc(allowed, (family, "allow"))
+    if allowed < len(results):
+        DECISIONS.inc(len(results) - allowed, (family, "deny"))
+    return results
+
+
+def lookup_batch(sub: str, requests: list):
+    """
+    Resolves a batch against the decision cache.
+
+    Returns:
+        tuple: The cache key of every request, the decisions found so far, the
+            distinct requests still to evaluate (by key) and the generation.
+    """
+    generation = casbin_enforcer.policy_generation
+    keys, decisions, pending = [], {}, {}
+    for obj, act, req_body in requests:
+        key = (sub, obj, act, body_fingerprint(req_body))
+        keys.append(key)
+        if key in decisions or key in pending:
+            continue
+        eft = decision_cache.get(key, generation)
+        if eft is None:
+            pending[key] = (obj, act, req_body)
+        else:
+            decisions[key] = eft
+    return keys, decisions, pending, generation
+
+
+def store_batch(decisions: dict, pending: dict, results: list, generation):
+    """Records freshly evaluated batch decisions in `decisions` and the cache."""
+    for key, eft in zip(pending, results):
+        decisions[key] = eft
+        decision_cache.put(key, eft, generation)
+
+
+async def list_accessible_children(req: Request, curr_user, kind: str, parent: tuple,
+                                   cursor: str = None, limit: int = 100):
+    """
+    Lists one page of registered children that the user may access.
+
+    Children are read from `resource_registry` after `cursor` and authorized in
+    batches with the request's method. The request body is only read once a
+    rule of some child inspects it (see `needs_request_body`). A page stops after `limit` accessible
+    children or after `RESOURCE_LIST_MAX_SCAN` evaluated ones, whichever
+    comes first.
+
+    Args:
+        req (Request): The FastAPI request object.
+        curr_user (User): The authenticated user.
+        kind (str): The kind of children, e.g. `CATALOG` from `services.resource_registry`.
+        parent (tuple): The parent path, e.g. `(workspaceId,)`.
+        cursor (str): The `nextCursor` of the previous page.
+        limit (int): The page size.
+
+    Returns:
+        dict: `items` (child names) and `nextCursor` (None on the last page).
+    """
+    limit = max(1, min(limit, RESOURCE_LIST_MAX_LIMIT))
+    prefix = ".".join(parent) + "."
+    family = route_family(req.scope["path"])
+    sub = curr_user.username
+    req_body = None
+
+    items, scanned = [], 0
+    while len(items) < limit and scanned < RESOURCE_LIST_MAX_SCAN:
+        names = resource_registry.children(kind, parent, cursor, limit)
+        if not names:
+            cursor = None
+            break
+        objects = [prefix + name for name in names]
+        if req_body is None and any(casbin_enforcer.needs_request_body(obj, sub) for obj in objects):
+            req_body = await extract_request_body(req)
+        body = "" if req_body is None else req_body
+        decisions = await batch_enforce_async(sub, [(obj, req.method, body) for obj in objects], family)
+        for name, allowed in zip(names, decisions):
+            scanned += 1
+            cursor = name
+            if allowed:
+                items.append(name)
+                if len(items) == limit:
+                    break
+
+    if cursor is not None and not resource_registry.children(kind, parent, cursor, 1):
+        cursor = None
+    return {"items": items, "nextCursor": cursor}
+
+async def create_resources(req: Request, curr_user, creations: list) -> list:
+    """
+    Creates many resources with one authorization pass and one policy write.
+
+    Every distinct parent is authorized once with the request's method (per
+    item only when a rule of the parent inspects the request body, which is
+    then the item's JSON). The rules of all authorized items are added with
+    one `add_policies` call, skipping rules that already exist, jobs and
+    catalogs get their kind markers (see `mark_resource_kinds`) and the
+    policy is saved once.
+
+    Args:
+        req (Request): The FastAPI request object.
+        curr_user (User): The authenticated user, owner of the new resources.
+        creations (list): `(item, parent, rules, registration)` per resource:
+            the `Create*Request`, the parent object to authorize (e.g. the
+            workspace of a catalog), the owner (and deny-all) rules to add and
+            the `(kind, path)` to register in `resource_registry`, or None.
+
+    Returns:
+        list: `{"name": ..., "status": "created" | "unauthorized"}` per item, in order.
+
+    Raises:
+        HTTPException: If more than `BULK_CREATE_MAX_ITEMS` resources are sent.
+    """
+    if len(creations) > BULK_CREATE_MAX_ITEMS:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Method not authorized for this user",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may create at most {BULK_CREATE_MAX_ITEMS} resources",
+        )
+
+    sub = curr_user.username
+    body_parents = {}
+    checks = []
+    for item, parent, _, _ in creations:
+        if parent not in body_parents:
+            body_parents[parent] = casbin_enforcer.needs_request_body(parent, sub)
+        checks.append((parent, req.method, item.model_dump_json() if body_parents[parent] else ""))
+    decisions = await batch_enforce_async(sub, checks, route_family(req.scope["path"]))
+
+    rules = []
+    for (_, _, item_rules, _), allowed in zip(creations, decisions):
+        if allowed:
+            rules.extend(item_rules)
+    # casbin adds a batch only if none of its rules exists yet.
+    rules = [rule for rule in distinct_rules(rules) if not casbin_enforcer.has_policy(*rule)]
+    if rules:
+        casbin_enforcer.add_policies(rules)
+
+    marked = mark_resource_kinds(
+        registration for (_, _, _, registration), allowed in zip(creations, decisions)
+        if allowed and registration is not None
+    )
+
+    results = []
+    for (item, _, _, registration), allowed in zip(creations, decisions):
+        if allowed and registration is not None:
+            resource_registry.register(*registration)
+        results.append({"name": item.name, "status": "created" if allowed else "unauthorized"})
+    if rules or marked:
+        policy_persister.request_save()
+    return results
+
+def check_policy_admin(curr_user, fmt: str):
+    """
+    Verifies that a user may export and import the whole policy, in a known format.
+
+    Raises:
+        HTTPException: 403 if the user is not one of `POLICY_ADMIN_USERS`,
+            400 if the format is neither "csv" nor "ndjson".
+    """
+    if curr_user.username not in POLICY_ADMIN_USERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+    if fmt not in MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown policy format {fmt!r}, expected one of {', '.join(MEDIA_TYPES)}",
         )
 
+def export_policy(fmt: str):
+    """
+    Streams the whole policy.
+
+    Returns:
+        Iterator[str]: Chunks of policy lines in the format (see
+            `services.policy_transfer`), produced as the response is sent.
+    """
+    return export_chunks(iter_policy(casbin_enforcer), fmt)
+
+async def import_policy(req: Request, fmt: str) -> dict:
+    """
+    Adds the rules of an uploaded policy dump, reading the body as it arrives.
+
+    Chunks are parsed and validated in a worker thread; each batch of
+    `POLICY_IMPORT_BATCH_SIZE` rules is added on the event loop, where every
+    policy change happens, and the loop is yielded between batches. Rules
+    that already exist and invalid rows are skipped. The resources of new
+    rules are registered and the policy is saved once.
+
+    Returns:
+        dict: The import report (see `ImportReport.summary`).
+    """
+    importer = PolicyImporter(casbin_enforcer, fmt, POLICY_IMPORT_BATCH_SIZE)
+    importer.listeners.append(sync_resource_registry)
+    async for chunk in req.stream():
+        for batch in await run_in_threadpool(importer.parse, chunk):
+            importer.apply(batch)
+            await asyncio.sleep(0)
+    report = importer.finish()
+    if report.added:
+        policy_persister.request_save()
+    logger.info(f"Imported {report.added} policy rules ({report.existing} existing, {report.invalid} invalid)")
+    return report.summary()
+
+def raise_unauthorized():
+    """Raises the 401 returned for every denied authorization check."""
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Method not authorized for this user",
+    )
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """
     Authentication Module for FastAPI with OAuth2
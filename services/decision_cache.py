@@ -0,0 +1,134 @@
+"""
+decision_cache.py
+=================
+In-Process Cache for Authorization Decisions
+
+Detail and list-filter endpoints keep asking the enforcer the same
+(sub, obj, act, req_body) question while the policy rarely changes. This
+module caches those decisions in a bounded LRU. Every entry belongs to a
+policy generation: as soon as the enforcer reports a new generation (any
+add, remove, save or reload) the cache is emptied, so a new DENY_ALL rule
+takes effect on the very next request.
+
+Classes:
+--------
+- DecisionCache: Bounded LRU of decisions with an optional TTL.
+
+Functions:
+----------
+- body_fingerprint: Short, fixed-size key for a serialized request body.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+def body_fingerprint(req_body: str) -> str:
+    """
+    Reduces a request body to a fixed-size cache key component.
+
+    Args:
+        req_body (str): The serialized request body.
+
+    Returns:
+        str: An empty string for an empty body, otherwise a BLAKE2b digest.
+    """
+    if not req_body:
+        return ""
+    return hashlib.blake2b(req_body.encode(), digest_size=16).hexdigest()
+
+
+class DecisionCache:
+    """
+    LRU cache of authorization decisions tied to a policy generation.
+
+    Attributes:
+    - maxsize (int): Maximum number of cached decisions (0 disables caching).
+    - ttl (Optional[float]): Lifetime of an entry in seconds, None for no expiry.
+    - hits (int): Number of lookups answered from the cache.
+    - misses (int): Number of lookups that had to run the enforcer.
+    - evictions (int): Number of entries dropped to respect `maxsize`.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, generation):
+        """
+        Looks up a cached decision.
+
+        Args:
+            key (tuple): The `(sub, obj, act, body fingerprint)` tuple.
+            generation (int): The enforcer's current policy generation.
+
+        Returns:
+            Optional[bool]: The cached decision, or None on a miss.
+        """
+        with self._lock:
+            if generation != self.generation:
+                self._entries.clear()
+                self.generation = generation
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                decision, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return decision
+                del self._entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, decision: bool, generation):
+        """
+        Stores a decision computed under the given policy generation.
+
+        Decisions computed under an older generation are silently dropped.
+        """
+        if self.maxsize <= 0:
+            return
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (decision, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drops every cached decision."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: Size, capacity, hits, misses, evictions and hit ratio.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,158 @@
+"""
+enforcement_pool.py
+===================
+Off-Loop Policy Enforcement
+
+The `check_*_authorization` coroutines run inside the event loop, so a slow,
+regex-heavy `enforce` call used to stall every other request on the worker.
+`EnforcementPool` runs the evaluation in a bounded thread pool instead and
+lets the coroutine await the result. A semaphore caps how many checks can be
+queued at once, and the pool records queue depth and wait time so it is
+visible when the pool is saturated.
+
+Threads (not processes) are used on purpose: the enforcer, its index and its
+role links live in this process and change with every `create-new`, and
+the `IndexedEnforcer` policy lock keeps those reads consistent.
+
+Classes:
+--------
+- EnforcementPool: Awaitable enforcement on a bounded thread pool.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _Submission:
+    """Book-keeping for one queued enforcement."""
+
+    __slots__ = ("submitted_at", "started", "abandoned")
+
+    def __init__(self):
+        self.submitted_at = time.perf_counter()
+        self.started = False
+        self.abandoned = False
+
+
+class EnforcementPool:
+    """
+    Runs `enforcer.enforce` on a bounded thread pool.
+
+    Attributes:
+    - enforcer (casbin.Enforcer): The enforcer used for evaluation.
+    - max_workers (int): Worker threads; 0 evaluates inline on the event loop.
+    - max_queue (int): Maximum number of checks submitted to the pool at once.
+    - queued (int): Checks waiting to start (the current queue depth).
+    - in_flight (int): Checks currently being evaluated.
+    - max_queued (int): Highest queue depth seen.
+    - completed (int): Checks that ran on the pool.
+    - total_wait (float): Sum of queue wait times in seconds.
+    - max_wait (float): Longest queue wait in seconds.
+    """
+
+    def __init__(self, enforcer, max_workers: int = 4, max_queue: int = 256):
+        self.enforcer = enforcer
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queued = 0
+        self.in_flight = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._executor = None
+        if max_workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="enforce")
+        self._slots = asyncio.Semaphore(max_queue)
+        self._lock = threading.Lock()
+
+    async def enforce(self, *rvals) -> bool:
+        """
+        Evaluates a request without blocking the event loop.
+
+        Args:
+            *rvals: The request values, e.g. `(sub, obj, act, req_body)`.
+
+        Returns:
+            bool: The enforcer's decision.
+        """
+        return await self._submit(self.enforcer.enforce, rvals)
+
+    async def explain(self, *rvals) -> dict:
+        """Evaluates a request with `enforcer.explain` without blocking the event loop."""
+        return await self._submit(self.enforcer.explain, rvals)
+
+    async def batch_enforce(self, rvals) -> list:
+        """
+        Evaluates a batch of requests as a single job on the pool.
+
+        Args:
+            rvals (list): Request tuples, e.g. `(sub, obj, act, req_body)`.
+
+        Returns:
+            list: One decision per request, in order.
+        """
+        return await self._submit(self.enforcer.batch_enforce, (rvals,))
+
+    async def _submit(self, function, args):
+        if self._executor is None:
+            return function(*args)
+
+        submission = _Submission()
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, self._run, submission, function, args)
+        finally:
+            with self._lock:
+                if not submission.started:
+                    submission.abandoned = True
+                    self.queued -= 1
+
+    def _run(self, submission, function, args):
+        with self._lock:
+            if submission.abandoned:
+                return None
+            submission.started = True
+            wait = time.perf_counter() - submission.submitted_at
+            self.queued -= 1
+            self.in_flight += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+        try:
+            return function(*args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+
+    def stats(self):
+        """
+        Returns the pool counters.
+
+        Returns:
+            dict: Worker count, queue depth, in-flight checks and wait times.
+        """
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "in_flight": self.in_flight,
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "avg_wait": self.total_wait / self.completed if self.completed else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+    def shutdown(self):
+        """Stops the worker threads after the queued checks finish."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,914 @@
+"""
+enforcer.py
+===========
+Indexed Casbin Enforcer
+
+`IndexedEnforcer` is a drop-in `casbin.Enforcer` that keeps a `PolicyIndex`
+of the `p` rules in sync with the model. `enforce` only evaluates the rules on
+the ancestor chain of the requested object (plus the regex fallback rules)
+instead of every rule in the policy. Candidates are checked with the model's
+own matcher and effector, in the same order casbin would visit them, so the
+decisions are identical to `casbin.Enforcer`.
+
+With the `priority(p.eft) || deny` effect the first matching rule decides.
+Candidates arrive in priority order and evaluation stops at that rule, so a
+typical check only looks at a few rules; how many is recorded in the
+`authz_rules_evaluated` histogram of `services.metrics`.
+
+The enforcer also counts the rules whose `req_body` pattern is not a
+match-all (`.*` or empty). `needs_request_body` uses that count and the index
+to tell callers whether the body of a request can change the decision, so
+they only read and serialize it when it can.
+
+A `SubjectResolver` answers the `g(r.sub, p.sub) || regexMatch(r.sub, p.sub)`
+clause once per subject. Rules whose subject the requester does not match
+are skipped, and the remaining rules only evaluate the rest of the matcher.
+With a resolver the index is a `SubjectPartitionedIndex`: a check only walks
+the buckets of the subjects the requester matches plus the shared bucket of
+subject patterns, so one user's rules never slow down another user's checks.
+
+`policy_generation` is incremented by every change that can alter a decision
+(adds, removes, saves, reloads, role links), so callers can tell when cached
+decisions are stale.
+
+The matcher is compiled once per model into a Python function instead of
+being interpreted by `simpleeval` for every candidate rule; see
+`services.matcher_compiler`.
+
+Rule values are interned, and the index keys rules by one integer per rule,
+so a large policy takes a fraction of casbin's memory; see
+`services.policy_memory`.
+
+Evaluation may run on worker threads while the event loop changes the policy.
+`policy_lock` serializes every check against every policy change so a check
+never sees a half-updated index.
+
+Classes:
+--------
+- PriorityModel: casbin Model that inserts `p` rules in priority order.
+- IndexedEnforcer: casbin.Enforcer with an object-prefix index.
+"""
+
+import bisect
+import contextlib
+import functools
+import logging
+import threading
+import time
+from collections import Counter
+
+import casbin
+from casbin.core_enforcer import EnforceContext
+from casbin.effect import Effector, effect_to_bool
+from casbin.model import Model
+from casbin.util import generate_g_function, generate_conditional_g_function, has_eval
+
+from casbin.rbac.default_role_manager import RoleManager
+
+from services.matcher_compiler import compile_matcher, interpreted_matcher
+from services.metrics import RULES_EVALUATED
+from services.policy_index import PolicyIndex, SubjectPartitionedIndex
+from services.policy_memory import PatternCache, intern_rule, order_key
+from services.subject_resolver import SubjectResolver
+
+# `req_body` patterns that match every body, so the body never has to be read.
+MATCH_ALL_BODY_PATTERNS = frozenset(("", ".*"))
+
+# The subject clause answered by the `SubjectResolver`, as casbin normalizes it.
+SUBJECT_CLAUSE = "(g(r_sub, p_sub) || regexMatch(r_sub, p_sub))"
+
+
+def _residual_matcher(matcher: str):
+    """
+    Returns the matcher without a leading `SUBJECT_CLAUSE`.
+
+    Only a clause that is a top-level conjunct can be checked separately, so
+    None is returned unless the matcher is `SUBJECT_CLAUSE && <rest>` and
+    `<rest>` has no top-level `||`.
+    """
+    prefix = SUBJECT_CLAUSE + " && "
+    if not matcher.startswith(prefix):
+        return None
+    rest = matcher[len(prefix) :]
+    depth = 0
+    for position, char in enumerate(rest):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0 and rest.startswith("||", position):
+            return None
+    return rest
+
+
+class PriorityModel(Model):
+    """
+    casbin Model that keeps `p` rules sorted by priority on insertion.
+
+    casbin moves a new rule into place with one swap per rule it passes. This
+    model finds the position with a binary search instead and inserts once;
+    a batch of rules is merged into the policy in one pass. Ties keep
+    insertion order, exactly like casbin.
+
+    casbin checks every added rule with `has_policy`, a scan of the whole
+    policy. While the `IndexedEnforcer` keeps `rule_index` in sync with the
+    `p` rules, the rule is looked up in the index instead.
+    """
+
+    # The index of the `p` rules, None while it is not in sync with them.
+    rule_index = None
+
+    def has_policy(self, sec, ptype, rule):
+        """determines whether a model has the specified policy rule."""
+        if sec == "p" and ptype == "p" and self.rule_index is not None and len(rule) == len(self[sec][ptype].tokens):
+            return self.rule_index.contains(rule)
+        return super().has_policy(sec, ptype, rule)
+
+    def clear_policy(self):
+        self.rule_index = None
+        super().clear_policy()
+
+    def add_policy(self, sec, ptype, rule):
+        """adds a policy rule to the model."""
+        assertion = self[sec][ptype]
+        if sec != "p" or assertion.priority_index < 0:
+            return super().add_policy(sec, ptype, rule)
+
+        priority_index = assertion.priority_index
+        if not rule[priority_index].isdigit():
+            return super().add_policy(sec, ptype, rule)
+        if self.has_policy(sec, ptype, rule):
+            return False
+
+        try:
+            position = bisect.bisect_right(
+                assertion.policy,
+                int(rule[priority_index]),
+                key=lambda existing: int(existing[priority_index]),
+            )
+        except ValueError:
+            # Non-numeric priorities are already in the policy.
+            return super().add_policy(sec, ptype, rule)
+
+        assertion.policy.insert(position, rule)
+        return True
+
+    def add_policies(self, sec, ptype, rules):
+        """adds policy rules to the model, all or none of them."""
+        assertion = self[sec][ptype]
+        if sec != "p" or assertion.priority_index < 0 or len(rules) < 2:
+            return super().add_policies(sec, ptype, rules)
+
+        priority_index = assertion.priority_index
+        if not all(rule[priority_index].isdigit() for rule in rules):
+            return super().add_policies(sec, ptype, rules)
+        for rule in rules:
+            if self.has_policy(sec, ptype, rule):
+                return False
+
+        # A stable sort keeps the batch's order among equal priorities, and
+        # every rule goes after the existing rules of its priority.
+        batch = sorted(distinct_rules(rules), key=lambda rule: int(rule[priority_index]))
+        try:
+            positions = [
+                bisect.bisect_right(
+                    assertion.policy,
+                    int(rule[priority_index]),
+                    key=lambda existing: int(existing[priority_index]),
+                )
+                for rule in batch
+            ]
+        except ValueError:
+            # Non-numeric priorities are already in the policy.
+            return super().add_policies(sec, ptype, rules)
+
+        merged = []
+        start = 0
+        for position, rule in zip(positions, batch):
+            merged += assertion.policy[start:position]
+            merged.append(rule)
+            start = position
+        merged += assertion.policy[start:]
+        assertion.policy[:] = merged
+        return True
+
+    def sort_policies_by_priority(self):
+        """
+        Sorts the `p` rules by priority, keeping the order of equal priorities.
+
+        Unlike casbin, no `policy_map` is built: nothing reads it, and its
+        joined-string key per rule is a large share of a big policy's memory.
+        """
+        for ptype, assertion in self["p"].items():
+            priority_token = f"{ptype}_priority"
+            if priority_token not in assertion.tokens:
+                continue
+            priority_index = assertion.priority_index = assertion.tokens.index(priority_token)
+
+            def priority(rule):
+                value = rule[priority_index]
+                return int(value) if value.isdigit() else value
+
+            assertion.policy = sorted(assertion.policy, key=priority)
+
+
+def distinct_rules(rules) -> list:
+    """Returns the rules without repetitions, keeping the first of each."""
+    seen = set()
+    distinct = []
+    for rule in rules:
+        key = tuple(rule)
+        if key not in seen:
+            seen.add(key)
+            distinct.append(rule)
+    return distinct
+
+
+def _memoize_role_function(function):
+    """Caches the answers of a `g(...)` matcher function for one batch."""
+    answers = {}
+
+    def memoized(*args):
+        answer = answers.get(args)
+        if answer is None:
+            answer = answers[args] = function(*args)
+        return answer
+
+    return memoized
+
+
+def _locked(method):
+    """Runs an enforcer method while holding its `policy_lock`."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.policy_lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class IndexedEnforcer(casbin.Enforcer):
+    """
+    Casbin enforcer that narrows every check down to candidate rules.
+
+    The index is only used for the default `r`/`p`/`e`/`m` sections, for
+    matchers without `eval()` and for policies whose priorities are all
+    integers. Anything else falls back to the stock casbin evaluation.
+    """
+
+    policy_index = None
+    # Incremented on every change that can alter a decision.
+    policy_generation = 0
+    # Number of `p` rules that constrain `req_body`, None if it is unknown.
+    body_rule_count = None
+    # Resolves the subject clause of the matcher, None if it cannot be used.
+    subject_resolver = None
+    # Whether the matcher is compiled into Python instead of evaluated by simpleeval.
+    compile_matchers = True
+
+    @staticmethod
+    def new_model(path="", text=""):
+        """creates a model that keeps the policy in priority order."""
+        m = PriorityModel()
+        if len(path) > 0:
+            m.load_model(path)
+        else:
+            m.load_model_from_text(text)
+
+        return m
+
+    def _initialize(self):
+        self.policy_lock = threading.RLock()
+        self.pattern_cache = PatternCache()
+        self.fm.add_function("regexMatch", self.pattern_cache.regex_match)
+        super()._initialize()
+        self._rebuild_policy_index()
+
+    @_locked
+    def load_policy(self):
+        # casbin deep-copies the model before loading; the index must not be
+        # copied along with it.
+        self.model.rule_index = None
+        try:
+            super().load_policy()
+        finally:
+            self._rebuild_policy_index()
+
+    @_locked
+    def load_policy_from(self, adapter):
+        """
+        Replaces the policy with the one loaded by another adapter.
+
+        The enforcer keeps its own adapter for later saves.
+        """
+        own_adapter = self.adapter
+        self.adapter = adapter
+        try:
+            self.load_policy()
+        finally:
+            self.adapter = own_adapter
+
+    @_locked
+    def remove_rules_at(self, positions, generation=None):
+        """
+        Removes `p` rules by their position in evaluation order.
+
+        Unlike `remove_policies`, only the given copy of a rule listed more
+        than once is removed. The change is made in memory only; the caller
+        persists it, e.g. with `PolicyPersister.request_save`.
+
+        Args:
+            positions (Iterable[int]): Positions in `get_policy()` order.
+            generation (int): If given, nothing is removed unless
+                `policy_generation` still has this value.
+
+        Returns:
+            bool: Whether the rules were removed.
+        """
+        if generation is not None and generation != self.policy_generation:
+            return False
+        assertion = self.model["p"]["p"]
+        removed = set(positions)
+        assertion.policy = [rule for position, rule in enumerate(assertion.policy) if position not in removed]
+        self._rebuild_policy_index()
+        return True
+
+    @contextlib.contextmanager
+    def local_changes(self):
+        """
+        Applies policy changes to memory only.
+
+        Inside the block adds and removes are neither written to the adapter
+        nor reported to the watcher, e.g. when replaying a change that another
+        worker already stored.
+        """
+        with self.policy_lock:
+            auto_save = self.auto_save
+            self.auto_save = False
+            try:
+                yield self
+            finally:
+                self.auto_save = auto_save
+
+    @_locked
+    def load_filtered_policy(self, filter):
+        super().load_filtered_policy(filter)
+        self._rebuild_policy_index()
+
+    @_locked
+    def load_increment_filtered_policy(self, filter):
+        super().load_increment_filtered_policy(filter)
+        self._rebuild_policy_index()
+
+    @_locked
+    def clear_policy(self):
+        super().clear_policy()
+        self._rebuild_policy_index()
+
+    @_locked
+    def save_policy(self):
+        super().save_policy()
+        self.policy_generation += 1
+
+    @_locked
+    def enable_enforce(self, enabled=True):
+        super().enable_enforce(enabled)
+        self.policy_generation += 1
+
+    @_locked
+    def build_role_links(self):
+        super().build_role_links()
+        self.policy_generation += 1
+        if self.subject_resolver is not None:
+            self.subject_resolver.clear()
+
+    @_locked
+    def _add_policy(self, sec, ptype, rule):
+        rule_added = super()._add_policy(sec, ptype, rule)
+        if rule_added:
+            self._index_added(sec, ptype, [rule])
+        return rule_added
+
+    @_locked
+    def _add_policies(self, sec, ptype, rules):
+        # casbin stores a rule repeated within one call once; so must the index.
+        rules = distinct_rules(rules)
+        rules_added = super()._add_policies(sec, ptype, rules)
+        if rules_added:
+            self._index_added(sec, ptype, rules)
+        return rules_added
+
+    @_locked
+    def _remove_policy(self, sec, ptype, rule):
+        rule_removed = super()._remove_policy(sec, ptype, rule)
+        if rule_removed:
+            self._index_removed(sec, ptype, [rule])
+        return rule_removed
+
+    @_locked
+    def _remove_policies(self, sec, ptype, rules):
+        rules_removed = super()._remove_policies(sec, ptype, rules)
+        if rules_removed:
+            self._index_removed(sec, ptype, rules)
+        return rules_removed
+
+    # Grouping changes also rebuild role links outside `_add_policy`, so the
+    # whole operation has to hold the lock.
+
+    @_locked
+    def add_named_grouping_policy(self, ptype, *params):
+        return super().add_named_grouping_policy(ptype, *params)
+
+    @_locked
+    def add_named_grouping_policies(self, ptype, rules):
+        return super().add_named_grouping_policies(ptype, rules)
+
+    @_locked
+    def add_named_grouping_policies_ex(self, ptype, rules):
+        return super().add_named_grouping_policies_ex(ptype, rules)
+
+    @_locked
+    def remove_named_grouping_policy(self, ptype, *params):
+        return super().remove_named_grouping_policy(ptype, *params)
+
+    @_locked
+    def remove_named_grouping_policies(self, ptype, rules):
+        return super().remove_named_grouping_policies(ptype, rules)
+
+    @_locked
+    def remove_filtered_named_grouping_policy(self, ptype, field_index, *field_values):
+        return super().remove_filtered_named_grouping_policy(ptype, field_index, *field_values)
+
+    # Bulk rewrites of the policy are rare, so they simply rebuild the index.
+
+    @_locked
+    def _add_policies_ex(self, sec, ptype, rules):
+        rules_added = super()._add_policies_ex(sec, ptype, distinct_rules(rules))
+        self._rebuild_policy_index()
+        return rules_added
+
+    @_locked
+    def _update_policy(self, sec, ptype, old_rule, new_rule):
+        rule_updated = super()._update_policy(sec, ptype, old_rule, new_rule)
+        self._rebuild_policy_index()
+        return rule_updated
+
+    @_locked
+    def _update_policies(self, sec, ptype, old_rules, new_rules):
+        rules_updated = super()._update_policies(sec, ptype, old_rules, new_rules)
+        self._rebuild_policy_index()
+        return rules_updated
+
+    @_locked
+    def _update_filtered_policies(self, sec, ptype, new_rules, field_index, *field_values):
+        rules_updated = super()._update_filtered_policies(sec, ptype, new_rules, field_index, *field_values)
+        self._rebuild_policy_index()
+        return rules_updated
+
+    @_locked
+    def _remove_filtered_policy(self, sec, ptype, field_index, *field_values):
+        rule_removed = super()._remove_filtered_policy(sec, ptype, field_index, *field_values)
+        self._rebuild_policy_index()
+        return rule_removed
+
+    @_locked
+    def _remove_filtered_policy_returns_effects(self, sec, ptype, field_index, *field_values):
+        rule_removed = super()._remove_filtered_policy_returns_effects(sec, ptype, field_index, *field_values)
+        self._rebuild_policy_index()
+        return rule_removed
+
+    @_locked
+    def enforce_ex(self, *rvals):
+        """
+        Decides whether a request is allowed, evaluating only candidate rules.
+
+        Behaves exactly like `casbin.Enforcer.enforce_ex` and returns the same
+        `(result, explain_rule)` pair.
+        """
+        if not self._can_use_index(rvals):
+            return super().enforce_ex(*rvals)
+
+        r_parameters = self._request_parameters(rvals)
+        subjects = self._matching_subjects(r_parameters)
+        matcher = self._bind_matcher(subjects is not None, self._enforce_functions())(rvals)
+        candidates = self._candidates(r_parameters["r_obj"], subjects)
+        return self._enforce_candidates(rvals, candidates, matcher, subjects)[:2]
+
+    @_locked
+    def explain(self, *rvals):
+        """
+        Decides a request like `enforce_ex` and reports how it was decided.
+
+        Used by the explain mode of `services.explain`; `enforce` stays free of
+        the extra timing.
+
+        Returns:
+            dict: `allowed`, the deciding `rule` (empty if none matched), its
+                `priority` and `effect`, the number of candidate rules
+                `examined` (None when casbin evaluated the request itself) and
+                `timings` in seconds for `roles` (subject resolution) and
+                `matching`.
+        """
+        started = time.perf_counter()
+        resolved = started
+        if not self._can_use_index(rvals):
+            result, rule = super().enforce_ex(*rvals)
+            examined = None
+        else:
+            r_parameters = self._request_parameters(rvals)
+            subjects = self._matching_subjects(r_parameters)
+            resolved = time.perf_counter()
+            matcher = self._bind_matcher(subjects is not None, self._enforce_functions())(rvals)
+            candidates = self._candidates(r_parameters["r_obj"], subjects)
+            result, rule, examined = self._enforce_candidates(rvals, candidates, matcher, subjects)
+        finished = time.perf_counter()
+
+        p_tokens = self.model["p"]["p"].tokens
+        fields = dict(zip(p_tokens, rule)) if rule else {}
+        return {
+            "allowed": result,
+            "rule": list(rule),
+            "priority": fields.get("p_priority"),
+            "effect": fields.get("p_eft"),
+            "examined": examined,
+            "timings": {"roles": resolved - started, "matching": finished - resolved},
+        }
+
+    @_locked
+    def batch_enforce(self, rvals):
+        """
+        Decides a batch of requests under one consistent view of the policy.
+
+        The matcher is compiled once, subjects are resolved once and requests
+        on the same object (and subject) share one candidate lookup.
+
+        Args:
+            rvals (list): Request tuples, e.g. `(sub, obj, act, req_body)`.
+
+        Returns:
+            list: One bool per request, in order.
+        """
+        if not rvals or not all(self._can_use_index(request) for request in rvals):
+            return super().batch_enforce(rvals)
+
+        parameters = [self._request_parameters(request) for request in rvals]
+        subjects = [self._matching_subjects(r_parameters) for r_parameters in parameters]
+        use_resolver = all(matching is not None for matching in subjects)
+
+        functions = self._enforce_functions()
+        if "g" in self.model.keys() and not use_resolver:
+            for key in self.model["g"].keys():
+                if key in functions:
+                    functions[key] = _memoize_role_function(functions[key])
+        for_request = self._bind_matcher(use_resolver, functions)
+        if not use_resolver:
+            subjects = [None] * len(rvals)
+        # Candidates depend on the subject too when the index is partitioned by it.
+        keys = [
+            (r_parameters["r_obj"], r_parameters["r_sub"] if use_resolver else None)
+            for r_parameters in parameters
+        ]
+        key_counts = Counter(keys)
+        shared_candidates = {}
+
+        results = []
+        for request, matching, key in zip(rvals, subjects, keys):
+            if key_counts[key] == 1:
+                # A lone request keeps the lazy candidate stream.
+                candidates = self._candidates(key[0], matching)
+            else:
+                candidates = shared_candidates.get(key)
+                if candidates is None:
+                    candidates = shared_candidates[key] = list(self._candidates(key[0], matching))
+            results.append(self._enforce_candidates(request, candidates, for_request(request), matching)[0])
+        return results
+
+    @_locked
+    def needs_request_body(self, obj, sub=None) -> bool:
+        """
+        Tells whether the request body can change the decision for an object.
+
+        Args:
+            obj (str): The requested object.
+            sub (str, optional): The requesting subject; only its rules are
+                considered when the index is partitioned by subject.
+
+        Returns:
+            bool: False when no candidate rule constrains `req_body`, in which
+                case the object can be enforced with an empty body.
+        """
+        if self.body_rule_count is None:
+            return True
+        if self.body_rule_count == 0 or not self.enabled:
+            return False
+        if self.policy_index is None:
+            return True
+        subjects = None
+        if self.subject_resolver is not None and isinstance(sub, str):
+            subjects = self.subject_resolver.matching_subjects(sub)
+        body_index = self._body_index
+        candidates = self._candidates(obj, subjects)
+        return any(entry.rule[body_index] not in MATCH_ALL_BODY_PATTERNS for entry in candidates)
+
+    @_locked
+    def bucket_stats(self, top: int = 10):
+        """
+        Describes how the rules are spread over the subject buckets.
+
+        Returns:
+            dict: See `SubjectPartitionedIndex.bucket_stats`, or None when the
+                index is not partitioned by subject.
+        """
+        if not isinstance(self.policy_index, SubjectPartitionedIndex):
+            return None
+        return self.policy_index.bucket_stats(top)
+
+    @_locked
+    def priority_bands(self, width: int = 10):
+        """
+        Counts the `p` rules per priority band.
+
+        The policy is kept sorted by priority, so every band is found with a
+        binary search instead of a scan of the rules.
+
+        Args:
+            width (int): The width of a band; with 10, priorities 40 to 49
+                (owner, writer and reader of one level) share band 40.
+
+        Returns:
+            dict: Rule count by the lowest priority of each band, or None when
+                the index (and with it the numeric priorities) is not in use.
+        """
+        if self.policy_index is None:
+            return None
+        policy = self.model["p"]["p"].policy
+        priority_index = self._priority_index
+
+        def priority(rule):
+            return int(rule[priority_index])
+
+        bands = {}
+        start = 0
+        while start < len(policy):
+            band = priority(policy[start]) // width * width
+            end = bisect.bisect_left(policy, band + width, lo=start, key=priority)
+            bands[band] = end - start
+            start = end
+        return bands
+
+    def _can_use_index(self, rvals):
+        """Tells whether a request can be evaluated with the index."""
+        if self.policy_index is None or not self.enabled or not self.model["p"]["p"].policy:
+            return False
+        return not (rvals and isinstance(rvals[0], EnforceContext))
+
+    def _request_parameters(self, rvals):
+        r_tokens = self.model["r"]["r"].tokens
+        if len(r_tokens) != len(rvals):
+            raise RuntimeError("invalid request size")
+        return dict(zip(r_tokens, rvals))
+
+    def _matching_subjects(self, r_parameters):
+        """Returns the policy subjects the request subject matches, or None."""
+        if self.subject_resolver is None or not isinstance(r_parameters["r_sub"], str):
+            return None
+        return self.subject_resolver.matching_subjects(r_parameters["r_sub"])
+
+    def _candidates(self, obj, subjects):
+        """Candidate rules for an object, limited to `subjects` when resolved."""
+        if subjects is None:
+            return self.policy_index.candidates(obj)
+        return self.policy_index.candidates_for(obj, subjects)
+
+    def _matcher(self, use_resolver):
+        """The matcher to evaluate: without the subject clause when it is resolved."""
+        if use_resolver:
+            return self._residual_matcher
+        return self.model["m"]["m"].value
+
+    def _bind_matcher(self, use_resolver, functions):
+        """
+        Returns `for_request(rvals)`, which returns the matcher of a request.
+
+        The matcher is compiled into Python (see `services.matcher_compiler`)
+        unless `compile_matchers` is off or it uses a construct only
+        `simpleeval` evaluates.
+        """
+        matcher = self._matcher(use_resolver)
+        r_tokens, p_tokens = self.model["r"]["r"].tokens, self.model["p"]["p"].tokens
+        if self.compile_matchers:
+            compiled = compile_matcher(matcher, r_tokens, p_tokens, functions)
+            if compiled is not None:
+                return compiled.bind(functions)
+        return interpreted_matcher(self._get_expression(matcher, functions), r_tokens, p_tokens)
+
+    def _enforce_candidates(self, rvals, candidates, matcher, subjects=None):
+        """
+        Evaluates candidate rules in order.
+
+        Returns `(result, explain_rule, examined)`, where `examined` counts the
+        candidate rules looked at before the decision was settled.
+
+        `matcher` is the request's matcher as a function of a rule. With
+        `subjects`, rules whose `p.sub` is not in the set fail the subject
+        clause and are skipped; `matcher` must then be the residual matcher.
+        """
+        p_tokens = self.model["p"]["p"].tokens
+        eft_index = p_tokens.index("p_eft") if "p_eft" in p_tokens else None
+        # Only set up with a subject resolver, which `subjects` requires.
+        sub_index = self._sub_index if subjects is not None else None
+
+        # Candidates arrive in evaluation order; the effector's intermediate
+        # effect ends the loop at the first rule that settles the decision.
+        policy_effects = set()
+        explain_rule = []
+        examined = 0
+        for entry in candidates:
+            examined += 1
+            if subjects is not None and entry.rule[sub_index] not in subjects:
+                policy_effects.add(Effector.INDETERMINATE)
+                continue
+            result = matcher(entry.rule)
+
+            if isinstance(result, bool):
+                if not result:
+                    policy_effects.add(Effector.INDETERMINATE)
+                    continue
+            elif isinstance(result, float):
+                if 0 == result:
+                    policy_effects.add(Effector.INDETERMINATE)
+                    continue
+            else:
+                raise RuntimeError("matcher result should be bool, int or float")
+
+            eft = None
+            if eft_index is not None and eft_index < len(entry.rule):
+                eft = entry.rule[eft_index]
+            if eft is None:
+                policy_effects.add(Effector.ALLOW)
+            elif "allow" == eft:
+                policy_effects.add(Effector.ALLOW)
+            elif "deny" == eft:
+                policy_effects.add(Effector.DENY)
+            else:
+                policy_effects.add(Effector.INDETERMINATE)
+
+            explain_rule = entry.rule
+            if self.eft.intermediate_effect(policy_effects) != Effector.INDETERMINATE:
+                break
+
+        result = effect_to_bool(self.eft.final_effect(policy_effects))
+        RULES_EVALUATED.observe(examined)
+        self._log_request(rvals, result)
+        return result, explain_rule, examined
+
+    def _enforce_functions(self):
+        """Builds the matcher function map the same way casbin does per request."""
+        functions = self.fm.get_functions()
+        if "g" in self.model.keys():
+            for key, ast in self.model["g"].items():
+                if len(self.rm_map) != 0:
+                    functions[key] = generate_g_function(ast.rm)
+                if len(self.cond_rm_map) != 0:
+                    functions[key] = generate_conditional_g_function(ast.cond_rm)
+        return functions
+
+    def _log_request(self, rvals, result):
+        if (result and self.logger.isEnabledFor(logging.INFO)) or (
+            not result and self.logger.isEnabledFor(logging.WARNING)
+        ):
+            req_str = "Request: " + ", ".join([str(v) for v in rvals]) + " ---> %s" % result
+            if result:
+                self.logger.info(req_str)
+            else:
+                self.logger.warning(req_str)
+
+    def _index_added(self, sec, ptype, rules):
+        self.policy_generation += 1
+        for rule in rules:
+            intern_rule(rule)
+        self._grouping_changed(sec, ptype, rules)
+        if sec != "p" or ptype != "p":
+            return
+        self._count_body_rules(rules, 1)
+        if self.policy_index is None:
+            return
+        if self.subject_resolver is not None:
+            self.subject_resolver.add_subjects(rule[self._sub_index] for rule in rules)
+        for rule in rules:
+            if not rule[self._priority_index].isdigit():
+                self.policy_index = self.model.rule_index = None
+                return
+            self.policy_index.add(rule, order_key(int(rule[self._priority_index]), self._next_order))
+            self._next_order += 1
+
+    def _index_removed(self, sec, ptype, rules):
+        self.policy_generation += 1
+        self._grouping_changed(sec, ptype, rules)
+        if sec != "p" or ptype != "p":
+            return
+        self._count_body_rules(rules, -1)
+        if self.policy_index is None:
+            return
+        if self.subject_resolver is not None:
+            self.subject_resolver.remove_subjects(rule[self._sub_index] for rule in rules)
+        for rule in rules:
+            self.policy_index.remove(rule)
+
+    def _grouping_changed(self, sec, ptype, rules):
+        if sec == "g" and ptype == "g" and self.subject_resolver is not None:
+            self.subject_resolver.links_changed(rule[0] for rule in rules)
+
+    def _count_body_rules(self, rules, step):
+        if self.body_rule_count is None:
+            return
+        body_index = self._body_index
+        for rule in rules:
+            if rule[body_index] not in MATCH_ALL_BODY_PATTERNS:
+                self.body_rule_count += step
+
+    def _rebuild_policy_index(self):
+        """Rebuilds the index from the model, or disables it if unsupported."""
+        self.policy_generation += 1
+        self.policy_index = self.model.rule_index = None
+        self.subject_resolver = None
+        self.body_rule_count = None
+        self._next_order = 0
+        for sec in ("p", "g"):
+            if sec in self.model.keys():
+                for assertion in self.model[sec].values():
+                    for rule in assertion.policy:
+                        intern_rule(rule)
+
+        if "p" not in self.model.keys() or "p" not in self.model["p"]:
+            return
+        self._rebuild_body_rule_count()
+        if "m" not in self.model.keys() or "m" not in self.model["m"]:
+            return
+        if has_eval(self.model["m"]["m"].value):
+            return
+
+        assertion = self.model["p"]["p"]
+        if "p_priority" not in assertion.tokens or "p_obj" not in assertion.tokens:
+            return
+        if "r_obj" not in self.model["r"]["r"].tokens:
+            return
+
+        self._priority_index = assertion.tokens.index("p_priority")
+        for rule in assertion.policy:
+            if len(rule) != len(assertion.tokens) or not rule[self._priority_index].isdigit():
+                return
+
+        self._rebuild_subject_resolver()
+        obj_index = assertion.tokens.index("p_obj")
+        if self.subject_resolver is not None:
+            policy_index = SubjectPartitionedIndex(obj_index, self._sub_index)
+        else:
+            policy_index = PolicyIndex(obj_index)
+        for order, rule in enumerate(assertion.policy):
+            policy_index.add(rule, order_key(int(rule[self._priority_index]), order))
+
+        self.policy_index = self.model.rule_index = policy_index
+        self._next_order = len(assertion.policy)
+
+    def _rebuild_body_rule_count(self):
+        """Counts the rules that constrain `req_body`, if the model has one."""
+        p_tokens = self.model["p"]["p"].tokens
+        if "p_req_body" not in p_tokens or "r_req_body" not in self.model["r"]["r"].tokens:
+            return
+        # Only a matcher that compares the body with the rule's pattern, and
+        # nothing else, lets a match-all pattern ignore the body.
+        if "m" not in self.model.keys() or self.model["m"]["m"].value.count("r_req_body") != 1:
+            return
+        self._body_index = p_tokens.index("p_req_body")
+        count = 0
+        for rule in self.model["p"]["p"].policy:
+            if len(rule) != len(p_tokens):
+                return
+            if rule[self._body_index] not in MATCH_ALL_BODY_PATTERNS:
+                count += 1
+        self.body_rule_count = count
+
+    def _rebuild_subject_resolver(self):
+        """Sets up the `SubjectResolver`, if the model and role manager allow it."""
+        p_tokens = self.model["p"]["p"].tokens
+        if "p_sub" not in p_tokens or "r_sub" not in self.model["r"]["r"].tokens:
+            return
+        residual_matcher = _residual_matcher(self.model["m"]["m"].value)
+        if residual_matcher is None or len(self.cond_rm_map) != 0:
+            return
+
+        if "g" not in self.model.keys() or "g" not in self.model["g"]:
+            return
+        role_manager = self.model["g"]["g"].rm
+        # Custom role managers and pattern matching change what `g` means.
+        if type(role_manager) is not RoleManager or role_manager.matching_func is not None:
+            return
+        if role_manager.domain_matching_func is not None:
+            return
+
+        self._sub_index = p_tokens.index("p_sub")
+        self._residual_matcher = residual_matcher
+        self.subject_resolver = SubjectResolver(role_manager)
+        self.subject_resolver.add_subjects(rule[self._sub_index] for rule in self.model["p"]["p"].policy)
@@ -0,0 +1,362 @@
+"""
+enforcer_router.py
+==================
+Per-Tenant Sharded Enforcers
+
+Every object starts with a tenant root: the `workspaceId` before the first
+`.` of jobs, catalogs, schemas and tables, or the `organizationId` before the
+first `:` of buckets and folders. `EnforcerRouter` keeps one `IndexedEnforcer`
+per root and sends each check to the shard of its object, so a check only
+ever sees the rules of one tenant.
+
+A shard is loaded on first use from a `SqliteAdapter` with a `PolicyFilter`
+on the root, and evicted again when it has been idle for `idle_timeout`
+seconds or when more than `max_shards` are loaded. Memory therefore grows
+with the active tenants, not with all tenants.
+
+Cross-tenant rules (`root`'s `.*`, `.*` deny rules, anything whose object is
+not a literal prefix) form the global shard, which serves objects without a
+tenant root. With `priority(p.eft)` they interleave with a tenant's own rules
+by priority, so every tenant shard also holds a copy of them; a check then
+needs exactly one shard and decides exactly like a single enforcer. The
+global rules are few, so the copies are cheap. Grouping rules are loaded
+into every shard.
+
+A shard without any `p` rule denies every request. casbin evaluates an empty
+policy by matching the request against empty strings, which allows it; a
+single enforcer only does so when the whole policy is empty, while a shard is
+empty whenever its tenant (and the global shard) has no rules.
+
+Changes are written to the database first and then applied to every loaded
+shard the rule can affect. Policy types in `stored_ptypes` (e.g. the resource
+kind markers, which no matcher reads) are kept in the database only.
+
+Classes:
+--------
+- EnforcerRouter: Routes checks and changes to per-tenant enforcers.
+
+Functions:
+----------
+- tenant_root: The tenant root of an object.
+- has_rules: Whether a shard holds any `p` rule.
+- shard_prefixes: The object prefixes a shard loads.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from casbin import persist
+
+from services.enforcer import IndexedEnforcer
+from services.sqlite_adapter import PolicyFilter, pattern_overlaps
+
+# Separators that end the tenant root of an object.
+TENANT_SEPARATORS = re.compile(r"[.:]")
+
+# The shard of objects without a tenant root; it holds the cross-tenant rules.
+GLOBAL_ROOT = ""
+
+
+def tenant_root(obj: str) -> str:
+    """Returns the tenant root of an object, e.g. `default` for `default.catalog_1`."""
+    return TENANT_SEPARATORS.split(obj, 1)[0]
+
+
+def has_rules(enforcer) -> bool:
+    """Tells whether a shard holds any `p` rule; a shard without denies everything."""
+    return bool(enforcer.get_model()["p"]["p"].policy)
+
+
+def shard_prefixes(root: str) -> tuple:
+    """The object prefixes of a shard: the root followed by either separator."""
+    return (root + ".", root + ":")
+
+
+class _ShardAdapter(persist.Adapter):
+    """Loads one shard's part of the policy from the shared adapter."""
+
+    def __init__(self, adapter, root, skipped_ptypes=()):
+        self.adapter = adapter
+        self.filter = PolicyFilter(shard_prefixes(root), skipped_ptypes=skipped_ptypes)
+
+    def load_policy(self, model):
+        self.adapter.load_filtered_policy(model, self.filter)
+
+
+class _Shard:
+    __slots__ = ("root", "enforcer", "last_used")
+
+    def __init__(self, root, enforcer):
+        self.root = root
+        self.enforcer = enforcer
+        self.last_used = time.monotonic()
+
+
+class EnforcerRouter:
+    """
+    Routes authorization checks and policy changes to per-tenant enforcers.
+
+    Offers the parts of the `IndexedEnforcer` interface the service uses, so
+    it can stand in for the single enforcer.
+
+    Attributes:
+    - model_path (str): Path of the casbin model.
+    - adapter (SqliteAdapter): Storage of the whole policy.
+    - max_shards (int): Maximum number of loaded tenant shards.
+    - idle_timeout (float): Seconds after which an unused shard is evicted.
+    - stored_ptypes (tuple): Policy types that no shard loads.
+    - policy_generation (int): Incremented by every policy change.
+    - loads (int): Number of shards loaded.
+    - evictions (int): Number of shards evicted.
+    """
+
+    def __init__(
+        self, model_path: str, adapter, max_shards: int = 1000, idle_timeout: float = 600, stored_ptypes: tuple = ()
+    ):
+        self.model_path = model_path
+        self.adapter = adapter
+        self.max_shards = max_shards
+        self.idle_timeout = idle_timeout
+        self.stored_ptypes = tuple(stored_ptypes)
+        self.policy_generation = 0
+        self.loads = 0
+        self.evictions = 0
+        with open(model_path, "r") as file:
+            self._model_text = file.read()
+        self._lock = threading.RLock()
+        self._shards = OrderedDict()
+        self.global_shard = self._load(GLOBAL_ROOT)
+
+    def get_adapter(self):
+        return self.adapter
+
+    def get_model(self):
+        """The model of the global shard; every shard has the same definitions."""
+        return self.global_shard.get_model()
+
+    def enforce(self, *rvals) -> bool:
+        """Decides a request on the shard of its object."""
+        enforcer = self.shard(rvals[1])
+        if not has_rules(enforcer):
+            return False
+        return enforcer.enforce(*rvals)
+
+    def enforce_ex(self, *rvals):
+        """Decides a request on the shard of its object, with the deciding rule."""
+        enforcer = self.shard(rvals[1])
+        if not has_rules(enforcer):
+            return False, []
+        return enforcer.enforce_ex(*rvals)
+
+    def explain(self, *rvals) -> dict:
+        """Explains a request's decision on the shard of its object."""
+        enforcer = self.shard(rvals[1])
+        if not has_rules(enforcer):
+            return {
+                "allowed": False,
+                "rule": [],
+                "priority": None,
+                "effect": None,
+                "examined": 0,
+                "timings": {"roles": 0.0, "matching": 0.0},
+            }
+        return enforcer.explain(*rvals)
+
+    def batch_enforce(self, rvals) -> list:
+        """Decides a batch, one `batch_enforce` per shard involved."""
+        groups = {}
+        for position, request in enumerate(rvals):
+            groups.setdefault(tenant_root(request[1]), []).append(position)
+
+        results = [False] * len(rvals)
+        for root, positions in groups.items():
+            enforcer = self._shard(root)
+            if not has_rules(enforcer):
+                continue
+            decisions = enforcer.batch_enforce([rvals[position] for position in positions])
+            for position, decision in zip(positions, decisions):
+                results[position] = decision
+        return results
+
+    def needs_request_body(self, obj, sub=None) -> bool:
+        """See `IndexedEnforcer.needs_request_body`."""
+        return self.shard(obj).needs_request_body(obj, sub)
+
+    def shard(self, obj: str) -> IndexedEnforcer:
+        """Returns the enforcer of an object's tenant, loading it if needed."""
+        return self._shard(tenant_root(obj))
+
+    def add_policy(self, *params) -> bool:
+        return self.add_named_policy("p", *params)
+
+    def add_policies(self, rules) -> bool:
+        return self.add_named_policies("p", rules)
+
+    def remove_policy(self, *params) -> bool:
+        return self.remove_named_policy("p", *params)
+
+    def remove_policies(self, rules) -> bool:
+        return self.remove_named_policies("p", rules)
+
+    def has_policy(self, *params) -> bool:
+        return self.has_named_policy("p", *params)
+
+    def has_named_policy(self, ptype, *params) -> bool:
+        """Tells whether a rule is stored, whether or not its shard is loaded."""
+        return self.adapter.has_policy(ptype, list(params))
+
+    def add_grouping_policy(self, *params) -> bool:
+        return self.add_named_grouping_policy("g", *params)
+
+    def remove_grouping_policy(self, *params) -> bool:
+        return self.remove_named_grouping_policy("g", *params)
+
+    def add_named_policy(self, ptype, *params) -> bool:
+        return self.add_named_policies(ptype, [list(params)])
+
+    def add_named_policies(self, ptype, rules) -> bool:
+        """Stores rules and adds them to the loaded shards. False if one exists."""
+        return self._change("p", ptype, rules, add=True)
+
+    def remove_named_policy(self, ptype, *params) -> bool:
+        return self.remove_named_policies(ptype, [list(params)])
+
+    def remove_named_policies(self, ptype, rules) -> bool:
+        """Deletes rules and removes them from the loaded shards. False if one is missing."""
+        return self._change("p", ptype, rules, add=False)
+
+    def has_named_grouping_policy(self, ptype, *params) -> bool:
+        return self.adapter.has_policy(ptype, list(params))
+
+    def add_named_grouping_policy(self, ptype, *params) -> bool:
+        return self._change("g", ptype, [list(params)], add=True)
+
+    def add_named_grouping_policies(self, ptype, rules) -> bool:
+        return self._change("g", ptype, rules, add=True)
+
+    def remove_named_grouping_policy(self, ptype, *params) -> bool:
+        return self._change("g", ptype, [list(params)], add=False)
+
+    def policy_objects(self, ptype: str = "p") -> list:
+        """Returns the object of every stored rule (e.g. to rebuild the resource registry)."""
+        return self.adapter.objects(ptype)
+
+    def policy_rules(self, ptype: str) -> list:
+        """Returns every stored rule of a policy type, loaded by a shard or not."""
+        return self.adapter.rules(ptype, len(self.get_model()[ptype[0]][ptype].tokens))
+
+    def priority_bands(self, width: int = 10) -> dict:
+        """Counts the stored `p` rules per priority band (see `IndexedEnforcer.priority_bands`)."""
+        bands = {}
+        for priority, count in self.adapter.priority_counts("p").items():
+            band = priority // width * width
+            bands[band] = bands.get(band, 0) + count
+        return bands
+
+    def evict_idle(self) -> int:
+        """Evicts the shards that were not used for `idle_timeout` seconds."""
+        with self._lock:
+            return self._evict_expired(time.monotonic())
+
+    def stats(self):
+        """
+        Returns the router counters.
+
+        Returns:
+            dict: Loaded shards, loads, evictions and the rules of the global shard.
+        """
+        return {
+            "shards": len(self._shards),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "global_rules": len(self.global_shard.get_policy()),
+        }
+
+    def _shard(self, root):
+        if root == GLOBAL_ROOT:
+            return self.global_shard
+
+        with self._lock:
+            now = time.monotonic()
+            self._evict_expired(now)
+            shard = self._shards.get(root)
+            if shard is not None:
+                shard.last_used = now
+                self._shards.move_to_end(root)
+                return shard.enforcer
+            generation = self.policy_generation
+
+        while True:
+            # Loading runs outside the lock; a change made meanwhile may be
+            # missing from the loaded rules, so the load is repeated.
+            enforcer = self._load(root)
+            with self._lock:
+                shard = self._shards.get(root)
+                if shard is not None:
+                    return shard.enforcer
+                if generation == self.policy_generation:
+                    self._shards[root] = _Shard(root, enforcer)
+                    while len(self._shards) > self.max_shards:
+                        self._shards.popitem(last=False)
+                        self.evictions += 1
+                    break
+                generation = self.policy_generation
+        return enforcer
+
+    def _evict_expired(self, now):
+        """Evicts idle shards; the least recently used one is always first."""
+        deadline = now - self.idle_timeout
+        evicted = 0
+        while self._shards:
+            shard = next(iter(self._shards.values()))
+            if shard.last_used > deadline:
+                break
+            del self._shards[shard.root]
+            evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def _load(self, root):
+        model = IndexedEnforcer.new_model(text=self._model_text)
+        enforcer = IndexedEnforcer(model, _ShardAdapter(self.adapter, root, self.stored_ptypes))
+        self.loads += 1
+        return enforcer
+
+    def _change(self, sec, ptype, rules, add):
+        rules = [list(rule) for rule in rules]
+        with self._lock:
+            for rule in rules:
+                if self.adapter.has_policy(ptype, rule) == add:
+                    return False
+            if add:
+                self.adapter.add_policies(sec, ptype, rules)
+            else:
+                self.adapter.remove_policies(sec, ptype, rules)
+            self.policy_generation += 1
+            if ptype in self.stored_ptypes:
+                return True
+
+            shards = [self.global_shard] + [shard.enforcer for shard in self._shards.values()]
+            for enforcer in shards:
+                selected = rules if sec == "g" else [rule for rule in rules if self._affects(enforcer, ptype, rule)]
+                if not selected:
+                    continue
+                with enforcer.local_changes():
+                    if sec == "g" and add:
+                        enforcer.add_named_grouping_policies(ptype, selected)
+                    elif sec == "g":
+                        enforcer.remove_named_grouping_policies(ptype, selected)
+                    elif add:
+                        enforcer.add_named_policies(ptype, selected)
+                    else:
+                        enforcer.remove_named_policies(ptype, selected)
+        return True
+
+    @staticmethod
+    def _affects(enforcer, ptype, rule):
+        """Tells whether a rule belongs to a shard (the load filter, for one rule)."""
+        obj = rule[enforcer.get_model()["p"][ptype].tokens.index("p_obj")]
+        prefixes = enforcer.get_adapter().filter.object_prefixes
+        return any(pattern_overlaps(obj, prefix) for prefix in prefixes)
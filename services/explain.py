@@ -0,0 +1,117 @@
+"""
+explain.py
+==========
+Decision Explain / Trace Mode
+
+A check that is slow or denied with an unexpected 401 does not say which
+rule decided it. For a traced request every authorization check records:
+
+- the decision, the winning rule, its priority and effect,
+- the number of candidate rules the enforcer examined,
+- whether the decision cache already held it,
+- timings for request body extraction, role (subject) resolution, rule
+  matching and the whole check.
+
+A request is traced when it carries the `AUTHZ_EXPLAIN_HEADER` header (with
+any value but `0`/`false`), or at random with probability
+`AUTHZ_EXPLAIN_SAMPLE_RATE`. The trace is logged when the request finishes;
+a request that asked for it with the header also gets it back as JSON in the
+same response header. The trace reveals policy rules, so only enable the
+header where clients may see them (or strip it at the gateway).
+
+`ExplainMiddleware` is only installed when one of the two settings is on.
+Otherwise the only cost is one context variable lookup per check.
+
+Classes:
+--------
+- DecisionTrace: The checks recorded for one request.
+- ExplainMiddleware: ASGI middleware that starts traces and reports them.
+"""
+
+import json
+import random
+from contextvars import ContextVar
+
+from loguru import logger
+
+# The trace of the current request, None when it is not traced.
+current_trace = ContextVar("authz_trace", default=None)
+
+# Header values that do not ask for a trace.
+_FALSE_VALUES = frozenset((b"", b"0", b"false", b"no", b"off"))
+
+
+class DecisionTrace:
+    """
+    The authorization checks of one traced request.
+
+    Attributes:
+    - path (str): The request path.
+    - checks (list): One dict per check, see `IndexedEnforcer.explain`.
+    - body_seconds (float): Body extraction time not yet attributed to a check.
+    """
+
+    __slots__ = ("path", "checks", "body_seconds")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.checks = []
+        self.body_seconds = 0.0
+
+    def record_body(self, seconds: float):
+        """Adds body extraction time to the next recorded check."""
+        self.body_seconds += seconds
+
+    def add_check(self, check: dict):
+        """Records a check together with the body extraction time before it."""
+        check["timings"]["body"] = self.body_seconds
+        self.body_seconds = 0.0
+        self.checks.append(check)
+
+    def to_json(self) -> str:
+        return json.dumps({"path": self.path, "checks": self.checks}, separators=(",", ":"))
+
+
+class ExplainMiddleware:
+    """
+    Traces the authorization checks of requested or sampled requests.
+
+    Attributes:
+    - app: The wrapped ASGI application.
+    - header (str): Request header that asks for a trace, or None.
+    - sample_rate (float): Share of other requests traced and logged.
+    """
+
+    def __init__(self, app, header: str = None, sample_rate: float = 0.0):
+        self.app = app
+        self.header = header
+        self.sample_rate = sample_rate
+        self._header_key = header.lower().encode("latin-1") if header else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = self._header_key is not None and any(
+            name == self._header_key and value.lower() not in _FALSE_VALUES for name, value in scope["headers"]
+        )
+        if not requested and not (self.sample_rate and random.random() < self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        trace = DecisionTrace(scope["path"])
+        token = current_trace.set(trace)
+
+        async def send_with_trace(message):
+            if requested and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((self._header_key, trace.to_json().encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            current_trace.reset(token)
+            logger.info(f"Authorization trace {trace.to_json()}")
@@ -0,0 +1,323 @@
+"""
+journal_adapter.py
+==================
+Append-Only Policy Journal with Snapshot Compaction
+
+`JournalAdapter` is a casbin adapter that never rewrites the whole policy on
+a change. Every rule added or removed through the enforcer is appended to a
+journal segment (`<snapshot>.journal.<n>`) in O(1). `sync()` flushes and
+fsyncs the segment, so many changes share one fsync.
+
+The snapshot is an ordinary casbin policy CSV whose first line is a
+`# journal <n>` comment, recording that every segment up to `<n>` is already
+folded into it. Loading reads the snapshot, replays the newer segments and
+starts a fresh segment. Compaction rotates to a new segment, writes a new
+snapshot from a copy of the in-memory policy and deletes the folded segments.
+A crash at any point leaves a snapshot plus the segments still needed to
+rebuild the policy.
+
+Journal records use the policy CSV layout with an operation in front:
+`+, p, 40, cto, ws.catalog(\\..*)?$, .*, .*, allow` adds a rule, `-, ...`
+removes one and `*, p, <field_index>, <values...>` is a filtered removal.
+
+Classes:
+--------
+- JournalAdapter: casbin Adapter backed by a snapshot and journal segments.
+"""
+
+import glob
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+
+from casbin import persist
+from casbin.persist.adapter import _extract_tokens
+
+_SNAPSHOT_HEADER = re.compile(r"^# journal (\d+)$")
+
+
+def parse_policy_line(line: str, token_counts: dict):
+    """
+    Splits a policy CSV line into tokens.
+
+    Lines written by casbin or this adapter have no commas inside field
+    values, so a plain split is tried first. Anything else is handed to
+    casbin's own tokenizer, which understands bracketed commas.
+
+    Args:
+        line (str): A stripped policy line.
+        token_counts (dict): Expected number of tokens per policy type, as
+            returned by `policy_token_counts`.
+
+    Returns:
+        list: The tokens, or None for blank lines and comments.
+    """
+    if line == "" or line[:1] == "#":
+        return None
+    tokens = line.split(",")
+    if token_counts.get(tokens[0].strip()) == len(tokens):
+        return [token.strip() for token in tokens]
+    return _extract_tokens(line)
+
+
+def policy_token_counts(model) -> dict:
+    """Maps every policy type of a model to its line length (type + fields)."""
+    counts = {}
+    for sec in ("p", "g"):
+        if sec not in model.keys():
+            continue
+        for key, ast in model[sec].items():
+            counts[key] = len(ast.tokens) + 1
+    return counts
+
+
+class JournalAdapter(persist.Adapter):
+    """
+    casbin adapter that journals incremental changes and compacts them.
+
+    Attributes:
+    - snapshot_path (str): Path of the policy snapshot (a casbin policy CSV).
+    - compact_threshold (int): Journal records that make `needs_compaction` true.
+    - journal_records (int): Records appended since the last snapshot.
+    - bytes_written (int): Bytes appended to the journal and written to snapshots.
+    """
+
+    def __init__(self, snapshot_path: str, compact_threshold: int = 50000):
+        self.snapshot_path = snapshot_path
+        self.compact_threshold = compact_threshold
+        self.journal_records = 0
+        self.bytes_written = 0
+        self._segment = 0
+        self._journal = None
+        self._lock = threading.Lock()
+
+    def load_policy(self, model):
+        """Loads the snapshot and replays every newer journal segment."""
+        with self._lock:
+            self._close_journal()
+            token_counts = policy_token_counts(model)
+            folded, rules = self._read_snapshot(token_counts)
+            existing = self._segment_numbers()
+            segments = [number for number in existing if number > folded]
+
+            removals, records = Counter(), 0
+            for number in segments:
+                for op, tokens in self._read_segment(number, token_counts):
+                    records += 1
+                    if op == "+":
+                        rules.append(tokens)
+                    elif op == "-":
+                        removals[tuple(tokens)] += 1
+                    elif op == "*":
+                        rules = self._apply_removals(rules, removals)
+                        rules = self._apply_filter(rules, tokens)
+            rules = self._apply_removals(rules, removals)
+
+            for tokens in rules:
+                key = tokens[0]
+                if key in token_counts:
+                    model[key[0]][key].policy.append(tokens[1:])
+
+            # Segments at or below the snapshot's mark were already folded.
+            for number in existing:
+                if number <= folded:
+                    os.unlink(self._segment_path(number))
+
+            self.journal_records = records
+            self._segment = max(existing + [folded]) + 1
+            self._open_journal()
+
+    def save_policy(self, model):
+        """Writes a new snapshot of the whole model (a synchronous compaction)."""
+        self.write_snapshot(self.begin_compaction(model))
+
+    def add_policy(self, sec, ptype, rule):
+        """appends an added rule to the journal."""
+        self._append("+", [ptype] + list(rule))
+
+    def add_policies(self, sec, ptype, rules):
+        """appends added rules to the journal."""
+        self._append_many([("+", [ptype] + list(rule)) for rule in rules])
+
+    def add_policies_ex(self, sec, ptype, rules):
+        """appends added rules to the journal."""
+        self.add_policies(sec, ptype, rules)
+
+    def remove_policy(self, sec, ptype, rule):
+        """appends a removed rule to the journal."""
+        self._append("-", [ptype] + list(rule))
+
+    def remove_policies(self, sec, ptype, rules):
+        """appends removed rules to the journal."""
+        self._append_many([("-", [ptype] + list(rule)) for rule in rules])
+
+    def remove_filtered_policy(self, sec, ptype, field_index, *field_values):
+        """appends a filtered removal to the journal."""
+        self._append("*", [ptype, str(field_index)] + list(field_values))
+
+    def sync(self):
+        """Flushes and fsyncs the current journal segment."""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+
+    def needs_compaction(self) -> bool:
+        """Returns True when the journal has grown past `compact_threshold`."""
+        return self.journal_records >= self.compact_threshold
+
+    def begin_compaction(self, model):
+        """
+        Rotates to a new journal segment and copies the current policy.
+
+        Must be called where the model cannot change concurrently (the event
+        loop). The returned snapshot can be written from any thread.
+
+        Returns:
+            tuple: `(folded_segment, sections, retired_journal)` to pass to
+                `write_snapshot`.
+        """
+        with self._lock:
+            retired = self._journal
+            folded = self._segment
+            self._segment += 1
+            self.journal_records = 0
+            self._open_journal()
+
+        sections = []
+        for sec in ("p", "g"):
+            if sec not in model.keys():
+                continue
+            for key, ast in model[sec].items():
+                sections.append((key, list(ast.policy)))
+        return folded, sections, retired
+
+    def write_snapshot(self, snapshot):
+        """Atomically replaces the snapshot and deletes the folded segments."""
+        folded, sections, retired = snapshot
+        if retired is not None:
+            # The folded segment must stay durable until the snapshot is.
+            retired.flush()
+            os.fsync(retired.fileno())
+            retired.close()
+
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".policy-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as file:
+                file.write(f"# journal {folded}\n")
+                for key, rules in sections:
+                    for pvals in rules:
+                        file.write(key + ", " + ", ".join(pvals) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+                self.bytes_written += file.tell()
+            os.replace(tmp_path, self.snapshot_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        for number in self._segment_numbers():
+            if number <= folded:
+                os.unlink(self._segment_path(number))
+
+    def close(self):
+        """Flushes and closes the journal."""
+        with self._lock:
+            self._close_journal()
+
+    def _append(self, op, tokens):
+        self._append_many([(op, tokens)])
+
+    def _append_many(self, records):
+        with self._lock:
+            if self._journal is None:
+                self._open_journal()
+            text = "".join(op + ", " + ", ".join(tokens) + "\n" for op, tokens in records)
+            self._journal.write(text)
+            self.journal_records += len(records)
+            self.bytes_written += len(text)
+
+    def _read_snapshot(self, token_counts):
+        """Returns the snapshot's folded segment and its rules as token lists."""
+        folded, rules = -1, []
+        if not os.path.isfile(self.snapshot_path):
+            return folded, rules
+
+        with open(self.snapshot_path, "r") as file:
+            for number, line in enumerate(file):
+                line = line.strip()
+                if number == 0:
+                    header = _SNAPSHOT_HEADER.match(line)
+                    if header:
+                        folded = int(header.group(1))
+                        continue
+                tokens = parse_policy_line(line, token_counts)
+                if tokens is not None:
+                    rules.append(tokens)
+        return folded, rules
+
+    @staticmethod
+    def _apply_removals(rules, removals):
+        if not removals:
+            return rules
+        kept = []
+        for tokens in rules:
+            key = tuple(tokens)
+            if removals[key] > 0:
+                removals[key] -= 1
+            else:
+                kept.append(tokens)
+        removals.clear()
+        return kept
+
+    @staticmethod
+    def _apply_filter(rules, tokens):
+        ptype, field_index, field_values = tokens[0], int(tokens[1]), tokens[2:]
+        return [
+            rule
+            for rule in rules
+            if rule[0] != ptype
+            or not all(value == "" or rule[1 + field_index + i] == value for i, value in enumerate(field_values))
+        ]
+
+    def _read_segment(self, number, token_counts):
+        with open(self._segment_path(number), "r") as file:
+            content = file.read()
+        lines = content.split("\n")
+        # A final line without a newline is a torn write from a crash.
+        for line in lines[:-1]:
+            op, _, rest = line.partition(",")
+            op, rest = op.strip(), rest.strip()
+            if op in ("+", "-"):
+                tokens = parse_policy_line(rest, token_counts)
+            elif op == "*":
+                tokens = [token.strip() for token in rest.split(",")]
+            else:
+                continue
+            if tokens:
+                yield op, tokens
+
+    def _segment_path(self, number):
+        return f"{self.snapshot_path}.journal.{number}"
+
+    def _segment_numbers(self):
+        numbers = []
+        for path in glob.glob(glob.escape(self.snapshot_path) + ".journal.*"):
+            suffix = path.rsplit(".", 1)[-1]
+            if suffix.isdigit():
+                numbers.append(int(suffix))
+        return sorted(numbers)
+
+    def _open_journal(self):
+        self._journal = open(self._segment_path(self._segment), "a")
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+            self._journal = None
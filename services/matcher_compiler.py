@@ -0,0 +1,386 @@
+"""
+matcher_compiler.py
+===================
+Compiling the Model Matcher into Python
+
+casbin evaluates the `[matchers]` expression of `model.conf` with
+`simpleeval` for every rule it checks: the parsed expression is walked node
+by node, every name is looked up in a dict of request and rule values that
+is built for the rule, and every call goes through the function map. The
+`IndexedEnforcer` instead compiles the matcher once per model into a Python
+function specialized to the model's request and policy definitions:
+
+- request values are unpacked once per request into local variables,
+- rule values are read by position from the rule list (`p_obj` becomes
+  `rule[2]`), so no dict is built per rule,
+- `&&`, `||` and `!` become Python's `and`, `or` and `not`, which
+  short-circuit exactly like `simpleeval`,
+- functions (`g`, `regexMatch`, ...) are bound once per request instead of
+  being looked up per call, and a `regexMatch` against a constant pattern
+  uses a regex compiled ahead of time. Patterns that come from the rules are
+  compiled once by the enforcer's `PatternCache`.
+
+Only expressions made of comparisons, boolean operators, constants, request
+and rule fields and calls of known functions are compiled; they evaluate to
+the same values as `simpleeval`. Anything else (attribute access for ABAC,
+arithmetic, `eval()`, unknown names) makes `compile_matcher` return None and
+the enforcer keeps using `simpleeval` through `interpreted_matcher`, which
+has the same interface.
+
+Both evaluators are compared rule by rule, and the enforcer's decisions with
+and without compilation, by:
+
+    python -m services.matcher_compiler policy.csv
+
+Classes:
+--------
+- CompiledMatcher: A matcher expression compiled into a Python function.
+
+Functions:
+----------
+- normalize_matcher: Rewrites a matcher into a Python expression like casbin.
+- compile_matcher: Compiles a matcher for a model, or returns None.
+- interpreted_matcher: The `simpleeval` evaluator behind the same interface.
+- check_matcher: Compares compiled and interpreted evaluation on a policy.
+"""
+
+import argparse
+import ast
+import functools
+import keyword
+import os
+import random
+import re
+import sys
+
+from casbin.util.builtin_operators import regex_match, regex_match_func
+from simpleeval import DISALLOW_FUNCTIONS, MAX_STRING_LENGTH
+
+from services.policy_memory import PatternCache
+
+# Compiled matchers kept, keyed by the matcher and the model definitions.
+MATCHER_CACHE_SIZE = 64
+
+# Comparison operators compiled as they are; `simpleeval` maps each of them
+# to the operator Python uses for it.
+_COMPARE_OPERATORS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Is, ast.IsNot)
+
+
+class _NotCompilable(Exception):
+    """Raised for a construct the compiler leaves to `simpleeval`."""
+
+
+def normalize_matcher(matcher: str) -> str:
+    """Rewrites `&&`, `||` and `!` the way casbin does before evaluating a matcher."""
+    matcher = matcher.replace("&&", "and")
+    matcher = matcher.replace("||", "or")
+    return re.sub(r"!(?!=)", "not ", matcher)
+
+
+class CompiledMatcher:
+    """
+    A matcher expression compiled into a Python function.
+
+    Attributes:
+    - expression (str): The normalized matcher.
+    - source (str): The generated Python code.
+    - function_names (tuple): The functions the code calls, in the order
+        `bind` passes them.
+    - patterns (tuple): The constant `regexMatch` patterns compiled ahead
+        of time.
+    """
+
+    def __init__(self, expression: str, source: str, function_names: tuple, patterns: tuple):
+        self.expression = expression
+        self.source = source
+        self.function_names = function_names
+        self.patterns = patterns
+        namespace = {}
+        exec(compile(source, "<matcher>", "exec"), namespace)
+        self._bind = namespace["_bind"]
+        self._compiled_patterns = tuple(re.compile(pattern) for pattern in patterns)
+
+    def bind(self, functions: dict):
+        """
+        Binds the matcher to the functions of one enforcement.
+
+        Args:
+            functions (dict): The function map casbin would evaluate with.
+
+        Returns:
+            callable: `for_request(rvals)`, which returns the matcher of one
+                request as a function of a rule: `matcher(rule)`.
+        """
+        return self._bind(*(functions[name] for name in self.function_names), *self._compiled_patterns)
+
+
+class _Translator(ast.NodeTransformer):
+    """Rewrites a parsed matcher into the body of the generated function."""
+
+    def __init__(self, r_tokens, p_tokens, function_names, bind_patterns):
+        self.r_tokens = frozenset(r_tokens)
+        self.p_positions = {token: position for position, token in enumerate(p_tokens)}
+        self.function_names = function_names
+        self.bind_patterns = bind_patterns
+        self.called = []
+        self.patterns = []
+
+    def generic_visit(self, node):
+        raise _NotCompilable(type(node).__name__)
+
+    def visit_BoolOp(self, node):
+        node.values = [self.visit(value) for value in node.values]
+        return node
+
+    def visit_UnaryOp(self, node):
+        if not isinstance(node.op, ast.Not):
+            raise _NotCompilable(type(node.op).__name__)
+        node.operand = self.visit(node.operand)
+        return node
+
+    def visit_Compare(self, node):
+        if not all(isinstance(operator, _COMPARE_OPERATORS) for operator in node.ops):
+            raise _NotCompilable("operator")
+        node.left = self.visit(node.left)
+        node.comparators = [self.visit(comparator) for comparator in node.comparators]
+        return node
+
+    def visit_Tuple(self, node):
+        node.elts = [self.visit(element) for element in node.elts]
+        return node
+
+    visit_List = visit_Tuple
+
+    def visit_Constant(self, node):
+        # `simpleeval` refuses overlong literals; leave that error to it.
+        if hasattr(node.value, "__len__") and len(node.value) > MAX_STRING_LENGTH:
+            raise _NotCompilable("literal")
+        return node
+
+    def visit_Name(self, node):
+        if node.id in self.r_tokens:
+            return node
+        position = self.p_positions.get(node.id)
+        if position is None:
+            raise _NotCompilable(node.id)
+        return ast.Subscript(ast.Name("_rule", ast.Load()), ast.Constant(position), ast.Load())
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in self.function_names or node.keywords:
+            raise _NotCompilable("call")
+        if any(isinstance(argument, ast.Starred) for argument in node.args):
+            raise _NotCompilable("call")
+        name = node.func.id
+        arguments = [self.visit(argument) for argument in node.args]
+
+        pattern = arguments[1] if len(arguments) == 2 else None
+        if name == "regexMatch" and self.bind_patterns and isinstance(pattern, ast.Constant) and isinstance(
+            pattern.value, str
+        ):
+            try:
+                re.compile(pattern.value)
+            except re.error:
+                pass  # keep the call, which raises on every evaluation as before
+            else:
+                self.patterns.append(pattern.value)
+                match = ast.Call(
+                    ast.Attribute(ast.Name(f"_pattern_{len(self.patterns) - 1}", ast.Load()), "match", ast.Load()),
+                    [arguments[0]],
+                    [],
+                )
+                return ast.Compare(match, [ast.IsNot()], [ast.Constant(None)])
+
+        if name not in self.called:
+            self.called.append(name)
+        return ast.Call(ast.Name(f"_f_{name}", ast.Load()), arguments, [])
+
+
+def _is_standard_regex_match(function) -> bool:
+    """Tells whether `regexMatch` is `re.match`, so constant patterns can be compiled ahead."""
+    if function is regex_match or function is regex_match_func:
+        return True
+    return getattr(function, "__func__", None) is PatternCache.regex_match
+
+
+def compile_matcher(matcher: str, r_tokens, p_tokens, functions: dict):
+    """
+    Compiles a matcher for a model's request and policy definitions.
+
+    Compiled matchers are cached, so every enforcer of the same model shares
+    one.
+
+    Args:
+        matcher (str): The matcher as the model holds it, e.g.
+            `r_obj == p_obj && regexMatch(r_act, p_act)`.
+        r_tokens, p_tokens: The request and policy tokens (`r_sub`, ...).
+        functions (dict): The function map the matcher will be bound to.
+
+    Returns:
+        CompiledMatcher: The compiled matcher, or None if the matcher uses a
+            construct only `simpleeval` evaluates.
+    """
+    names = frozenset(name for name, function in functions.items() if function not in DISALLOW_FUNCTIONS)
+    bind_patterns = _is_standard_regex_match(functions.get("regexMatch"))
+    return _compile(normalize_matcher(matcher), tuple(r_tokens), tuple(p_tokens), names, bind_patterns)
+
+
+@functools.lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def _compile(expression, r_tokens, p_tokens, function_names, bind_patterns):
+    if not all(token.isidentifier() and not keyword.iskeyword(token) for token in r_tokens):
+        return None
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+        translator = _Translator(r_tokens, p_tokens, function_names, bind_patterns)
+        body = translator.visit(tree.body)
+    except (SyntaxError, _NotCompilable):
+        return None
+
+    parameters = [f"_f_{name}" for name in translator.called]
+    parameters += [f"_pattern_{position}" for position in range(len(translator.patterns))]
+    unpack = f"        {', '.join(r_tokens)}, = _request\n" if r_tokens else ""
+    source = (
+        f"def _bind({', '.join(parameters)}):\n"
+        f"    def _for_request(_request):\n"
+        f"{unpack}"
+        f"        def _matcher(_rule):\n"
+        f"            return {ast.unparse(body)}\n"
+        f"        return _matcher\n"
+        f"    return _for_request\n"
+    )
+    return CompiledMatcher(expression, source, tuple(translator.called), tuple(translator.patterns))
+
+
+def interpreted_matcher(evaluator, r_tokens, p_tokens):
+    """
+    Wraps a `simpleeval` evaluator in the interface of `CompiledMatcher.bind`.
+
+    Args:
+        evaluator: casbin's `SimpleEval` of the matcher.
+        r_tokens, p_tokens: The request and policy tokens.
+
+    Returns:
+        callable: `for_request(rvals)`, returning `matcher(rule)`.
+    """
+
+    def for_request(rvals):
+        r_parameters = dict(zip(r_tokens, rvals))
+
+        def matcher(rule):
+            return evaluator.eval(dict(r_parameters, **dict(zip(p_tokens, rule))))
+
+        return matcher
+
+    return for_request
+
+
+def check_matcher(enforcer, requests: list, rules_per_request: int = 200, seed: int = 0) -> list:
+    """
+    Compares compiled and interpreted evaluation of an `IndexedEnforcer`.
+
+    Every request is evaluated against its candidate rules and
+    `rules_per_request` random rules with both the full matcher and, with a
+    subject resolver, the residual matcher; then the enforcer decides all
+    requests with and without compilation.
+
+    Args:
+        enforcer (IndexedEnforcer): The enforcer with the loaded policy.
+        requests (list): Request tuples, e.g. `(sub, obj, act, req_body)`.
+        rules_per_request (int): Random rules evaluated per request.
+        seed (int): Seed of the rule sample.
+
+    Returns:
+        list: `(request, rule, compiled, interpreted)` for every difference;
+            `rule` is None for a different decision. An evaluation that raises
+            is reported as "error".
+    """
+    generator = random.Random(seed)
+    model = enforcer.get_model()
+    r_tokens, p_tokens = model["r"]["r"].tokens, model["p"]["p"].tokens
+    rules = model["p"]["p"].policy
+    functions = enforcer._enforce_functions()
+
+    matchers = [model["m"]["m"].value]
+    if enforcer.subject_resolver is not None:
+        matchers.append(enforcer._matcher(True))
+    evaluators = []
+    for matcher in matchers:
+        compiled = compile_matcher(matcher, r_tokens, p_tokens, functions)
+        if compiled is None:
+            continue
+        interpreted = interpreted_matcher(enforcer._get_expression(matcher, functions), r_tokens, p_tokens)
+        evaluators.append((compiled.bind(functions), interpreted))
+
+    differences = []
+    for request in requests:
+        sample = generator.sample(rules, min(rules_per_request, len(rules)))
+        if enforcer.policy_index is not None:
+            sample += [entry.rule for entry in enforcer.policy_index.candidates(request[r_tokens.index("r_obj")])]
+        for compiled, interpreted in evaluators:
+            actual_matcher, expected_matcher = compiled(request), interpreted(request)
+            for rule in sample:
+                actual, expected = _outcome(actual_matcher, rule), _outcome(expected_matcher, rule)
+                if actual != expected:
+                    differences.append((request, rule, actual, expected))
+
+    compile_matchers = enforcer.compile_matchers
+    try:
+        decisions = []
+        for enabled in (True, False):
+            enforcer.compile_matchers = enabled
+            decisions.append(enforcer.batch_enforce(requests))
+    finally:
+        enforcer.compile_matchers = compile_matchers
+    differences += [
+        (request, None, compiled, interpreted)
+        for request, compiled, interpreted in zip(requests, *decisions)
+        if compiled != interpreted
+    ]
+    return differences
+
+
+def _outcome(matcher, rule):
+    """The result of a matcher with its type, or "error" if it raises."""
+    try:
+        result = matcher(rule)
+    except Exception:
+        return "error"
+    return type(result), result
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the compiled matcher with simpleeval on a casbin policy.")
+    parser.add_argument("policy", help="the policy CSV to load")
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                        "model.conf"), help="the casbin model")
+    parser.add_argument("--requests", type=int, default=2000, help="random requests to evaluate")
+    parser.add_argument("--rules", type=int, default=200, help="random rules evaluated per request")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the requests and rules")
+    parser.add_argument("--show", action="store_true", help="print the generated code")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from services.enforcer import IndexedEnforcer
+    from services.policy_compactor import sample_requests
+
+    arguments = parse_arguments(argv)
+    enforcer = IndexedEnforcer(arguments.model, arguments.policy)
+    model = enforcer.get_model()
+    r_tokens, p_tokens = model["r"]["r"].tokens, model["p"]["p"].tokens
+    compiled = compile_matcher(model["m"]["m"].value, r_tokens, p_tokens, enforcer._enforce_functions())
+    if compiled is None:
+        print("the matcher is not compiled; every check uses simpleeval")
+        return 0
+    if arguments.show:
+        print(compiled.source)
+
+    requests = sample_requests(model["p"]["p"].policy, p_tokens, arguments.requests, arguments.seed)
+    differences = check_matcher(enforcer, requests, arguments.rules, arguments.seed)
+    print(f"{len(requests)} requests checked, {len(differences)} differences")
+    for request, rule, compiled_result, interpreted_result in differences[:20]:
+        print(f"difference {request} {rule}: compiled {compiled_result}, simpleeval {interpreted_result}")
+    return 1 if differences else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+metrics.py
+==========
+Prometheus Metrics for the Authorization Hot Paths
+
+A small in-process registry rendered in the Prometheus text format by the
+`/metrics` route. It has two kinds of metrics:
+
+- Instruments recorded on the hot path: `Counter` and `Histogram`. Each
+  thread records into its own cells (the event loop and every enforcement
+  pool worker), so recording takes no lock and never contends; a scrape adds
+  the cells of all threads up. Histograms are pre-bucketed, so an observation
+  is one `bisect` and two additions.
+- Collectors, called at scrape time, that turn the counters the services
+  already keep (decision cache, enforcement pool, subject resolver, policy
+  watcher, router, ...) into samples, so those cost nothing between scrapes.
+
+The instruments used by the services are defined here, on `REGISTRY`.
+
+Classes:
+--------
+- Counter: Monotonic counter with labels.
+- Histogram: Pre-bucketed histogram with labels.
+- MetricsRegistry: Holds instruments and collectors and renders them.
+
+Functions:
+----------
+- route_family: The resource family (job, catalog, ...) of a request path.
+"""
+
+import bisect
+import math
+import re
+import threading
+
+# Upper bounds of the authorization latency buckets, in seconds.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Upper bounds of the rules-evaluated-per-decision buckets.
+RULE_COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384)
+
+# Upper bounds of the policy save duration buckets, in seconds.
+SAVE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+_ROUTE_FAMILY = re.compile(r"/v1/(job|catalog|schema|table|bucket|file)/")
+
+
+def route_family(path: str) -> str:
+    """
+    Returns the resource family of a request path.
+
+    Args:
+        path (str): The request path, e.g. `/workspace-service/v1/catalog/detail`.
+
+    Returns:
+        str: `job`, `catalog`, `schema`, `table`, `bucket`, `file` or `other`.
+    """
+    match = _ROUTE_FAMILY.search(path)
+    return match.group(1) if match else "other"
+
+
+class _Instrument:
+    """Keeps one cell dict per recording thread, summed up on collection."""
+
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _cells(self):
+        try:
+            return self._local.cells
+        except AttributeError:
+            # Once per thread; the cells outlive the thread so no count is lost.
+            cells = self._local.cells = {}
+            with self._shards_lock:
+                self._shards.append(cells)
+            return cells
+
+    def _snapshots(self):
+        with self._shards_lock:
+            shards = list(self._shards)
+        # Copying a dict holds the GIL, so a recording thread cannot resize it meanwhile.
+        return [dict(shard) for shard in shards]
+
+
+class Counter(_Instrument):
+    """
+    Monotonic counter.
+
+    Attributes:
+    - name (str): The metric name, ending in `_total`.
+    - documentation (str): The `# HELP` text.
+    - labelnames (tuple): Names of the label values passed to `inc`.
+    """
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, labels: tuple = ()):
+        """Adds `amount` to the counter of the label values `labels`."""
+        cells = self._cells()
+        cells[labels] = cells.get(labels, 0) + amount
+
+    def collect(self) -> list:
+        """Returns `(suffix, labels, value)` samples summed over all threads."""
+        totals = {}
+        for shard in self._snapshots():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0) + value
+        return [("", dict(zip(self.labelnames, labels)), value) for labels, value in sorted(totals.items())]
+
+
+class Histogram(_Instrument):
+    """
+    Histogram with fixed buckets.
+
+    Attributes:
+    - name (str): The metric name.
+    - documentation (str): The `# HELP` text.
+    - labelnames (tuple): Names of the label values passed to `observe`.
+    - buckets (tuple): Sorted upper bounds; `+Inf` is implied.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, labels: tuple = ()):
+        """Records one observation for the label values `labels`."""
+        cells = self._cells()
+        counts = cells.get(labels)
+        if counts is None:
+            # One count per bucket, one for `+Inf`, then the sum.
+            counts = cells[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def collect(self) -> list:
+        """Returns the cumulative `_bucket`, `_sum` and `_count` samples."""
+        totals = {}
+        for shard in self._snapshots():
+            for labels, counts in shard.items():
+                counts = list(counts)
+                total = totals.get(labels)
+                if total is None:
+                    totals[labels] = counts
+                else:
+                    totals[labels] = [a + b for a, b in zip(total, counts)]
+
+        samples = []
+        for labels, counts in sorted(totals.items()):
+            label_values = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(("_bucket", dict(label_values, le=_format_value(bound)), cumulative))
+            samples.append(("_sum", label_values, counts[-1]))
+            samples.append(("_count", label_values, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Instruments and collectors rendered together by `render`.
+
+    A collector is a callable returning `(name, kind, documentation, samples)`
+    tuples, where `kind` is `gauge` or `counter` and `samples` is a list of
+    `(labels, value)` pairs with `labels` a dict. A collector that raises is
+    skipped, so one broken service cannot take the endpoint down.
+    """
+
+    def __init__(self):
+        self._instruments = []
+        self._collectors = []
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        """Creates and registers a `Counter`."""
+        counter = Counter(name, documentation, labelnames)
+        self._instruments.append(counter)
+        return counter
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        """Creates and registers a `Histogram`."""
+        histogram = Histogram(name, documentation, labelnames, buckets)
+        self._instruments.append(histogram)
+        return histogram
+
+    def register_collector(self, collector):
+        """Adds a callable that reports samples at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Renders every metric in the Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for instrument in self._instruments:
+            _render_family(lines, instrument.name, instrument.kind, instrument.documentation,
+                           [(instrument.name + suffix, labels, value)
+                            for suffix, labels, value in instrument.collect()])
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception:
+                continue
+            for name, kind, documentation, samples in families:
+                _render_family(lines, name, kind, documentation,
+                               [(name, labels, value) for labels, value in samples])
+        return "\n".join(lines) + "\n"
+
+
+def _render_family(lines, name, kind, documentation, samples):
+    lines.append(f"# HELP {name} {_escape(documentation, help_text=True)}")
+    lines.append(f"# TYPE {name} {kind}")
+    for sample_name, labels, value in samples:
+        if labels:
+            label_text = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+            lines.append(f"{sample_name}{{{label_text}}} {_format_value(value)}")
+        else:
+            lines.append(f"{sample_name} {_format_value(value)}")
+
+
+def _escape(text, help_text=False):
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    return text if help_text else text.replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+ENFORCE_SECONDS = REGISTRY.histogram(
+    "authz_enforce_seconds",
+    "Duration of authorization checks, decision cache included, by route family.",
+    ("family",),
+    LATENCY_BUCKETS,
+)
+
+DECISIONS = REGISTRY.counter(
+    "authz_decisions_total",
+    "Authorization decisions by route family and outcome.",
+    ("family", "decision"),
+)
+
+RULES_EVALUATED = REGISTRY.histogram(
+    "authz_rules_evaluated",
+    "Candidate rules examined by the enforcer per decision.",
+    (),
+    RULE_COUNT_BUCKETS,
+)
+
+POLICY_SAVE_SECONDS = REGISTRY.histogram(
+    "authz_policy_save_seconds",
+    "Duration of policy flushes by storage kind.",
+    ("storage",),
+    SAVE_BUCKETS,
+)
+
+POLICY_SAVE_BYTES = REGISTRY.counter(
+    "authz_policy_save_bytes_total",
+    "Bytes written by policy flushes by storage kind.",
+    ("storage",),
+)
@@ -0,0 +1,160 @@
+"""
+pattern_set.py
+==============
+Matching One Value Against Many Regex Patterns
+
+Patterns that are genuine regular expressions (`.*`, `employee_.*`,
+`(dev|test)_workspace.*`, ...) cannot go into the prefix trie of
+`PolicyIndex`, so every such rule used to be matched on its own. A
+`PatternSet` matches a value against all of them at once and returns a bitmap
+of the matching pattern IDs (a Python int, bit `i` for the `i`-th pattern),
+so the results of several fields combine with `&` and `|`:
+
+- equal patterns (most rules share `.*`, `GET`, ...) are matched once, with
+  the bits of all their IDs,
+- match-all patterns (`""`, `.*`) need no matching at all,
+- plain literals (no regex syntax) are prefix tests, one dict lookup per
+  distinct literal length,
+- the remaining regexes are compiled into combined alternations of up to
+  `GROUP_SIZE` patterns. A value no pattern of a group matches is rejected by
+  one `match` call for the whole group; only the groups that match are
+  searched, by halves, for the patterns that do.
+
+Matching follows casbin's `regexMatch` (`re.match`, anchored at the start
+only). A pattern that does not compile is reported as matching every value,
+so the matcher still evaluates the rule and raises exactly as before.
+
+Classes:
+--------
+- PatternSet: A bitmap-returning matcher over a list of patterns.
+
+Functions:
+----------
+- iter_bits: The IDs set in a bitmap, in ascending order.
+"""
+
+import re
+
+# Patterns compiled into one combined alternation.
+GROUP_SIZE = 64
+
+# Fewer patterns than this are cheaper to match one by one than with a set.
+MIN_PATTERNS = 8
+
+# Patterns that match every value.
+MATCH_ALL_PATTERNS = frozenset(("", ".*"))
+
+# Regex syntax; a pattern without any is a plain literal, i.e. a prefix test.
+_REGEX_SYNTAX = re.compile(r"[.\\^$*+?{}\[\]()|]")
+
+# Syntax that changes meaning inside a combined alternation (back-references,
+# named groups, conditionals and inline global flags), so such patterns are
+# matched alone.
+_UNCOMBINABLE = re.compile(r"\\[1-9]|\(\?P|\(\?\(|\(\?[aiLmsux]+\)")
+
+
+def iter_bits(mask: int):
+    """Yields the positions of the set bits of `mask`, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class _Group:
+    """Up to `GROUP_SIZE` regexes behind one combined alternation."""
+
+    __slots__ = ("combined", "patterns", "masks", "halves")
+
+    def __init__(self, patterns, masks):
+        self.patterns = patterns
+        self.masks = masks
+        self.combined = re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+        self.halves = None
+
+    def match(self, value) -> int:
+        if self.combined.match(value) is None:
+            return 0
+        if len(self.patterns) == 1:
+            return self.masks[0]
+        if self.halves is None:
+            # Built on first use; most groups never match most values.
+            middle = len(self.patterns) // 2
+            self.halves = (
+                _Group(self.patterns[:middle], self.masks[:middle]),
+                _Group(self.patterns[middle:], self.masks[middle:]),
+            )
+        return self.halves[0].match(value) | self.halves[1].match(value)
+
+
+class PatternSet:
+    """
+    Matches a value against a list of `regexMatch` patterns in one call.
+
+    Attributes:
+    - size (int): Number of patterns (IDs run from 0 to `size - 1`).
+    - include_equal (bool): Whether a pattern also matches a value equal to
+        it, as in the `r.obj == p.obj || regexMatch(r.obj, p.obj)` clause.
+    """
+
+    def __init__(self, patterns, include_equal: bool = False):
+        masks = {}
+        for position, pattern in enumerate(patterns):
+            masks[pattern] = masks.get(pattern, 0) | (1 << position)
+
+        self.size = len(patterns)
+        self.include_equal = include_equal
+        self._equal = masks if include_equal else None
+        self._always = 0
+        # literal length -> literal -> mask
+        self._literals = {}
+        self._alone = []
+        combinable = []
+        for pattern, mask in masks.items():
+            if pattern in MATCH_ALL_PATTERNS:
+                self._always |= mask
+            elif not _REGEX_SYNTAX.search(pattern):
+                self._literals.setdefault(len(pattern), {})[pattern] = mask
+            elif _UNCOMBINABLE.search(pattern):
+                self._add_alone(pattern, mask)
+            else:
+                combinable.append((pattern, mask))
+
+        self._groups = []
+        for start in range(0, len(combinable), GROUP_SIZE):
+            chunk = combinable[start : start + GROUP_SIZE]
+            try:
+                self._groups.append(_Group([pattern for pattern, _ in chunk], [mask for _, mask in chunk]))
+            except re.error:
+                # Some pattern of the chunk does not compile: match them one by one.
+                for pattern, mask in chunk:
+                    self._add_alone(pattern, mask)
+
+    def _add_alone(self, pattern, mask):
+        try:
+            self._alone.append((re.compile(pattern), mask))
+        except re.error:
+            self._always |= mask
+
+    def match(self, value: str) -> int:
+        """
+        Returns the bitmap of the patterns that match `value`.
+
+        Args:
+            value (str): The request value, e.g. the requested object.
+
+        Returns:
+            int: Bit `i` is set when the `i`-th pattern matches.
+        """
+        mask = self._always
+        if self._equal is not None:
+            mask |= self._equal.get(value, 0)
+        for length, literals in self._literals.items():
+            if length <= len(value):
+                mask |= literals.get(value[:length], 0)
+        for group in self._groups:
+            mask |= group.match(value)
+        for regex, pattern_mask in self._alone:
+            if regex.match(value) is not None:
+                mask |= pattern_mask
+        return mask
@@ -0,0 +1,587 @@
+"""
+policy_compactor.py
+===================
+Removal of Redundant Policy Rules
+
+The `create-new` routes add rules without looking at what is already there,
+so a long-running policy only grows. With the `priority(p.eft) || deny`
+effect the first matching rule decides, which makes many rules provably
+irrelevant:
+
+- duplicate: a rule with the same subject, object, action and body
+  patterns and the same effect as an earlier rule (e.g. a repeated create).
+- shadowed: an earlier rule with a deciding effect matches every request
+  the rule matches, so the rule never decides (e.g. an owner rule under a
+  subtree the same user already owns at a higher precedence, or any rule of
+  `root` after its `.*` rule).
+- subsumed: a later rule of the same subject matches every request the rule
+  matches, has the same effect, and every rule in between has that effect
+  too, so the decision is the same without it. Only rules of the same
+  subject count, so the rules written for everyone (the final allow-all)
+  never absorb the grants written for a user.
+
+Every removal is proven on the patterns, not sampled. Containment is decided
+exactly for the pattern forms the routes write: a literal prefix (where `.`
+is a one-character wildcard) followed by one of the `constants.py` suffixes,
+`.*`, and plain literals (which `regexMatch` matches as prefixes). Anything
+else is only ever compared for equality. The witness of a removal (the
+earlier or later rule that makes it redundant) is always kept, so the
+removals are safe all together, not just one at a time.
+
+Owner rules (the `*_OWNER` priorities of `AccessLevel`) also record which
+resources exist: the resource registry is rebuilt from the policy at startup.
+They are therefore only removed as exact duplicates, never as shadowed or
+subsumed, so e.g. the owner rules of resources `root` created stay although
+`root`'s `.*` rule shadows them.
+
+Because a `.` in a prefix is a wildcard, `ws.catalog.schema(\\..*)?$` also
+matches `wsXcatalogYschema`, which `ws.catalog(\\..*)?$` does not. Rules
+under a workspace owner are therefore not shadowed by it; under an
+organization or bucket, whose separators `:` and `/` are literal, they are.
+
+The compactor runs offline on a policy file (with an additional
+differential check of the decisions before and after):
+
+    python -m services.policy_compactor policy.csv --output compacted.csv
+
+and online, as `PolicyCompactor`, which periodically removes the redundant
+rules of the running enforcer.
+
+Classes:
+--------
+- CompactionReport: The redundant rules found and how much the policy shrinks.
+- PolicyCompactor: Periodic online compaction of an `IndexedEnforcer`.
+
+Functions:
+----------
+- matcher_fields: How the matcher compares each policy field.
+- find_redundant_rules: Finds the redundant `p` rules of a model.
+- sample_requests: Requests that exercise a policy, for differential checks.
+- verify_compaction: Compares the decisions of two policies.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import time
+
+from casbin import persist
+from loguru import logger
+
+from constants import AccessLevel
+from services.policy_index import REGEX_METACHARACTERS, PolicyIndex, split_object_pattern
+
+# The effect under which first-match reasoning holds.
+PRIORITY_EFFECT = "priority(p_eft) || deny"
+
+# Patterns that match every value.
+MATCH_ALL_PATTERNS = frozenset(("", ".*"))
+
+# Priorities of the owner rules, which are only removed as exact duplicates.
+OWNER_PRIORITIES = frozenset(
+    level.value for name, level in AccessLevel.__members__.items() if name.endswith("_OWNER")
+)
+
+# Matcher clauses the compactor can reason about, by the kind of comparison.
+_CLAUSES = (
+    (re.compile(r"^\(g\(r_(\w+), p_\1\) \|\| regexMatch\(r_\1, p_\1\)\)$"), "subject"),
+    (re.compile(r"^\(r_(\w+) == p_\1 \|\| regexMatch\(r_\1, p_\1\)\)$"), "object"),
+    (re.compile(r"^regexMatch\(r_(\w+), p_\1\)$"), "regex"),
+)
+
+# The character each object suffix requires after the literal prefix.
+_SUFFIX_SEPARATORS = {"(\\..*)?$": ".", "(\\:.*)?$": ":", "(/.*)?$": "/"}
+
+DUPLICATE = "duplicate"
+SHADOWED = "shadowed"
+SUBSUMED = "subsumed"
+
+
+class CompactionReport:
+    """
+    The redundant rules of a policy.
+
+    Attributes:
+    - rules_before (int): Number of rules analyzed.
+    - removed (list): `(rule, reason, witness)` tuples, where `reason` is
+        `duplicate`, `shadowed` or `subsumed` and `witness` is the kept rule
+        that makes `rule` redundant.
+    - positions (list): Positions of the removed rules in evaluation order.
+        A rule listed more than once is only removed at these positions.
+    - seconds (float): Duration of the analysis.
+    """
+
+    def __init__(self, rules_before: int, removed: list, positions: list, seconds: float = 0.0):
+        self.rules_before = rules_before
+        self.removed = removed
+        self.positions = positions
+        self.seconds = seconds
+
+    @property
+    def rules_after(self) -> int:
+        return self.rules_before - len(self.removed)
+
+    def summary(self) -> dict:
+        """
+        Summarizes the report.
+
+        Returns:
+            dict: Rules before and after, removals by reason, the share of the
+                policy removed and the analysis time.
+        """
+        reasons = {DUPLICATE: 0, SHADOWED: 0, SUBSUMED: 0}
+        for _, reason, _ in self.removed:
+            reasons[reason] += 1
+        return {
+            "rules_before": self.rules_before,
+            "rules_after": self.rules_after,
+            **reasons,
+            "shrink_ratio": len(self.removed) / self.rules_before if self.rules_before else 0.0,
+            "seconds": self.seconds,
+        }
+
+
+def matcher_fields(model, ptype: str = "p") -> list:
+    """
+    Describes how the matcher compares each policy field.
+
+    Returns:
+        list: `(index, kind)` pairs for the fields of a `p` rule that the
+            matcher compares, `kind` being `subject`, `object` or `regex`.
+
+    Raises:
+        ValueError: If the effect is not `PRIORITY_EFFECT` or a matcher clause
+            is not a supported comparison.
+    """
+    if model["e"]["e"].value != PRIORITY_EFFECT:
+        raise ValueError(f"compaction requires the effect {PRIORITY_EFFECT!r}")
+
+    tokens = model["p"][ptype].tokens
+    fields = []
+    for clause in _split_conjunction(model["m"]["m"].value):
+        for pattern, kind in _CLAUSES:
+            match = pattern.match(clause)
+            if match and "p_" + match.group(1) in tokens:
+                fields.append((tokens.index("p_" + match.group(1)), kind))
+                break
+        else:
+            raise ValueError(f"cannot reason about the matcher clause {clause!r}")
+    return fields
+
+
+def find_redundant_rules(
+    model, rules: list = None, ptype: str = "p", kept_priorities=OWNER_PRIORITIES
+) -> CompactionReport:
+    """
+    Finds the duplicate, shadowed and subsumed rules of a policy.
+
+    Args:
+        model: The casbin model (for its tokens, matcher and effect).
+        rules (list): The rules in evaluation order; defaults to the model's.
+        ptype (str): The policy type.
+        kept_priorities (frozenset): Priorities of rules that are only
+            removed as exact duplicates of an earlier rule.
+
+    Returns:
+        CompactionReport: The rules that can be removed together.
+
+    Raises:
+        ValueError: If the model is not supported or the rules are not in
+            evaluation order.
+    """
+    started = time.perf_counter()
+    fields = matcher_fields(model, ptype)
+    tokens = model["p"][ptype].tokens
+    rules = model["p"][ptype].policy if rules is None else rules
+    priority_index = tokens.index("p_priority")
+    eft_index = tokens.index("p_eft") if "p_eft" in tokens else None
+    obj_index = next((index for index, kind in fields if kind == "object"), None)
+    sub_index = next((index for index, kind in fields if kind == "subject"), None)
+    if obj_index is None:
+        raise ValueError("compaction requires an object clause in the matcher")
+
+    priorities = []
+    for rule in rules:
+        if len(rule) != len(tokens) or not rule[priority_index].isdigit():
+            raise ValueError(f"rule {rule} has no numeric priority")
+        priorities.append(int(rule[priority_index]))
+    if any(a > b for a, b in zip(priorities, priorities[1:])):
+        raise ValueError("rules must be in evaluation (priority) order")
+
+    effects = [_effect(rule, eft_index) for rule in rules]
+    # allows[i] / denies[i]: allow / deny rules among the first i rules.
+    allows, denies = [0], [0]
+    for effect in effects:
+        allows.append(allows[-1] + (effect == "allow"))
+        denies.append(denies[-1] + (effect == "deny"))
+
+    index = PolicyIndex(obj_index)
+    for order, rule in enumerate(rules):
+        index.add(rule, order)
+
+    def same_effect_between(first, last, effect):
+        """Tells whether every rule strictly between two positions has `effect`."""
+        same = allows if effect == "allow" else denies
+        return same[last] - same[first + 1] == last - first - 1
+
+    def candidates(rule):
+        split = split_object_pattern(rule[obj_index])
+        if split is None:
+            return index.fallback
+        return index.candidates(split[0])
+
+    # Shadowed rules first: the first covering rule of a rule is never
+    # shadowed itself (whatever covers it comes earlier and covers the rule).
+    removed = {}
+    witnesses = set()
+    for position, rule in enumerate(rules):
+        kept = rule[priority_index] in kept_priorities
+        for entry in candidates(rule):
+            if entry.order >= position:
+                break
+            if effects[entry.order] in ("allow", "deny") and _covers(entry.rule, rule, fields):
+                same = effects[entry.order] == effects[position] and all(
+                    entry.rule[field] == rule[field] for field, _ in fields
+                )
+                if kept and not (same and entry.rule[priority_index] == rule[priority_index]):
+                    # Owner rules only go as duplicates; the earliest copy, their witness, stays.
+                    continue
+                removed[position] = (DUPLICATE if same else SHADOWED, entry.order)
+                witnesses.add(entry.order)
+                break
+
+    # Subsumed rules last to first, each backed by a later rule that stays.
+    if sub_index is not None:
+        for position in range(len(rules) - 1, -1, -1):
+            if position in removed or position in witnesses or effects[position] not in ("allow", "deny"):
+                continue
+            if rules[position][priority_index] in kept_priorities:
+                continue
+            rule = rules[position]
+            for entry in candidates(rule):
+                later = entry.order
+                if later <= position or later in removed:
+                    continue
+                if (
+                    entry.rule[sub_index] == rule[sub_index]
+                    and effects[later] == effects[position]
+                    and _covers(entry.rule, rule, fields)
+                    and same_effect_between(position, later, effects[position])
+                ):
+                    removed[position] = (SUBSUMED, later)
+                    witnesses.add(later)
+                    break
+
+    positions = sorted(removed)
+    entries = [(rules[position], removed[position][0], rules[removed[position][1]]) for position in positions]
+    return CompactionReport(len(rules), entries, positions, time.perf_counter() - started)
+
+
+def sample_requests(rules: list, tokens: list, count: int, seed: int = 0, extra_rules: list = ()) -> list:
+    """
+    Builds requests that exercise a policy.
+
+    Objects are taken from the literal prefixes of the rules (and one level
+    below them), subjects from the literal subjects plus an outsider, so the
+    requests hit the rules instead of falling through to the defaults. Every
+    rule of `extra_rules` (e.g. the removed ones) is exercised first.
+
+    Returns:
+        list: `(sub, obj, act, req_body)` tuples.
+    """
+    generator = random.Random(seed)
+    sub_index, obj_index = tokens.index("p_sub"), tokens.index("p_obj")
+    subjects = sorted({rule[sub_index] for rule in rules if not REGEX_METACHARACTERS.search(rule[sub_index])})
+    subjects.append("compactor_outsider")
+
+    def objects(rule):
+        split = split_object_pattern(rule[obj_index])
+        if split is None:
+            return [rule[obj_index], "compactor_object"]
+        prefix, suffix = split
+        separator = _SUFFIX_SEPARATORS.get(suffix, ".")
+        return [prefix, prefix + separator + "child"]
+
+    requests = []
+    for rule in list(extra_rules):
+        sub = rule[sub_index] if rule[sub_index] in subjects else generator.choice(subjects)
+        for obj in objects(rule):
+            for act in ("GET", "POST"):
+                requests.append((sub, obj, act, ""))
+                requests.append((generator.choice(subjects), obj, act, ""))
+
+    while rules and len(requests) < count + 4 * len(extra_rules):
+        rule = generator.choice(rules)
+        sub = rule[sub_index] if generator.random() < 0.5 and rule[sub_index] in subjects else generator.choice(subjects)
+        obj = generator.choice(objects(rule))
+        requests.append((sub, obj, generator.choice(("GET", "POST")), ""))
+    return requests
+
+
+def verify_compaction(model_text: str, before: dict, after: dict, requests: list) -> list:
+    """
+    Compares the decisions of two policies.
+
+    Args:
+        model_text (str): The casbin model.
+        before (dict), after (dict): `{(sec, ptype): rules}` of each policy.
+        requests (list): The requests to decide.
+
+    Returns:
+        list: `(request, before, after)` for every request decided differently.
+    """
+    from services.enforcer import IndexedEnforcer
+
+    enforcers = []
+    for sections in (before, after):
+        model = IndexedEnforcer.new_model(text=model_text)
+        enforcers.append(IndexedEnforcer(model, _RulesAdapter(sections)))
+    old, new = (enforcer.batch_enforce(requests) for enforcer in enforcers)
+    return [(request, a, b) for request, a, b in zip(requests, old, new) if a != b]
+
+
+class PolicyCompactor:
+    """
+    Removes redundant rules from a running `IndexedEnforcer` once per interval.
+
+    The rules are analyzed in a worker thread on a copy of the policy. The
+    removal happens on the event loop, where every policy change happens,
+    and only if the policy did not change during the analysis; otherwise the
+    next run tries again.
+
+    Attributes:
+    - enforcer (IndexedEnforcer): The enforcer to compact.
+    - persister (PolicyPersister): Persists the removals.
+    - interval (float): Seconds between two compactions.
+    - runs (int): Completed compactions.
+    - removed (int): Rules removed so far.
+    - last_report (CompactionReport): The report of the last compaction.
+    """
+
+    def __init__(self, enforcer, persister, interval: float = 3600):
+        self.enforcer = enforcer
+        self.persister = persister
+        self.interval = interval
+        self.runs = 0
+        self.removed = 0
+        self.last_report = None
+        self._task = None
+
+    async def compact(self):
+        """
+        Removes the redundant rules of the enforcer now.
+
+        Returns:
+            CompactionReport: The analysis, or None if the policy changed
+                during it and nothing was removed.
+        """
+        with self.enforcer.policy_lock:
+            generation = self.enforcer.policy_generation
+            rules = list(self.enforcer.get_model()["p"]["p"].policy)
+        report = await asyncio.to_thread(find_redundant_rules, self.enforcer.get_model(), rules)
+        if report.positions:
+            if not self.enforcer.remove_rules_at(report.positions, generation):
+                return None
+            self.persister.request_save()
+        elif self.enforcer.policy_generation != generation:
+            return None
+        self.runs += 1
+        self.removed += len(report.removed)
+        self.last_report = report
+        logger.info(f"Policy compaction: {report.summary()}")
+        return report
+
+    def start(self):
+        """Starts compacting periodically on the running event loop."""
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """Stops the periodic compaction (for shutdown)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        """
+        Returns the compactor counters.
+
+        Returns:
+            dict: Completed runs, rules removed and the last report's summary.
+        """
+        summary = self.last_report.summary() if self.last_report is not None else None
+        return {"runs": self.runs, "removed": self.removed, "last": summary}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.compact()
+            except Exception as exc:
+                logger.error(f"Policy compaction failed: {exc}")
+
+
+class _RulesAdapter(persist.Adapter):
+    """Loads rules that are already in memory."""
+
+    def __init__(self, sections):
+        self.sections = sections
+
+    def load_policy(self, model):
+        for (sec, ptype), rules in self.sections.items():
+            for rule in rules:
+                model.add_policy(sec, ptype, list(rule))
+
+
+def _split_conjunction(matcher):
+    """Splits a matcher at its top-level `&&`."""
+    clauses, depth, start = [], 0, 0
+    for position, char in enumerate(matcher):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0 and matcher.startswith("&&", position):
+            clauses.append(matcher[start:position].strip())
+            start = position + 2
+    clauses.append(matcher[start:].strip())
+    return clauses
+
+
+def _effect(rule, eft_index):
+    return "allow" if eft_index is None else rule[eft_index]
+
+
+def _covers(outer, inner, fields) -> bool:
+    """Tells whether `outer` provably matches every request `inner` matches."""
+    for index, kind in fields:
+        a, b = outer[index], inner[index]
+        if a == b or a in MATCH_ALL_PATTERNS:
+            continue
+        if kind == "subject":
+            # `g` makes any other subject pair incomparable.
+            return False
+        if kind == "regex" and not _literal_prefix_covers(a, b):
+            return False
+        if kind == "object" and not _object_covers(a, b):
+            return False
+    return True
+
+
+def _literal_prefix_covers(outer, inner):
+    """`regexMatch` of plain literals is a prefix test."""
+    plain = re.compile(r"^[^.\\^$*+?{}\[\]()|]*$")
+    return bool(plain.match(outer) and plain.match(inner)) and inner.startswith(outer)
+
+
+def _object_covers(outer, inner):
+    """
+    Tells whether the object pattern `outer` matches every object `inner` does.
+
+    `inner` also matches the object equal to its own text, so `outer` must
+    match that string as well.
+    """
+    outer_split, inner_split = split_object_pattern(outer), split_object_pattern(inner)
+    if outer_split is None or inner_split is None:
+        return False
+    try:
+        if not re.match(outer, inner):
+            return False
+    except re.error:
+        return False
+
+    (outer_prefix, outer_suffix), (inner_prefix, inner_suffix) = outer_split, inner_split
+    if len(inner_prefix) < len(outer_prefix):
+        return False
+    for outer_char, inner_char in zip(outer_prefix, inner_prefix):
+        # A literal character is only covered by itself, a wildcard by a wildcard.
+        if outer_char != "." and (inner_char != outer_char or inner_char == "."):
+            return False
+
+    if outer_suffix == "":
+        # No suffix: `re.match` accepts anything after the prefix.
+        return True
+    separator = _SUFFIX_SEPARATORS[outer_suffix]
+    if len(inner_prefix) == len(outer_prefix):
+        return inner_suffix == outer_suffix
+    # The inner prefix goes on: its next character must be the literal separator.
+    next_char = inner_prefix[len(outer_prefix)]
+    return next_char == separator and next_char != "."
+
+
+def _policy_sections(model):
+    sections = {}
+    for sec in ("p", "g"):
+        if sec not in model.keys():
+            continue
+        for ptype, ast in model[sec].items():
+            sections[(sec, ptype)] = [list(rule) for rule in ast.policy]
+    return sections
+
+
+def _write_policy(path, sections):
+    lines = [ptype + ", " + ", ".join(rule) for (_, ptype), rules in sections.items() for rule in rules]
+    with open(path, "w") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Remove redundant rules from a casbin policy file.")
+    parser.add_argument("policy", help="the policy CSV to compact")
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                        "model.conf"), help="the casbin model")
+    parser.add_argument("--output", help="file the compacted policy is written to")
+    parser.add_argument("--verify", type=int, default=10000, help="random requests compared before and after")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the requests")
+    parser.add_argument("--list", action="store_true", help="print every removed rule with its witness")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from services.enforcer import IndexedEnforcer
+
+    arguments = parse_arguments(argv)
+    with open(arguments.model, "r") as file:
+        model_text = file.read()
+    enforcer = IndexedEnforcer(arguments.model, arguments.policy)
+    model = enforcer.get_model()
+
+    report = find_redundant_rules(model)
+    if arguments.list:
+        for rule, reason, witness in report.removed:
+            print(f"{reason:<9} {', '.join(rule)}  <- {', '.join(witness)}")
+
+    before = _policy_sections(model)
+    removed = set(report.positions)
+    after = dict(before)
+    after[("p", "p")] = [rule for position, rule in enumerate(before[("p", "p")]) if position not in removed]
+
+    tokens = model["p"]["p"].tokens
+    requests = sample_requests(before[("p", "p")], tokens, arguments.verify, arguments.seed,
+                               [rule for rule, _, _ in report.removed])
+    mismatches = verify_compaction(model_text, before, after, requests)
+    summary = report.summary()
+    print(
+        f"{summary['rules_before']} rules -> {summary['rules_after']} "
+        f"({summary['shrink_ratio']:.1%} removed: {summary[DUPLICATE]} duplicate, {summary[SHADOWED]} shadowed, "
+        f"{summary[SUBSUMED]} subsumed) in {summary['seconds']:.2f}s; "
+        f"{len(requests)} requests verified, {len(mismatches)} mismatches"
+    )
+    if mismatches:
+        for request, old, new in mismatches[:20]:
+            print(f"mismatch {request}: {old} -> {new}")
+        return 1
+
+    if arguments.output:
+        _write_policy(arguments.output, after)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
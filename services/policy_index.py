@@ -0,0 +1,450 @@
+"""
+policy_index.py
+===============
+Object-Pattern Index for Casbin Policy Rules
+
+The routes store every resource as a literal object prefix followed by one of
+the trailing suffixes from `constants.py`, e.g. `ws.catalog_1(\\..*)?$` or
+`org1:bucket(/.*)?$`. This module indexes those prefixes in a trie keyed by
+`.`, `:` and `/` path segments, so a request object only has to be compared
+with the rules on its ancestor chain. Patterns that are real regular
+expressions (`.*`, alternations, character classes, ...) are kept in a
+fallback list. A long fallback list is narrowed with a `PatternSet`, which
+matches the request object against all of its patterns at once, so only the
+fallback rules whose pattern matches become candidates.
+
+The index never decides on its own: it returns *candidate* rules, which the
+enforcer still verifies with the model matcher. A candidate set is always a
+superset of the rules that can match, so decisions are unchanged. Every rule
+list is kept sorted by evaluation order, and candidates are produced lazily
+by merging those lists, so the enforcer can stop at the first rule that
+matches without looking at the rest.
+
+`SubjectPartitionedIndex` splits the rules further by subject: one
+`PolicyIndex` per concrete `p.sub` plus a shared one for subject patterns, so
+a check only looks at the buckets of the subjects the requester matches.
+
+Classes:
+--------
+- PolicyIndex: Trie of object prefixes plus the fallback list of regex rules.
+- SubjectPartitionedIndex: A PolicyIndex per subject plus a shared bucket.
+"""
+
+import bisect
+import heapq
+import re
+import sys
+
+from constants import (
+    optional_trailing_dot,
+    optional_trailing_colon,
+    optional_trailing_forward_slash,
+)
+from services.pattern_set import MIN_PATTERNS, PatternSet, iter_bits
+
+# Suffixes appended by the `create-new` routes after the literal object prefix.
+OBJECT_SUFFIXES = (
+    optional_trailing_dot,
+    optional_trailing_colon,
+    optional_trailing_forward_slash,
+)
+
+# Characters that make a prefix a genuine regular expression. A bare `.` is
+# allowed: it is a single-character wildcard and is used as a path separator.
+REGEX_METACHARACTERS = re.compile(r"[\\^$*+?{}\[\]()|]")
+
+# Path separators of the object hierarchy. `.` is a regex wildcard, `:` and
+# `/` are literal characters.
+SEGMENT_SEPARATORS = re.compile(r"([.:/])")
+_SEPARATOR_CHARACTERS = frozenset(".:/")
+
+
+def split_object_pattern(pattern: str):
+    """
+    Splits an object pattern into its literal prefix and known suffix.
+
+    Args:
+        pattern (str): The `p.obj` value of a policy rule.
+
+    Returns:
+        tuple: `(prefix, suffix)` if the pattern is a literal prefix followed by
+            one of `OBJECT_SUFFIXES` (or by nothing), otherwise None.
+    """
+    prefix, suffix = pattern, ""
+    for known_suffix in OBJECT_SUFFIXES:
+        if pattern.endswith(known_suffix):
+            prefix, suffix = pattern[: -len(known_suffix)], known_suffix
+            break
+
+    if REGEX_METACHARACTERS.search(prefix):
+        return None
+    return prefix, suffix
+
+
+def is_literal_pattern(pattern: str) -> bool:
+    """
+    Tells whether a pattern has no regex syntax at all, not even a `.`.
+
+    `regexMatch` (`re.match`) then simply tests whether the pattern is a
+    prefix of the value.
+    """
+    return "." not in pattern and not REGEX_METACHARACTERS.search(pattern)
+
+
+def split_segments(prefix: str):
+    """
+    Splits a literal prefix into `(separator, segment)` pairs.
+
+    The first pair has no separator (None); every following pair records the
+    separator that precedes its segment, e.g. `org:dir/file` becomes
+    `[(None, "org"), (":", "dir"), ("/", "file")]`.
+    """
+    parts = SEGMENT_SEPARATORS.split(prefix)
+    segments = [(None, parts[0])]
+    segments.extend(zip(parts[1::2], parts[2::2]))
+    return segments
+
+
+# Shared `edges` tuples; most nodes have the same one or two kinds of children.
+_EDGE_SETS = {}
+
+
+def _child_key(separator, segment):
+    """The key of a child: its segment, preceded by its separator if any."""
+    return segment if separator is None else separator + segment
+
+
+class _TrieNode:
+    """
+    A position in the trie right after a complete path segment.
+
+    Most nodes are leaves, so all attributes stay None until they are needed.
+    The children of a node share one dict keyed by separator and segment, e.g.
+    `.catalog_1`, and `edges` lists the `(separator, segment length)` pairs
+    they have, so a lookup knows which slices of the object to try.
+    """
+
+    __slots__ = ("rules", "edges", "children")
+
+    def __init__(self):
+        # Rules whose literal prefix ends at this node.
+        self.rules = None
+        # (separator, segment length) pairs of the children
+        self.edges = None
+        # _child_key(separator, segment) -> child node
+        self.children = None
+
+    def is_empty(self):
+        return not self.rules and not self.children
+
+    def add_edge(self, separator, length):
+        edges = (self.edges or ()) + ((separator, length),)
+        self.edges = _EDGE_SETS.setdefault(edges, edges)
+
+    def refresh_edges(self):
+        """Recomputes `edges` from the remaining children."""
+        pairs = []
+        for key in self.children or ():
+            if key[:1] in _SEPARATOR_CHARACTERS:
+                pair = (key[0], len(key) - 1)
+            else:
+                pair = (None, len(key))
+            if pair not in pairs:
+                pairs.append(pair)
+        edges = tuple(pairs) or None
+        self.edges = _EDGE_SETS.setdefault(edges, edges) if edges else None
+
+
+class IndexedRule:
+    """A policy rule together with its position in the evaluation order."""
+
+    __slots__ = ("order", "rule")
+
+    def __init__(self, order, rule):
+        self.order = order
+        self.rule = rule
+
+    def __lt__(self, other):
+        return self.order < other.order
+
+
+class PolicyIndex:
+    """
+    Indexes policy rules by the literal prefix of their object pattern.
+
+    Attributes:
+    - obj_index (int): Position of the object field inside a policy rule.
+    - fallback (list): Rules whose object pattern is a genuine regex.
+    """
+
+    def __init__(self, obj_index: int):
+        self.obj_index = obj_index
+        self.root = _TrieNode()
+        self.fallback = []
+        self.size = 0
+        # PatternSet over the fallback object patterns, built on first use.
+        self._fallback_set = None
+
+    def add(self, rule, order):
+        """
+        Adds a rule to the index.
+
+        Args:
+            rule (list): The policy rule as stored in the casbin model.
+            order (tuple): Sort key giving the rule's place in evaluation order.
+        """
+        entry = IndexedRule(order, rule)
+        split = split_object_pattern(rule[self.obj_index])
+        if split is None:
+            bisect.insort_right(self.fallback, entry)
+            self._fallback_set = None
+        else:
+            node = self._node_for(split[0])
+            if node.rules is None:
+                node.rules = [entry]
+            else:
+                bisect.insort_right(node.rules, entry)
+        self.size += 1
+
+    def remove(self, rule):
+        """
+        Removes the earliest indexed copy of a rule.
+
+        Returns:
+            bool: True if the rule was found and removed.
+        """
+        split = split_object_pattern(rule[self.obj_index])
+        if split is None:
+            removed = self._remove_entry(self.fallback, rule)
+            self._fallback_set = None
+        else:
+            path = self._path_for(split[0])
+            if path is None:
+                return False
+            node = path[-1][0]
+            removed = node.rules is not None and self._remove_entry(node.rules, rule)
+            if removed:
+                if not node.rules:
+                    node.rules = None
+                self._prune(path)
+
+        if removed:
+            self.size -= 1
+        return removed
+
+    def contains(self, rule) -> bool:
+        """Tells whether a rule is indexed, looking only at its object's node."""
+        split = split_object_pattern(rule[self.obj_index])
+        if split is None:
+            entries = self.fallback
+        else:
+            path = self._path_for(split[0])
+            entries = path[-1][0].rules if path is not None else None
+        return entries is not None and any(entry.rule == rule for entry in entries)
+
+    def candidates(self, obj: str):
+        """
+        Iterates over the rules that may match a request object.
+
+        Args:
+            obj (str): The requested object, e.g. `ws.catalog.schema.table`.
+
+        Returns:
+            Iterable[IndexedRule]: Indexed rules on the ancestor chain of `obj`
+                plus the fallback rules whose pattern matches `obj` (every
+                fallback rule, if there are few), in evaluation order. The
+                rules are merged lazily, so stopping early skips the rest.
+        """
+        fallback = self._fallback_candidates(obj)
+        chain = [fallback] if fallback else []
+        self._collect(self.root, obj, 0, chain)
+        if len(chain) == 1:
+            return chain[0]
+        return heapq.merge(*chain)
+
+    def _fallback_candidates(self, obj):
+        if len(self.fallback) < MIN_PATTERNS:
+            return self.fallback
+        if self._fallback_set is None:
+            self._fallback_set = PatternSet([entry.rule[self.obj_index] for entry in self.fallback], True)
+        mask = self._fallback_set.match(obj)
+        return [self.fallback[position] for position in iter_bits(mask)]
+
+    def _collect(self, node, obj, position, chain):
+        if node.rules:
+            chain.append(node.rules)
+        if node.edges is None:
+            return
+        children = node.children
+        length = len(obj)
+        for separator, segment_length in node.edges:
+            if separator is None:
+                end = position + segment_length
+                key = obj[position:end]
+            elif position < length and (separator == "." or obj[position] == separator):
+                # A `.` in a pattern is a wildcard and consumes any character.
+                end = position + 1 + segment_length
+                key = separator + obj[position + 1:end]
+            else:
+                continue
+
+            if end > length:
+                continue
+            child = children.get(key)
+            if child is not None:
+                self._collect(child, obj, end, chain)
+
+    def _node_for(self, prefix):
+        node = self.root
+        for separator, segment in split_segments(prefix):
+            key = _child_key(separator, segment)
+            if node.children is None:
+                node.children = {}
+            child = node.children.get(key)
+            if child is None:
+                # Keys such as `.catalog_1` repeat under every workspace.
+                child = node.children[sys.intern(key)] = _TrieNode()
+                if (separator, len(segment)) not in (node.edges or ()):
+                    node.add_edge(separator, len(segment))
+            node = child
+        return node
+
+    def _path_for(self, prefix):
+        """Returns the `(node, separator, segment)` chain for a prefix, or None."""
+        node = self.root
+        path = [(node, None, None)]
+        for separator, segment in split_segments(prefix):
+            if node.children is None:
+                return None
+            child = node.children.get(_child_key(separator, segment))
+            if child is None:
+                return None
+            path.append((child, separator, segment))
+            node = child
+        return path
+
+    @staticmethod
+    def _prune(path):
+        """Drops nodes that no longer hold rules or children."""
+        for depth in range(len(path) - 1, 0, -1):
+            node, separator, segment = path[depth]
+            if not node.is_empty():
+                return
+            parent = path[depth - 1][0]
+            del parent.children[_child_key(separator, segment)]
+            if not parent.children:
+                parent.children = None
+            parent.refresh_edges()
+
+    @staticmethod
+    def _remove_entry(entries, rule):
+        # Entries are sorted, so the first equal rule is the earliest one.
+        for position, entry in enumerate(entries):
+            if entry.rule == rule:
+                del entries[position]
+                return True
+        return False
+
+
+class SubjectPartitionedIndex:
+    """
+    Partitions policy rules by subject, each partition indexed by object.
+
+    Rules with a literal subject go to that subject's `PolicyIndex`; rules
+    whose subject is a pattern (`.*`, `employee_.*`, ...) share one bucket.
+
+    Attributes:
+    - obj_index (int): Position of the object field inside a policy rule.
+    - sub_index (int): Position of the subject field inside a policy rule.
+    - buckets (dict): Literal subject -> PolicyIndex of its rules.
+    - shared (PolicyIndex): Rules whose subject is a pattern.
+    """
+
+    def __init__(self, obj_index: int, sub_index: int):
+        self.obj_index = obj_index
+        self.sub_index = sub_index
+        self.buckets = {}
+        self.shared = PolicyIndex(obj_index)
+
+    @property
+    def size(self):
+        return self.shared.size + sum(bucket.size for bucket in self.buckets.values())
+
+    def add(self, rule, order):
+        """Adds a rule to its subject's bucket (see `PolicyIndex.add`)."""
+        subject = rule[self.sub_index]
+        if not is_literal_pattern(subject):
+            self.shared.add(rule, order)
+            return
+        bucket = self.buckets.get(subject)
+        if bucket is None:
+            bucket = self.buckets[subject] = PolicyIndex(self.obj_index)
+        bucket.add(rule, order)
+
+    def remove(self, rule):
+        """Removes the earliest indexed copy of a rule (see `PolicyIndex.remove`)."""
+        subject = rule[self.sub_index]
+        if not is_literal_pattern(subject):
+            return self.shared.remove(rule)
+        bucket = self.buckets.get(subject)
+        if bucket is None or not bucket.remove(rule):
+            return False
+        if bucket.size == 0:
+            del self.buckets[subject]
+        return True
+
+    def contains(self, rule) -> bool:
+        """Tells whether a rule is indexed (see `PolicyIndex.contains`)."""
+        subject = rule[self.sub_index]
+        if not is_literal_pattern(subject):
+            return self.shared.contains(rule)
+        bucket = self.buckets.get(subject)
+        return bucket is not None and bucket.contains(rule)
+
+    def candidates(self, obj: str):
+        """Iterates over the candidate rules of every bucket, in evaluation order."""
+        return self._merge(obj, [self.shared] + list(self.buckets.values()))
+
+    def candidates_for(self, obj: str, subjects):
+        """
+        Iterates over the candidate rules of some subjects.
+
+        Args:
+            obj (str): The requested object.
+            subjects (set): The policy subjects the requester matches; buckets
+                of other literal subjects are never looked at.
+
+        Returns:
+            Iterable[IndexedRule]: Candidates from the shared bucket and the
+                buckets of `subjects`, in evaluation order.
+        """
+        indexes = [self.shared]
+        for subject in subjects:
+            bucket = self.buckets.get(subject)
+            if bucket is not None:
+                indexes.append(bucket)
+        return self._merge(obj, indexes)
+
+    def bucket_stats(self, top: int = 10):
+        """
+        Describes how the rules are spread over the buckets.
+
+        Returns:
+            dict: Number of buckets, size of the shared bucket and the `top`
+                largest subject buckets as `(subject, size)` pairs.
+        """
+        largest = heapq.nlargest(top, self.buckets.items(), key=lambda item: item[1].size)
+        return {
+            "buckets": len(self.buckets),
+            "shared": self.shared.size,
+            "largest": [(subject, bucket.size) for subject, bucket in largest],
+        }
+
+    @staticmethod
+    def _merge(obj, indexes):
+        streams = [index.candidates(obj) for index in indexes if index.size]
+        if not streams:
+            return []
+        if len(streams) == 1:
+            return streams[0]
+        return heapq.merge(*streams)
@@ -0,0 +1,217 @@
+"""
+policy_memory.py
+================
+Memory Footprint of the Loaded Policy
+
+Every `p` rule is a list of six strings, and casbin's CSV and database
+adapters create six new string objects per row: a worker with a million rules
+holds six million strings although most values (`"41"`, `".*"`, `"allow"`,
+user names) repeat across thousands of rows. The `IndexedEnforcer` therefore
+keeps its policy compact:
+
+- rule values are interned (`sys.intern`), so equal values are one shared
+  string; interned strings are released again once no rule uses them,
+- the index orders rules by one integer key per rule (see `order_key`)
+  instead of a `(priority, order)` tuple,
+- a trie node keeps its children in one dict keyed by separator and segment
+  (instead of nested dicts per separator and segment length), allocates it
+  and its rule list only when needed, and the keys such as `.catalog_1` are
+  interned as well,
+- casbin's `policy_map` (a joined-string key per rule, never read) is not
+  kept,
+- `regexMatch` compiles each distinct pattern once into a shared, bounded
+  `PatternCache` instead of `re`'s 512-entry cache, which a large policy
+  keeps evicting.
+
+Rules stay casbin lists, because casbin, the adapters and the persister hand
+them around and compare them as lists.
+
+On a generated policy with subject partitioning (see
+`benchmarks/policy_generator.py`) this takes a policy of 100k rules from about
+2.5 KB to 0.85 KB per rule. `memory_report` measures it, and
+`BYTES_PER_RULE_TARGET` is the budget a policy should stay within, checked
+with:
+
+    python -m services.policy_memory policy.csv
+
+Classes:
+--------
+- PatternCache: Compiled regular expressions shared by all rules.
+
+Functions:
+----------
+- intern_rule: Replaces the values of a rule with interned strings.
+- order_key: The integer evaluation-order key of an indexed rule.
+- memory_report: Measures the memory held by the policy of an enforcer.
+"""
+
+import argparse
+import functools
+import re
+import sys
+
+# Distinct regular expressions kept compiled by a `PatternCache`.
+PATTERN_CACHE_SIZE = 16384
+
+# Bytes per rule a generated policy may take (rules, values and index).
+BYTES_PER_RULE_TARGET = 1000
+
+# Bits of an order key below the priority (room for 10^12 rule additions).
+ORDER_BITS = 40
+
+
+def intern_rule(rule: list) -> list:
+    """
+    Replaces the string values of a rule with interned ones, in place.
+
+    Returns:
+        list: The same rule.
+    """
+    for position, value in enumerate(rule):
+        if type(value) is str:
+            rule[position] = sys.intern(value)
+    return rule
+
+
+def order_key(priority: int, sequence: int) -> int:
+    """
+    Combines a rule's priority and insertion sequence into one sort key.
+
+    Sorting by the key sorts by priority first and keeps insertion order among
+    equal priorities, like the `(priority, sequence)` tuple it replaces.
+    """
+    return (priority << ORDER_BITS) | sequence
+
+
+class PatternCache:
+    """
+    Compiles every distinct regular expression once for all rules.
+
+    The same pattern (e.g. `.*` or one object pattern checked by many
+    requests) is compiled once and shared until it is evicted, least recently
+    used first.
+
+    Attributes:
+    - size (int): The maximum number of compiled patterns kept.
+    """
+
+    def __init__(self, size: int = PATTERN_CACHE_SIZE):
+        self.size = size
+        self.compile = functools.lru_cache(maxsize=size)(re.compile)
+
+    def regex_match(self, key1, key2) -> bool:
+        """casbin's `regexMatch`: whether `key2` matches at the start of `key1`."""
+        return self.compile(key2).match(key1) is not None
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: Hits, misses, compiled patterns held and the maximum size.
+        """
+        info = self.compile.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "patterns": info.currsize, "size": self.size}
+
+
+def memory_report(enforcer) -> dict:
+    """
+    Measures the memory held by the policy of an `IndexedEnforcer`.
+
+    Walks every rule and index node (so it takes about as long as loading the
+    policy); objects shared by several rules or nodes are counted once.
+    Compiled patterns are only counted, `sys.getsizeof` cannot see their size.
+
+    Returns:
+        dict: Rules, bytes of the rule lists, of the distinct values and of
+            the index, their total, the bytes per rule and whether that is
+            within `BYTES_PER_RULE_TARGET`.
+    """
+    from services.policy_index import SubjectPartitionedIndex
+
+    with enforcer.policy_lock:
+        seen = set()
+
+        def size(obj):
+            if id(obj) in seen:
+                return 0
+            seen.add(id(obj))
+            return sys.getsizeof(obj)
+
+        rules = rows = values = 0
+        for sec in ("p", "g"):
+            if sec not in enforcer.get_model().keys():
+                continue
+            for assertion in enforcer.get_model()[sec].values():
+                rows += size(assertion.policy) + size(assertion.policy_map)
+                for rule in assertion.policy:
+                    rules += sec == "p"
+                    rows += size(rule)
+                    values += sum(size(value) for value in rule)
+
+        index_bytes = 0
+        index = enforcer.policy_index
+        if isinstance(index, SubjectPartitionedIndex):
+            index_bytes += size(index) + size(index.buckets) + _index_size(index.shared, size)
+            for subject, bucket in index.buckets.items():
+                index_bytes += size(subject) + _index_size(bucket, size)
+        elif index is not None:
+            index_bytes += _index_size(index, size)
+
+    total = rows + values + index_bytes
+    per_rule = total / rules if rules else 0.0
+    return {
+        "rules": rules,
+        "rule_bytes": rows,
+        "value_bytes": values,
+        "index_bytes": index_bytes,
+        "total_bytes": total,
+        "bytes_per_rule": per_rule,
+        "target_bytes_per_rule": BYTES_PER_RULE_TARGET,
+        "within_target": per_rule <= BYTES_PER_RULE_TARGET,
+        "patterns": enforcer.pattern_cache.stats(),
+    }
+
+
+def _index_size(index, size):
+    """Bytes of one `PolicyIndex`: nodes, child dicts, segment keys and entries."""
+    total = size(index) + size(index.fallback)
+    total += sum(size(entry) + size(entry.order) for entry in index.fallback)
+    stack = [index.root]
+    while stack:
+        node = stack.pop()
+        total += size(node)
+        if node.rules is not None:
+            total += size(node.rules) + sum(size(entry) + size(entry.order) for entry in node.rules)
+        if node.children is not None:
+            total += size(node.edges) + size(node.children)
+            for key, child in node.children.items():
+                total += size(key)
+                stack.append(child)
+    return total
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Report the memory held by a loaded casbin policy.")
+    parser.add_argument("policy", help="the policy CSV to load")
+    parser.add_argument("--model", default="model.conf", help="the casbin model")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from services.enforcer import IndexedEnforcer
+
+    arguments = parse_arguments(argv)
+    enforcer = IndexedEnforcer(arguments.model, arguments.policy)
+    report = memory_report(enforcer)
+    print(
+        f"{report['rules']} rules: {report['total_bytes'] / 2 ** 20:.1f} MiB "
+        f"(rules {report['rule_bytes'] / 2 ** 20:.1f}, values {report['value_bytes'] / 2 ** 20:.1f}, "
+        f"index {report['index_bytes'] / 2 ** 20:.1f}), {report['bytes_per_rule']:.0f} bytes per rule "
+        f"(target {BYTES_PER_RULE_TARGET})"
+    )
+    return 0 if report["within_target"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
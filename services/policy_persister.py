@@ -0,0 +1,301 @@
+"""
+policy_persister.py
+===================
+Write-Behind Persistence for the Casbin Policy
+
+The `create-new` routes used to call `casbin_enforcer.save_policy()` right
+after adding their rules, which rewrites the whole policy file on the event
+loop. `PolicyPersister` instead records that a save was requested and lets a
+background task write the policy once per flush interval (or as soon as a
+batch of requests has piled up). Concurrent creates are coalesced into a
+single write, and the file is written off the event loop.
+
+The policy is snapshotted on the event loop, where every mutation happens,
+and then written atomically (temporary file, fsync, rename) in a worker
+thread. With a `JournalAdapter` every change is already in the journal, so a
+flush is a single fsync, plus a snapshot compaction once the journal grows
+past its threshold and on shutdown. A `SqliteAdapter` commits every change as
+it happens, so there is nothing left to write. Other adapters are saved
+through `save_policy()` as before. Every flush records its duration and the
+bytes it wrote in `services.metrics`. A failed flush is retried after a delay
+that doubles with every failure, up to `MAX_RETRY_DELAY` seconds, so accepted
+changes are written even when no further change comes.
+
+Classes:
+--------
+- PolicyPersister: Coalesces save requests into background flushes.
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from casbin.persist.adapters import FileAdapter
+from loguru import logger
+
+from services.journal_adapter import JournalAdapter
+from services.metrics import POLICY_SAVE_BYTES, POLICY_SAVE_SECONDS
+from services.sqlite_adapter import SqliteAdapter
+
+# Seconds before a failed flush is retried for the first time; the delay doubles with every failure.
+RETRY_DELAY = 0.5
+
+# The longest delay between retries of a failed flush, in seconds.
+MAX_RETRY_DELAY = 30.0
+
+
+class PolicyPersister:
+    """
+    Coalesces policy save requests into periodic, durable flushes.
+
+    Attributes:
+    - enforcer (casbin.Enforcer): The enforcer whose policy is persisted.
+    - flush_interval (float): Seconds to wait for more changes before a flush.
+    - batch_size (int): Number of pending save requests that forces a flush.
+    - requested (int): Ticket of the latest save request.
+    - durable (int): Ticket of the latest save request known to be on disk.
+    - flush_count (int): Number of completed flushes.
+    """
+
+    def __init__(self, enforcer, flush_interval: float = 0.5, batch_size: int = 100):
+        self.enforcer = enforcer
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.requested = 0
+        self.durable = 0
+        self.flush_count = 0
+        self._task = None
+        self._dirty = None
+        self._batch_full = None
+        self._flush_lock = None
+        self._waiters = []
+
+    def request_save(self) -> int:
+        """
+        Records that the in-memory policy has changed and must be persisted.
+
+        Outside of a running event loop the policy is saved immediately.
+
+        Returns:
+            int: A ticket that can be passed to `wait_durable`.
+        """
+        self.requested += 1
+        if not self._ensure_started():
+            self._persist(self._snapshot())
+            self._mark_durable(self.requested)
+            return self.requested
+
+        self._dirty.set()
+        if self.requested - self.durable >= self.batch_size:
+            self._batch_full.set()
+        return self.requested
+
+    async def wait_durable(self, ticket: int = None):
+        """
+        Waits until a save request has been flushed.
+
+        Args:
+            ticket (int): The ticket returned by `request_save`. Defaults to the
+                latest request.
+
+        Raises:
+            OSError: If the flush covering this ticket failed.
+        """
+        ticket = self.requested if ticket is None else ticket
+        if ticket <= self.durable:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((ticket, future))
+        await future
+
+    async def flush(self):
+        """Writes all pending changes now and waits until they are durable."""
+        if not self._ensure_started():
+            if self.requested > self.durable:
+                self._persist(self._snapshot())
+                self._mark_durable(self.requested)
+            return
+
+        async with self._flush_lock:
+            target = self.requested
+            if target <= self.durable:
+                return
+            snapshot = self._snapshot()
+            try:
+                if snapshot[0] == "adapter":
+                    self._persist(snapshot)
+                else:
+                    await asyncio.to_thread(self._persist, snapshot)
+            except Exception as exc:
+                self._fail_waiters(target, exc)
+                raise
+            self._mark_durable(target)
+
+    async def close(self):
+        """Flushes pending changes and stops the background task (for shutdown)."""
+        await self.flush()
+
+        adapter = self.enforcer.get_adapter()
+        if isinstance(adapter, JournalAdapter):
+            # Fold the journal so the next start only has to read the snapshot.
+            if adapter.journal_records:
+                snapshot = ("journal", adapter.begin_compaction(self.enforcer.get_model()))
+                await asyncio.to_thread(self._persist, snapshot)
+            adapter.close()
+        elif isinstance(adapter, SqliteAdapter):
+            adapter.close()
+
+        if self._task is not None:
+            # Holding the lock guarantees the task is not in the middle of a write.
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _ensure_started(self) -> bool:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._dirty = asyncio.Event()
+            self._batch_full = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = loop.create_task(self._run())
+        return True
+
+    async def _run(self):
+        retry_delay = 0.0
+        while True:
+            await self._dirty.wait()
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._dirty.clear()
+            self._batch_full.clear()
+
+            try:
+                await self.flush()
+                retry_delay = 0.0
+            except Exception as exc:
+                retry_delay = min(max(retry_delay * 2, RETRY_DELAY), MAX_RETRY_DELAY)
+                logger.error(f"Policy flush failed, retrying in {retry_delay:.1f}s: {exc}")
+                self._dirty.set()
+                await asyncio.sleep(retry_delay)
+
+    def _snapshot(self):
+        """
+        Captures what a flush has to write while the model cannot change.
+
+        Rules are never modified in place, so a shallow copy of each rule list
+        is enough for a `FileAdapter`.
+
+        Returns:
+            tuple: `("file", (path, sections))`, `("journal", compaction)` where
+                compaction is None unless the journal is due for one,
+                `("committed", None)` for a `SqliteAdapter` or `("adapter", None)`
+                for any other adapter.
+        """
+        adapter = self.enforcer.get_adapter()
+        if isinstance(adapter, SqliteAdapter):
+            # Also the storage of an `EnforcerRouter`, which has no single model.
+            return "committed", None
+
+        model = self.enforcer.get_model()
+        if isinstance(adapter, JournalAdapter):
+            compaction = adapter.begin_compaction(model) if adapter.needs_compaction() else None
+            return "journal", compaction
+
+        if not isinstance(adapter, FileAdapter):
+            return "adapter", None
+
+        sections = []
+        for sec in ("p", "g"):
+            if sec not in model.keys():
+                continue
+            for key, ast in model[sec].items():
+                sections.append((key, list(ast.policy)))
+        return "file", (adapter._file_path, sections)
+
+    def _persist(self, snapshot):
+        """
+        Writes a snapshot taken by `_snapshot`.
+
+        Runs in a worker thread for every kind except `"adapter"`, which has
+        to call `save_policy()` on the event loop.
+        """
+        kind, payload = snapshot
+        if kind == "committed":
+            # Every change was committed when it was made.
+            self.flush_count += 1
+            return
+
+        started = time.perf_counter()
+        written = 0
+        if kind == "adapter":
+            self.enforcer.save_policy()
+        elif kind == "journal":
+            adapter = self.enforcer.get_adapter()
+            before = adapter.bytes_written
+            adapter.sync()
+            if payload is not None:
+                adapter.write_snapshot(payload)
+            written = adapter.bytes_written - before
+        else:
+            written = self._write_policy_file(payload)
+        POLICY_SAVE_SECONDS.observe(time.perf_counter() - started, (kind,))
+        POLICY_SAVE_BYTES.inc(written, (kind,))
+        self.flush_count += 1
+
+    @staticmethod
+    def _write_policy_file(snapshot):
+        """
+        Writes a snapshot in the `FileAdapter` format and swaps it in atomically.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        path, sections = snapshot
+        lines = [key + ", " + ", ".join(pvals) + "\n" for key, rules in sections for pvals in rules]
+        content = "".join(lines).encode()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".policy-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(content)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return len(content)
+
+    def _mark_durable(self, ticket):
+        self.durable = max(self.durable, ticket)
+        pending = []
+        for waiting_ticket, future in self._waiters:
+            if waiting_ticket <= self.durable:
+                if not future.done():
+                    future.set_result(None)
+            else:
+                pending.append((waiting_ticket, future))
+        self._waiters = pending
+
+    def _fail_waiters(self, ticket, exc):
+        pending = []
+        for waiting_ticket, future in self._waiters:
+            if waiting_ticket <= ticket:
+                if not future.done():
+                    future.set_exception(exc)
+            else:
+                pending.append((waiting_ticket, future))
+        self._waiters = pending
@@ -0,0 +1,560 @@
+"""
+policy_transfer.py
+==================
+Streaming Policy Export and Import
+
+Backups, migrations and audits need the whole policy as a file, and loading a
+policy into another process should not read it whole. This module streams
+rules in both directions, in one of two formats:
+
+- `csv`: casbin policy lines, e.g. `p, 40, cto, ws.catalog(\\..*)?$, .*, .*, allow`,
+  the format of `policy.csv`.
+- `ndjson`: one JSON object per line, e.g.
+  `{"ptype": "p", "rule": ["40", "cto", "ws.catalog(\\..*)?$", ".*", ".*", "allow"]}`.
+
+An export yields the policy in text chunks of `EXPORT_CHUNK_RULES` lines. The
+rules of an `IndexedEnforcer` are read one page at a time under its lock,
+those of an `EnforcerRouter` one page at a time from its database.
+
+An import reads lines as they arrive, validates every rule against the
+model's `policy_definition` and `role_definition` (known policy type, number
+of fields, an integer `priority` and an `allow`/`deny` effect) and adds the
+valid rules that are not stored yet with one `add_policies` call per
+`batch_size` rules, so the enforcer's index is updated in batches too. The
+service parses in a worker thread and applies the batches on the event loop.
+Invalid rows are counted and skipped; the first `MAX_REPORTED_ERRORS` are
+reported with their line numbers. Either way only one chunk and one batch are
+held at a time, so memory stays flat for 1k rules and for 10M.
+
+The service offers both as admin endpoints (`routes/policy.py`); the CLI
+converts and validates policy files offline, appending only the rules the
+target file does not hold yet. It remembers the rules it has seen in a
+temporary SQLite database on disk rather than in memory (`_RuleIndex`), so
+its memory stays flat too:
+
+    python -m services.policy_transfer export policy.csv --format ndjson --output backup.ndjson
+    python -m services.policy_transfer import backup.ndjson --into restored.csv
+
+Classes:
+--------
+- PolicyValidator: Checks rules against the model's policy definitions.
+- ImportReport: What an import added, skipped and rejected.
+- PolicyImporter: Adds a stream of policy lines to an enforcer in batches.
+
+Functions:
+----------
+- iter_policy: The stored rules of an enforcer or router.
+- export_chunks: Formats rules as text chunks.
+- parse_records: Parses and validates policy lines.
+"""
+
+import argparse
+import codecs
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from services.enforcer import distinct_rules
+from services.enforcer_router import EnforcerRouter
+from services.journal_adapter import parse_policy_line, policy_token_counts
+
+# Supported formats and the media type each is served with.
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+# Rules per chunk of an export stream.
+EXPORT_CHUNK_RULES = 1000
+
+# Rules added to the enforcer per batch by default.
+IMPORT_BATCH_SIZE = 10000
+
+# Invalid rows reported in detail; the rest are only counted.
+MAX_REPORTED_ERRORS = 100
+
+# Page cache of the CLI import's on-disk rule index, in KiB.
+DEDUP_CACHE_KIB = 8192
+
+# Effects a rule may have.
+EFFECTS = frozenset(("allow", "deny"))
+
+
+class PolicyValidator:
+    """
+    Checks rules against the policy and role definitions of a model.
+
+    Attributes:
+    - token_counts (dict): Line length (type plus fields) per policy type.
+    """
+
+    def __init__(self, model):
+        self.token_counts = policy_token_counts(model)
+        self._sections = {}
+        self._priority_index = {}
+        self._eft_index = {}
+        for sec in ("p", "g"):
+            if sec not in model.keys():
+                continue
+            for ptype, ast in model[sec].items():
+                self._sections[ptype] = sec
+                if f"{ptype}_priority" in ast.tokens:
+                    self._priority_index[ptype] = ast.tokens.index(f"{ptype}_priority")
+                if f"{ptype}_eft" in ast.tokens:
+                    self._eft_index[ptype] = ast.tokens.index(f"{ptype}_eft")
+
+    def section(self, ptype: str) -> str:
+        """The section (`p` or `g`) of a policy type."""
+        return self._sections[ptype]
+
+    def validate(self, ptype, rule):
+        """
+        Checks one rule.
+
+        Returns:
+            str: Why the rule is invalid, or None if it is valid.
+        """
+        if ptype not in self.token_counts:
+            return f"unknown policy type {ptype!r}"
+        if not isinstance(rule, list) or not all(isinstance(value, str) for value in rule):
+            return "the rule must be a list of strings"
+        if len(rule) != self.token_counts[ptype] - 1:
+            return f"{ptype} rules have {self.token_counts[ptype] - 1} fields, got {len(rule)}"
+        priority_index = self._priority_index.get(ptype)
+        if priority_index is not None and not rule[priority_index].isdigit():
+            return f"the priority must be a non-negative integer, got {rule[priority_index]!r}"
+        eft_index = self._eft_index.get(ptype)
+        if eft_index is not None and rule[eft_index] not in EFFECTS:
+            return f"the effect must be allow or deny, got {rule[eft_index]!r}"
+        return None
+
+
+def iter_policy(enforcer, page_size: int = EXPORT_CHUNK_RULES):
+    """
+    Yields `(ptype, rule)` for every stored rule, `p` rules first.
+
+    Args:
+        enforcer (IndexedEnforcer | EnforcerRouter): Where the policy lives.
+        page_size (int): Rules read at a time.
+    """
+    if isinstance(enforcer, EnforcerRouter):
+        yield from enforcer.adapter.iter_rules(policy_token_counts(enforcer.get_model()), page_size)
+        return
+
+    model = enforcer.get_model()
+    sections = [(sec, ptype) for sec in ("p", "g") if sec in model.keys() for ptype in model[sec].keys()]
+    for sec, ptype in sections:
+        for rule in _iter_assertion(enforcer, sec, ptype, page_size):
+            yield ptype, rule
+
+
+def _iter_assertion(enforcer, sec, ptype, page_size):
+    """
+    Yields the rules of one policy type, one page at a time under the enforcer's lock.
+
+    When the policy changed since the previous page, the next page starts
+    after the last rule of the previous page that is still there (rules keep
+    their relative order), so rules stored during the whole export are not
+    skipped or repeated because others were added or removed before them.
+    """
+    position, page, generation = 0, [], None
+    while True:
+        with enforcer.policy_lock:
+            model = enforcer.get_model()
+            if sec not in model.keys() or ptype not in model[sec]:
+                return
+            rules = model[sec][ptype].policy
+            if page and enforcer.policy_generation != generation:
+                position = _resume_position(rules, page, position)
+            generation = enforcer.policy_generation
+            page = rules[position : position + page_size]
+        if not page:
+            return
+        position += len(page)
+        yield from page
+
+
+def _resume_position(rules, page, position):
+    """
+    Where to continue after `page` in a changed list of rules.
+
+    Searches outward from the page's old end for the nearest rule of the page
+    (by identity), then forward for the last one; if none is left, continues
+    where the page ended.
+    """
+    ids = {id(rule) for rule in page}
+    nearest = None
+    for distance in range(len(rules) + 1):
+        for index in (position - 1 - distance, position + distance):
+            if 0 <= index < len(rules) and id(rules[index]) in ids:
+                nearest = index
+                break
+        if nearest is not None:
+            break
+    if nearest is None:
+        return min(position, len(rules))
+    last = nearest
+    for index in range(nearest + 1, min(len(rules), nearest + 2 * len(page))):
+        if id(rules[index]) in ids:
+            last = index
+    return last + 1
+
+
+def format_record(ptype, rule, fmt: str) -> str:
+    """One rule as a line of the format, with its line break."""
+    if fmt == "ndjson":
+        return json.dumps({"ptype": ptype, "rule": list(rule)}) + "\n"
+    return ", ".join([ptype] + list(rule)) + "\n"
+
+
+def export_chunks(records, fmt: str, chunk_rules: int = EXPORT_CHUNK_RULES):
+    """
+    Formats rules as text chunks.
+
+    Args:
+        records (Iterable): `(ptype, rule)` pairs, e.g. from `iter_policy`.
+        fmt (str): "csv" or "ndjson".
+        chunk_rules (int): Rules per chunk.
+
+    Yields:
+        str: Up to `chunk_rules` formatted lines.
+    """
+    records = iter(records)
+    while True:
+        lines = [format_record(ptype, rule, fmt) for ptype, rule in itertools.islice(records, chunk_rules)]
+        if not lines:
+            return
+        yield "".join(lines)
+
+
+def parse_records(lines, fmt: str, validator: PolicyValidator, first_line: int = 1):
+    """
+    Parses and validates policy lines.
+
+    Blank lines and, in CSV, `#` comments are skipped.
+
+    Args:
+        lines (Iterable[str]): The lines, with or without line breaks.
+        fmt (str): "csv" or "ndjson".
+        validator (PolicyValidator): The model's definitions.
+        first_line (int): The number of the first line, for error messages.
+
+    Yields:
+        tuple: `(line_number, ptype, rule, error)`; `error` is None for a
+            valid rule and says what is wrong otherwise.
+    """
+    for line_number, line in enumerate(lines, first_line):
+        line = line.strip()
+        if not line:
+            continue
+        if fmt == "ndjson":
+            try:
+                record = json.loads(line)
+                ptype, rule = record["ptype"], record["rule"]
+            except (ValueError, TypeError, KeyError) as error:
+                yield line_number, None, None, f"invalid record: {error}"
+                continue
+        else:
+            tokens = parse_policy_line(line, validator.token_counts)
+            if tokens is None:
+                continue
+            ptype, rule = tokens[0], tokens[1:]
+        yield line_number, ptype, rule, validator.validate(ptype, rule)
+
+
+class ImportReport:
+    """
+    What an import added, skipped and rejected.
+
+    Attributes:
+    - rows (int): Rules read (valid or not).
+    - added (int): Rules added to the policy.
+    - existing (int): Valid rules that were already stored (or repeated).
+    - invalid (int): Rules rejected by validation.
+    - errors (list): `(line_number, message)` of the first invalid rules.
+    - batches (int): `add_policies` calls made.
+    - seconds (float): Time taken.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.added = 0
+        self.existing = 0
+        self.invalid = 0
+        self.errors = []
+        self.batches = 0
+        self.seconds = 0.0
+
+    def summary(self) -> dict:
+        return {
+            "rows": self.rows,
+            "added": self.added,
+            "existing": self.existing,
+            "invalid": self.invalid,
+            "errors": [{"line": line, "message": message} for line, message in self.errors],
+            "batches": self.batches,
+            "seconds": self.seconds,
+        }
+
+
+class PolicyImporter:
+    """
+    Adds a stream of policy lines to an enforcer in batches.
+
+    Parsing and applying are separate steps, so the service can parse the
+    chunks of an upload in a worker thread and apply each batch on the event
+    loop, where every policy change happens: `parse` returns the batches a
+    chunk completes and `apply` adds one. `feed` does both for callers on a
+    single thread; `finish` applies the rest and returns the report. Lines
+    split across chunks are joined. Rules already stored are skipped instead
+    of failing the whole batch as casbin's `add_policies` would.
+
+    Attributes:
+    - enforcer (IndexedEnforcer | EnforcerRouter): Where the rules go.
+    - fmt (str): "csv" or "ndjson".
+    - batch_size (int): Rules per `add_policies` call.
+    - report (ImportReport): The progress so far.
+    - listeners (list): Callables notified of every added batch with a
+        `{"op": "+", "sec", "ptype", "rules"}` record, as `PolicyWatcher`
+        notifies its listeners.
+    """
+
+    def __init__(self, enforcer, fmt: str, batch_size: int = IMPORT_BATCH_SIZE):
+        if fmt not in MEDIA_TYPES:
+            raise ValueError(f"unknown policy format {fmt!r}")
+        self.enforcer = enforcer
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.report = ImportReport()
+        self.listeners = []
+        self._validator = PolicyValidator(enforcer.get_model())
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._partial = ""
+        self._next_line = 1
+        self._batch = {}
+        self._batched = 0
+        self._started = time.perf_counter()
+
+    def parse(self, chunk) -> list:
+        """
+        Reads the complete lines of a chunk (bytes or str).
+
+        Returns:
+            list: The batches completed by the chunk, `{ptype: rules}` each.
+        """
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        lines = (self._partial + chunk).split("\n")
+        self._partial = lines.pop()
+        return self._read(lines)
+
+    def apply(self, batch: dict):
+        """Adds the rules of a batch that are not stored yet."""
+        enforcer = self.enforcer
+        for ptype, rules in batch.items():
+            grouping = self._validator.section(ptype) == "g"
+            has_rule = enforcer.has_named_grouping_policy if grouping else enforcer.has_named_policy
+            new_rules = [rule for rule in distinct_rules(rules) if not has_rule(ptype, *rule)]
+            self.report.existing += len(rules) - len(new_rules)
+            if not new_rules:
+                continue
+            if grouping:
+                enforcer.add_named_grouping_policies(ptype, new_rules)
+            else:
+                enforcer.add_named_policies(ptype, new_rules)
+            self.report.added += len(new_rules)
+            self.report.batches += 1
+            record = {"op": "+", "sec": "g" if grouping else "p", "ptype": ptype, "rules": new_rules}
+            for listener in self.listeners:
+                listener(record)
+
+    def feed(self, chunk):
+        """Parses a chunk and applies the batches it completes."""
+        for batch in self.parse(chunk):
+            self.apply(batch)
+
+    def finish(self) -> ImportReport:
+        """Reads the last line, applies the last batch and returns the report."""
+        batches = self._read([self._partial + self._decoder.decode(b"", final=True)])
+        self._partial = ""
+        if self._batch:
+            batches.append(self._take_batch())
+        for batch in batches:
+            self.apply(batch)
+        self.report.seconds = time.perf_counter() - self._started
+        return self.report
+
+    def _read(self, lines) -> list:
+        batches = []
+        first_line = self._next_line
+        self._next_line += len(lines)
+        for line_number, ptype, rule, error in parse_records(lines, self.fmt, self._validator, first_line):
+            self.report.rows += 1
+            if error is not None:
+                self.report.invalid += 1
+                if len(self.report.errors) < MAX_REPORTED_ERRORS:
+                    self.report.errors.append((line_number, error))
+                continue
+            self._batch.setdefault(ptype, []).append(rule)
+            self._batched += 1
+            if self._batched >= self.batch_size:
+                batches.append(self._take_batch())
+        return batches
+
+    def _take_batch(self) -> dict:
+        batch = self._batch
+        self._batch = {}
+        self._batched = 0
+        return batch
+
+
+def format_for_path(path: str) -> str:
+    """Guesses the format of a file from its extension (NDJSON for .ndjson/.jsonl)."""
+    return "ndjson" if os.path.splitext(path)[1].lower() in (".ndjson", ".jsonl") else "csv"
+
+
+def _file_records(path, validator):
+    """Yields the valid rules of a policy file or SQLite database and reports the invalid ones."""
+    if os.path.splitext(path)[1].lower() in (".db", ".sqlite", ".sqlite3"):
+        from services.sqlite_adapter import SqliteAdapter
+
+        adapter = SqliteAdapter(path)
+        try:
+            records = ((None, ptype, rule, validator.validate(ptype, rule))
+                       for ptype, rule in adapter.iter_rules(validator.token_counts))
+            yield from _report_invalid(records)
+        finally:
+            adapter.close()
+        return
+    with open(path, "r") as file:
+        yield from _report_invalid(parse_records(file, format_for_path(path), validator))
+
+
+def _report_invalid(records):
+    for line_number, ptype, rule, error in records:
+        if error is None:
+            yield ptype, rule
+        else:
+            print(f"{'line ' + str(line_number) if line_number else ptype}: {error}", file=sys.stderr)
+
+
+def _digest(line: str) -> bytes:
+    return hashlib.blake2b(line.encode(), digest_size=16).digest()
+
+
+class _RuleIndex:
+    """
+    The rules a CLI import has seen, in a temporary SQLite database on disk.
+
+    Each rule is stored as a 16 byte digest in a `WITHOUT ROWID` table, and
+    SQLite keeps at most `DEDUP_CACHE_KIB` of its pages in memory; the rest
+    spills to a temporary file that is deleted on close. Memory therefore
+    stays flat however many rules the target file and the dump hold, at the
+    cost of an indexed insert (and, past the cache, disk reads) per rule.
+    """
+
+    def __init__(self):
+        self._connection = sqlite3.connect("")
+        self._connection.execute(f"PRAGMA cache_size = -{DEDUP_CACHE_KIB}")
+        self._connection.execute("CREATE TABLE rules (digest BLOB PRIMARY KEY) WITHOUT ROWID")
+
+    def load(self, path, validator):
+        """Adds the valid rules of a policy CSV, if the file exists."""
+        if not os.path.exists(path):
+            return
+        with open(path, "r") as file:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO rules VALUES (?)",
+                (
+                    (_digest(format_record(ptype, rule, "csv")),)
+                    for _, ptype, rule, error in parse_records(file, "csv", validator)
+                    if error is None
+                ),
+            )
+
+    def add(self, line: str) -> bool:
+        """Adds a formatted rule; False if it was already there."""
+        return self._connection.execute("INSERT OR IGNORE INTO rules VALUES (?)", (_digest(line),)).rowcount == 1
+
+    def close(self):
+        self._connection.close()
+
+
+def _ends_with_newline(path) -> bool:
+    """Tells whether a file is empty or ends with a line break, so a line can be appended."""
+    with open(path, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        if file.tell() == 0:
+            return True
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
+
+
+def parse_arguments(argv=None):
+    default_model = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model.conf")
+    parser = argparse.ArgumentParser(description="Export or import a casbin policy as CSV or NDJSON.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="write a policy file or SQLite database as CSV or NDJSON")
+    export.add_argument("policy", help="the policy CSV, NDJSON or SQLite database to read")
+    export.add_argument("--format", choices=sorted(MEDIA_TYPES), default="csv", help="the output format")
+    export.add_argument("--output", help="the file to write (standard output by default)")
+
+    restore = commands.add_parser("import", help="validate a CSV or NDJSON dump and append it to a policy CSV")
+    restore.add_argument("dump", help="the CSV or NDJSON file to read")
+    restore.add_argument("--into", required=True, help="the policy CSV the valid rules are appended to")
+
+    for command in (export, restore):
+        command.add_argument("--model", default=default_model, help="the casbin model")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from services.enforcer import IndexedEnforcer
+
+    arguments = parse_arguments(argv)
+    validator = PolicyValidator(IndexedEnforcer.new_model(path=arguments.model))
+
+    if arguments.command == "export":
+        output = open(arguments.output, "w") if arguments.output else sys.stdout
+        try:
+            for chunk in export_chunks(_file_records(arguments.policy, validator), arguments.format):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        return 0
+
+    report = ImportReport()
+    started = time.perf_counter()
+    seen = _RuleIndex()
+    try:
+        seen.load(arguments.into, validator)
+        with open(arguments.dump, "r") as dump, open(arguments.into, "a") as policy:
+            if not _ends_with_newline(arguments.into):
+                policy.write("\n")
+            for line_number, ptype, rule, error in parse_records(dump, format_for_path(arguments.dump), validator):
+                report.rows += 1
+                if error is not None:
+                    report.invalid += 1
+                    print(f"line {line_number}: {error}", file=sys.stderr)
+                    continue
+                line = format_record(ptype, rule, "csv")
+                if not seen.add(line):
+                    report.existing += 1
+                    continue
+                policy.write(line)
+                report.added += 1
+    finally:
+        seen.close()
+    report.seconds = time.perf_counter() - started
+    print(
+        f"{report.added} rules appended to {arguments.into}, {report.existing} existing, "
+        f"{report.invalid} invalid, in {report.seconds:.2f}s"
+    )
+    return 1 if report.invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,501 @@
+"""
+policy_watcher.py
+=================
+Policy Synchronization Between Workers
+
+Every uvicorn worker holds its own `casbin_enforcer`, so a rule added by
+`create_new_catalog` in one process used to stay invisible to the others until
+they restarted. `PolicyWatcher` is a casbin watcher that publishes every policy
+change as a versioned delta and replays the deltas published by the sibling
+workers, without reloading the whole policy.
+
+The transport is `FileDeltaLog`, a shared append-only file of JSON records
+that every worker tails:
+
+- `{"base": 12}` starts a log whose history up to version 12 is in the
+  snapshot file next to it (`<log>.snapshot`, a policy CSV with a
+  `# version 12` header).
+- `{"version": 13, "origin": "...", "op": "+", "sec": "p", "ptype": "p",
+  "rules": [[...]]}` adds rules; `"-"` removes them and `"*"` is a filtered
+  removal with `field_index` and `values`. `"snapshot"` means a change that
+  casbin did not describe (e.g. an update) and the snapshot must be reloaded.
+
+Writers append under an exclusive `fcntl` lock on `<log>.lock` and number
+their records consecutively. A worker applies records strictly in order;
+when it finds a version it did not expect (a gap) it reloads the snapshot and
+replays the log instead; a worker that does so while publishing applies its
+own queued changes again, since the others skip them. Once the log grows past
+`max_bytes`, the writer holding the lock writes a fresh snapshot and starts a
+new log. casbin reports an addition before it applies it, so a change is
+published once the current event-loop step has finished; without a running
+loop it is published right away and the snapshot adds the pending rules.
+
+Changes are applied to memory only: the worker that made a change is the one
+that stores it.
+
+Classes:
+--------
+- FileDeltaLog: File-tail transport for policy deltas.
+- PolicyWatcher: casbin watcher that publishes and replays deltas.
+"""
+
+import asyncio
+import contextlib
+import fcntl
+import json
+import os
+import re
+import tempfile
+import uuid
+
+from casbin import persist
+from casbin.persist.watcher_ex import WatcherEx
+from loguru import logger
+
+from services.journal_adapter import parse_policy_line, policy_token_counts
+
+_SNAPSHOT_HEADER = re.compile(r"^# version (\d+)$")
+
+
+class _SnapshotAdapter(persist.Adapter):
+    """Adapter that loads rules which were already read from a snapshot."""
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    def load_policy(self, model):
+        for tokens in self.rules:
+            key = tokens[0]
+            if key[0] in model.keys() and key in model[key[0]]:
+                model[key[0]][key].policy.append(tokens[1:])
+
+
+def _policy_sections(model):
+    sections = []
+    for sec in ("p", "g"):
+        if sec not in model.keys():
+            continue
+        for key, ast in model[sec].items():
+            sections.append((key, list(ast.policy)))
+    return sections
+
+
+def _replace_file(path, content):
+    """Writes a file through a temporary file, fsync and rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".policy-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class FileDeltaLog:
+    """
+    Shared append-only file of policy deltas, tailed by every worker.
+
+    Attributes:
+    - path (str): Path of the delta log.
+    - snapshot_path (str): Path of the snapshot the log is based on.
+    - max_bytes (int): Log size after which the log is folded into a snapshot.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 16 * 1024 * 1024):
+        self.path = path
+        self.snapshot_path = path + ".snapshot"
+        self.max_bytes = max_bytes
+        self._lock_path = path + ".lock"
+        self._reader = None
+        self._partial = ""
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Holds the exclusive lock that serializes writers across processes."""
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def exists(self) -> bool:
+        """Returns True once some worker has created the log."""
+        return os.path.exists(self.path) and os.path.exists(self.snapshot_path)
+
+    def append(self, records):
+        """Appends records (under the lock) and returns the new log size."""
+        with open(self.path, "a") as file:
+            file.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
+            return file.tell()
+
+    def write_snapshot(self, version: int, sections):
+        """Replaces the snapshot with the given policy at `version` (under the lock)."""
+        lines = [f"# version {version}"]
+        lines.extend(key + ", " + ", ".join(pvals) for key, rules in sections for pvals in rules)
+        _replace_file(self.snapshot_path, "\n".join(lines) + "\n")
+
+    def reset(self, version: int, sections):
+        """Writes a snapshot at `version` and starts an empty log on top of it (under the lock)."""
+        self.write_snapshot(version, sections)
+        _replace_file(self.path, json.dumps({"base": version}) + "\n")
+
+    def read_snapshot(self, token_counts):
+        """
+        Reads the snapshot.
+
+        Returns:
+            tuple: The snapshot's version and its rules as token lists.
+        """
+        version, rules = 0, []
+        with open(self.snapshot_path, "r") as file:
+            for number, line in enumerate(file):
+                line = line.strip()
+                if number == 0:
+                    header = _SNAPSHOT_HEADER.match(line)
+                    if header:
+                        version = int(header.group(1))
+                        continue
+                tokens = parse_policy_line(line, token_counts)
+                if tokens is not None:
+                    rules.append(tokens)
+        return version, rules
+
+    def rewind(self):
+        """Starts tailing the current log from its first record."""
+        self.close()
+        self._reader = open(self.path, "r")
+
+    def read_records(self):
+        """
+        Returns the complete records appended since the last call.
+
+        When the log was replaced by a new one, the rest of the old log is
+        returned first, followed by the records of the new log.
+        """
+        if self._reader is None:
+            if not os.path.exists(self.path):
+                return []
+            self.rewind()
+
+        records = []
+        while True:
+            records.extend(self._drain())
+            try:
+                current = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                return records
+            if current == os.fstat(self._reader.fileno()).st_ino:
+                return records
+            # The old log is complete once it has been replaced.
+            records.extend(self._drain())
+            self.rewind()
+
+    def close(self):
+        """Stops tailing the log."""
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        self._partial = ""
+
+    def _drain(self):
+        data = self._reader.read()
+        if not data:
+            return []
+        lines = (self._partial + data).split("\n")
+        # A line without its newline is still being written.
+        self._partial = lines.pop()
+        return [json.loads(line) for line in lines if line]
+
+
+class PolicyWatcher(WatcherEx):
+    """
+    casbin watcher that keeps the policy of sibling workers in sync.
+
+    Attributes:
+    - enforcer (IndexedEnforcer): The enforcer to keep in sync.
+    - log (FileDeltaLog): The shared delta log.
+    - interval (float): Seconds between two polls of the log.
+    - origin (str): Identifies the records published by this worker.
+    - version (int): Version of the last record reflected in the policy.
+    - applied (int): Records from other workers applied so far.
+    - resyncs (int): Number of reloads from the snapshot.
+    - listeners (list): Callables invoked with every record applied from the
+        log, and with `{"op": "snapshot"}` after a reload.
+    """
+
+    def __init__(self, enforcer, log: FileDeltaLog, interval: float = 0.2):
+        self.enforcer = enforcer
+        self.log = log
+        self.interval = interval
+        self.origin = uuid.uuid4().hex
+        self.version = 0
+        self.applied = 0
+        self.resyncs = 0
+        self.listeners = []
+        self._pending = []
+        self._publish_scheduled = False
+        self._applying = False
+        self._task = None
+
+    def start(self):
+        """
+        Joins the shared log and starts following it.
+
+        The first worker creates the log from its own policy; every later
+        worker replaces its policy with the snapshot plus the log.
+        """
+        with self.log.locked():
+            if self.log.exists():
+                self._resync()
+            else:
+                self.log.reset(0, _policy_sections(self.enforcer.get_model()))
+                self.version = 0
+                self.log.rewind()
+                self.log.read_records()
+        self.enforcer.set_watcher(self)
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._run())
+
+    async def close(self):
+        """Publishes queued changes and stops following the log (for shutdown)."""
+        self._publish_pending()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.enforcer.set_watcher(None)
+        self.log.close()
+
+    def poll(self):
+        """Applies the records published since the last poll."""
+        if not self._consume(self.log.read_records()):
+            with self.log.locked():
+                self._resync()
+
+    def stats(self):
+        """
+        Returns the watcher counters.
+
+        Returns:
+            dict: Version, applied records and resyncs.
+        """
+        return {"version": self.version, "applied": self.applied, "resyncs": self.resyncs}
+
+    # casbin watcher callbacks. Rules arrive as one list argument.
+
+    def update(self):
+        self._queue({"op": "snapshot"})
+
+    def update_for_add_policy(self, sec, ptype, *params):
+        self._queue({"op": "+", "sec": sec, "ptype": ptype, "rules": [self._rule(params)]})
+
+    def update_for_add_policies(self, sec, ptype, *rules):
+        self._queue({"op": "+", "sec": sec, "ptype": ptype, "rules": self._rules(rules)})
+
+    def update_for_add_policies_ex(self, sec, ptype, *rules):
+        self._queue({"op": "+", "sec": sec, "ptype": ptype, "rules": self._rules(rules)})
+
+    def update_for_remove_policy(self, sec, ptype, *params):
+        self._queue({"op": "-", "sec": sec, "ptype": ptype, "rules": [self._rule(params)]})
+
+    def update_for_remove_policies(self, sec, ptype, *rules):
+        self._queue({"op": "-", "sec": sec, "ptype": ptype, "rules": self._rules(rules)})
+
+    def update_for_remove_filtered_policy(self, sec, ptype, field_index, *field_values):
+        self._queue(
+            {"op": "*", "sec": sec, "ptype": ptype, "field_index": field_index, "values": list(field_values)}
+        )
+
+    def update_for_save_policy(self, model):
+        # Saving does not change the policy.
+        pass
+
+    @staticmethod
+    def _rule(params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        return list(params)
+
+    @staticmethod
+    def _rules(rules):
+        if len(rules) == 1 and isinstance(rules[0], (list, tuple)):
+            if not rules[0] or isinstance(rules[0][0], (list, tuple)):
+                rules = rules[0]
+        return [list(rule) for rule in rules]
+
+    def _queue(self, record):
+        """
+        Queues a local change for publication.
+
+        casbin reports additions before it applies them, so publication
+        waits until the current event-loop step has finished. Without a
+        running loop the change is published right away, and the snapshots
+        written meanwhile add the rules casbin has yet to apply.
+        """
+        if self._applying:
+            return
+        self._pending.append(record)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._publish_pending(applied=record["op"] != "+")
+            return
+        if not self._publish_scheduled:
+            self._publish_scheduled = True
+            loop.call_soon(self._publish_pending)
+
+    def _publish_pending(self, applied: bool = True):
+        """
+        Publishes the queued changes.
+
+        Args:
+            applied (bool): Whether the model already holds the queued changes.
+        """
+        self._publish_scheduled = False
+        if not self._pending:
+            return
+        records, self._pending = self._pending, []
+
+        with self.log.locked():
+            # Versions are consecutive, so first catch up with the others.
+            if not self._consume(self.log.read_records()):
+                self._resync()
+                if applied:
+                    # The reload dropped this worker's own changes from memory,
+                    # and the others will not send them back.
+                    for record in records:
+                        self._reapply(record)
+
+            published = []
+            for record in records:
+                self.version += 1
+                published.append(dict(record, version=self.version, origin=self.origin))
+                if record["op"] == "snapshot":
+                    self.log.write_snapshot(self.version, self._sections(records, applied))
+            size = self.log.append(published)
+
+            if size > self.log.max_bytes:
+                self.log.reset(self.version, self._sections(records, applied))
+
+    def _sections(self, records, applied):
+        """The policy to snapshot: the model plus the queued additions it does not hold yet."""
+        sections = _policy_sections(self.enforcer.get_model())
+        if applied:
+            return sections
+
+        added = {}
+        for record in records:
+            if record["op"] == "+":
+                added.setdefault(record["ptype"], []).extend(record["rules"])
+        for key, rules in sections:
+            present = set(map(tuple, rules))
+            for rule in added.get(key, ()):
+                if tuple(rule) not in present:
+                    present.add(tuple(rule))
+                    rules.append(rule)
+        return sections
+
+    def _reapply(self, record):
+        """Applies a change of this worker again after a resync."""
+        if record["op"] == "snapshot":
+            # The change is not described; the reloaded policy is all there is.
+            logger.error("Policy resync dropped a local change that casbin did not describe")
+            return
+        self._apply(record)
+
+    def _consume(self, records, replay_own: bool = False) -> bool:
+        """
+        Applies records in version order.
+
+        Returns:
+            bool: False if a gap (or a snapshot record) requires a resync.
+        """
+        for record in records:
+            if "base" in record:
+                if record["base"] > self.version:
+                    return False
+                continue
+
+            version = record["version"]
+            if version <= self.version:
+                continue
+            if version != self.version + 1:
+                logger.warning(f"Policy log gap: expected version {self.version + 1}, found {version}")
+                return False
+            if record["origin"] != self.origin or replay_own:
+                if record["op"] == "snapshot":
+                    return False
+                self._apply(record)
+                self.applied += 1
+            self.version = version
+        return True
+
+    def _apply(self, record):
+        op, sec, ptype = record["op"], record["sec"], record["ptype"]
+        enforcer = self.enforcer
+        self._applying = True
+        try:
+            with enforcer.local_changes():
+                if op == "*":
+                    if sec == "g":
+                        enforcer.remove_filtered_named_grouping_policy(ptype, record["field_index"], *record["values"])
+                    else:
+                        enforcer.remove_filtered_named_policy(ptype, record["field_index"], *record["values"])
+                else:
+                    for rule in record["rules"]:
+                        if op == "+" and sec == "g":
+                            enforcer.add_named_grouping_policy(ptype, rule)
+                        elif op == "+":
+                            enforcer.add_named_policy(ptype, rule)
+                        elif sec == "g":
+                            enforcer.remove_named_grouping_policy(ptype, rule)
+                        else:
+                            enforcer.remove_named_policy(ptype, rule)
+        finally:
+            self._applying = False
+        self._notify(record)
+
+    def _resync(self):
+        """Reloads the snapshot and replays the whole log (under the lock)."""
+        token_counts = policy_token_counts(self.enforcer.get_model())
+        version, rules = self.log.read_snapshot(token_counts)
+        self._applying = True
+        try:
+            self.enforcer.load_policy_from(_SnapshotAdapter(rules))
+        finally:
+            self._applying = False
+        self.version = version
+        self.resyncs += 1
+
+        self.log.rewind()
+        if not self._consume(self.log.read_records(), replay_own=True):
+            raise RuntimeError(f"Policy log {self.log.path} does not continue its snapshot")
+        self._notify({"op": "snapshot"})
+
+    def _notify(self, record):
+        for listener in self.listeners:
+            try:
+                listener(record)
+            except Exception as exc:
+                logger.error(f"Policy watcher listener failed: {exc}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as exc:
+                logger.error(f"Policy sync failed, retrying: {exc}")
@@ -0,0 +1,225 @@
+"""
+resource_registry.py
+====================
+In-Memory Registry of Workspace Resources
+
+The list-filter endpoints used to authorize only the parent container, because
+the service kept no record of the jobs, catalogs, schemas and tables that the
+`create-new` routes created. `ResourceRegistry` records them as a hierarchy
+(`workspace -> job`, `workspace -> catalog -> schema -> table`), so a list
+endpoint can walk the children of a parent and keep only those the caller may
+access.
+
+Children are kept sorted by name and listed in pages: a page starts after a
+cursor (the last name of the previous page), so a schema with 100k tables
+never has to be materialized at once.
+
+The registry is filled by the `create-new` routes (and by the policy changes
+of other workers) and rebuilt from the policy at startup. The policy records objects, not resource types: schemas and tables
+are recognized by their depth, and a workspace child is a job or a catalog as
+its `KIND_PTYPE` marker rule says (e.g. `g2, default.job_1, job`, which no
+matcher reads). A workspace child without a marker, written before markers
+were kept or under a model without the `g2` role, becomes a catalog once a
+schema is found under it and is registered as both a job and a catalog
+otherwise.
+
+The registry is only changed and read on the event loop.
+
+Classes:
+--------
+- ResourceRegistry: Sorted children per (kind, parent path).
+
+Functions:
+----------
+- has_kind_markers: Whether a model can store kind markers.
+- kind_marker: The marker rule of a workspace child.
+"""
+
+import bisect
+
+from constants import optional_trailing_dot
+from services.policy_index import split_object_pattern
+
+JOB = "job"
+CATALOG = "catalog"
+SCHEMA = "schema"
+TABLE = "table"
+
+# The kind of resource at each depth of a `workspace.catalog.schema.table` path.
+_KINDS_BY_DEPTH = {3: SCHEMA, 4: TABLE}
+
+# The role type whose rules mark the kind of a workspace child, e.g. `g2, default.job_1, job`.
+KIND_PTYPE = "g2"
+
+# The kinds of workspace children, which the policy alone cannot tell apart.
+_MARKED_KINDS = (JOB, CATALOG)
+
+
+def has_kind_markers(model) -> bool:
+    """Tells whether a model defines the `KIND_PTYPE` role that stores kind markers."""
+    return "g" in model.keys() and KIND_PTYPE in model["g"]
+
+
+def kind_marker(kind: str, path: tuple) -> list:
+    """The `KIND_PTYPE` rule of a workspace child, e.g. `["default.job_1", "job"]`."""
+    return [".".join(path), kind]
+
+
+class ResourceRegistry:
+    """
+    Hierarchical registry of resources created in the workspaces.
+
+    Resources are addressed by their path, e.g. `("default", "catalog_1")` for
+    a catalog. The parent path of a child is the path without its last name.
+    """
+
+    def __init__(self):
+        self._children = {}
+        self._kinds = {}
+
+    def register(self, kind: str, path: tuple) -> bool:
+        """
+        Records a resource.
+
+        Args:
+            kind (str): `JOB`, `CATALOG`, `SCHEMA` or `TABLE`.
+            path (tuple): The resource path, from the workspace down.
+
+        Returns:
+            bool: False if the resource was already registered.
+        """
+        key = (kind, tuple(path[:-1]))
+        entry = self._children.get(key)
+        if entry is None:
+            entry = self._children[key] = ([], set())
+        names, members = entry
+
+        name = path[-1]
+        if name in members:
+            return False
+        members.add(name)
+        bisect.insort(names, name)
+        return True
+
+    def unregister(self, kind: str, path: tuple) -> bool:
+        """Forgets a resource. Returns False if it was not registered."""
+        key = (kind, tuple(path[:-1]))
+        entry = self._children.get(key)
+        if entry is None or path[-1] not in entry[1]:
+            return False
+        names, members = entry
+        members.discard(path[-1])
+        del names[bisect.bisect_left(names, path[-1])]
+        if not names:
+            del self._children[key]
+        return True
+
+    def children(self, kind: str, parent: tuple, after: str = None, limit: int = 100) -> list:
+        """
+        Lists one page of child names.
+
+        Args:
+            kind (str): The kind of children to list.
+            parent (tuple): The parent path.
+            after (str): Cursor; only names sorted after it are returned.
+            limit (int): Maximum number of names.
+
+        Returns:
+            list: Child names in sorted order.
+        """
+        entry = self._children.get((kind, tuple(parent)))
+        if entry is None:
+            return []
+        names = entry[0]
+        start = 0 if after is None else bisect.bisect_right(names, after)
+        return names[start : start + limit]
+
+    def count(self, kind: str, parent: tuple) -> int:
+        """Returns the number of registered children of a kind."""
+        entry = self._children.get((kind, tuple(parent)))
+        return 0 if entry is None else len(entry[0])
+
+    def clear(self):
+        """Forgets every resource and kind marker."""
+        self._children.clear()
+        self._kinds.clear()
+
+    def rebuild(self, enforcer):
+        """Rebuilds the registry from the kind markers and `p` rules of an enforcer."""
+        self.clear()
+        model = enforcer.get_model()
+        if has_kind_markers(model):
+            self.set_kinds(model["g"][KIND_PTYPE].policy)
+        assertion = model["p"]["p"]
+        if "p_obj" not in assertion.tokens:
+            return
+        obj_index = assertion.tokens.index("p_obj")
+        self.register_objects(rule[obj_index] for rule in assertion.policy)
+
+    def set_kinds(self, markers):
+        """
+        Records the kind of workspace children from their marker rules.
+
+        A child already registered as the other kind (or as both) is moved to
+        the marked kind.
+
+        Args:
+            markers (Iterable): `KIND_PTYPE` rules, see `kind_marker`.
+        """
+        for marker in markers:
+            if len(marker) != 2 or marker[1] not in _MARKED_KINDS:
+                continue
+            path = tuple(marker[0].split("."))
+            if len(path) != 2 or not all(path):
+                continue
+            kind = marker[1]
+            self._kinds[path] = kind
+            other = CATALOG if kind == JOB else JOB
+            if self.unregister(other, path):
+                self.register(kind, path)
+
+    def register_objects(self, objects):
+        """
+        Registers the resources named by policy object patterns.
+
+        Only objects written by the workspace routes (a literal
+        `workspace.name...` prefix followed by `optional_trailing_dot`) are
+        considered.
+
+        Args:
+            objects (Iterable): The `p.obj` values of the rules, e.g.
+                `"default.catalog_1(\\..*)?$"`.
+        """
+        paths = set()
+        children = set()
+        catalogs = set()
+        for obj in objects:
+            split = split_object_pattern(obj)
+            if split is None or split[1] != optional_trailing_dot:
+                continue
+            prefix = split[0]
+            if ":" in prefix or "/" in prefix:
+                continue
+            segments = tuple(prefix.split("."))
+            if 2 <= len(segments) <= 4 and all(segments):
+                paths.add(segments)
+                if len(segments) == 2:
+                    children.add(segments)
+
+        for path in paths:
+            # Deeper paths imply their ancestors.
+            for depth in range(len(path), 2, -1):
+                self.register(_KINDS_BY_DEPTH[depth], path[:depth])
+            if len(path) > 2:
+                catalogs.add(path[:2])
+
+        for path in children | catalogs:
+            kind = self._kinds.get(path)
+            if kind is not None:
+                self.register(kind, path)
+            elif path in catalogs or self.count(SCHEMA, path):
+                self.register(CATALOG, path)
+            else:
+                # Either kind; list it under both.
+                self.register(JOB, path)
+                self.register(CATALOG, path)
@@ -0,0 +1,428 @@
+"""
+sqlite_adapter.py
+=================
+Indexed SQLite Policy Storage with Filtered Loading
+
+`SqliteAdapter` stores the policy in a local SQLite file, one row per rule.
+Besides the raw fields (`v0`..`v5`) every `p` rule records three indexed
+columns derived from the model:
+
+- `priority`: the numeric `p.priority`, so rules load in evaluation order.
+- `subject`: the `p.sub` of rules written for one subject (NULL for subject
+  patterns such as `.*`, which apply to everyone).
+- `obj_root`: the literal head of `p.obj` up to its first `.` (NULL for
+  objects that are not a literal prefix plus a known suffix).
+
+Changes made through the enforcer are written incrementally, each call in its
+own transaction, so a save never rewrites the whole policy.
+
+A `PolicyFilter` loads only the rules that can apply to some object prefixes
+(a tenant such as `org1:` or a workspace subtree such as `default.catalog_1`)
+and, optionally, some subjects. A node can then serve a subset of the tenants
+without holding the whole policy in memory. Filtering is conservative: a rule
+is loaded whenever its object pattern could match an object under one of the
+prefixes. Grouping rules are always loaded in full. Like every filtered
+casbin adapter, a filtered enforcer refuses `save_policy`.
+
+Classes:
+--------
+- PolicyFilter: Object prefixes and subjects a node loads.
+- SqliteAdapter: casbin Adapter backed by an indexed SQLite table.
+"""
+
+import contextlib
+import os
+import sqlite3
+import threading
+
+from casbin import persist
+
+from services.journal_adapter import parse_policy_line, policy_token_counts
+from services.policy_index import is_literal_pattern, split_object_pattern
+
+# Number of rule fields a row can hold (`v0`..`v5`).
+MAX_FIELDS = 6
+
+_FIELDS = tuple(f"v{i}" for i in range(MAX_FIELDS))
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS casbin_rule ("
+    " id INTEGER PRIMARY KEY,"
+    " ptype TEXT NOT NULL,"
+    + "".join(f" {field} TEXT NOT NULL DEFAULT ''," for field in _FIELDS)
+    + " priority INTEGER,"
+    " subject TEXT,"
+    " obj_root TEXT)",
+    "CREATE INDEX IF NOT EXISTS casbin_rule_priority ON casbin_rule (ptype, priority)",
+    "CREATE INDEX IF NOT EXISTS casbin_rule_subject ON casbin_rule (subject)",
+    "CREATE INDEX IF NOT EXISTS casbin_rule_obj_root ON casbin_rule (obj_root)",
+    "CREATE INDEX IF NOT EXISTS casbin_rule_fields ON casbin_rule (ptype, v0, v1, v2)",
+)
+
+_INSERT = (
+    f"INSERT INTO casbin_rule (ptype, {', '.join(_FIELDS)}, priority, subject, obj_root)"
+    f" VALUES ({', '.join('?' * (len(_FIELDS) + 4))})"
+)
+
+_RULE_MATCH = "ptype = ? AND " + " AND ".join(f"{field} = ?" for field in _FIELDS)
+
+
+def object_root(obj: str):
+    """
+    Returns the literal head of an object pattern, up to its first `.`.
+
+    `.` is a regex wildcard, so only the part before it must match an object
+    character for character. Returns None when the pattern is not a literal
+    prefix followed by a known suffix.
+    """
+    split = split_object_pattern(obj)
+    if split is None:
+        return None
+    return split[0].split(".", 1)[0]
+
+
+def pattern_overlaps(obj: str, prefix: str) -> bool:
+    """
+    Tells whether an object pattern can match an object starting with `prefix`.
+
+    Conservative: patterns that are not a literal prefix plus a known suffix
+    always overlap.
+    """
+    split = split_object_pattern(obj)
+    if split is None:
+        return True
+    literal = split[0]
+    for rule_char, prefix_char in zip(literal, prefix):
+        if rule_char != prefix_char and rule_char != ".":
+            return False
+    return True
+
+
+class PolicyFilter:
+    """
+    Selects the part of the policy a node loads.
+
+    Attributes:
+    - object_prefixes (tuple): Object prefixes served by the node, e.g.
+        `("org1:", "default.catalog_1")`. Empty loads every object.
+    - subjects (tuple): Subjects served by the node, or None for everyone.
+        Rules written for subject patterns are always loaded.
+    - skipped_ptypes (tuple): Policy types that are not loaded at all.
+    """
+
+    def __init__(self, object_prefixes=(), subjects=None, skipped_ptypes=()):
+        self.object_prefixes = tuple(object_prefixes)
+        self.subjects = None if subjects is None else tuple(subjects)
+        self.skipped_ptypes = tuple(skipped_ptypes)
+
+
+class SqliteAdapter(persist.Adapter):
+    """
+    casbin adapter that keeps the policy in an indexed SQLite table.
+
+    Attributes:
+    - db_path (str): Path of the SQLite database.
+    - seed_path (str): A casbin policy CSV imported when the table is empty.
+    - default_filter (PolicyFilter): Filter applied by `load_policy`, or None.
+    """
+
+    def __init__(self, db_path: str, seed_path: str = None, default_filter: PolicyFilter = None):
+        self.db_path = db_path
+        self.seed_path = seed_path
+        self.default_filter = default_filter
+        self._filtered = False
+        self._columns = {}
+        self._lock = threading.Lock()
+        # Changes come from the event loop, loads may run in worker threads.
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+
+    def is_filtered(self) -> bool:
+        """Returns True if the last load was filtered."""
+        return self._filtered
+
+    def load_policy(self, model):
+        """Loads the policy, restricted to `default_filter` when one is set."""
+        self.load_filtered_policy(model, self.default_filter)
+
+    def load_filtered_policy(self, model, filter):
+        """
+        Loads the rules selected by a filter.
+
+        Args:
+            model (casbin.Model): The model to fill.
+            filter (PolicyFilter): The part of the policy to load, or None
+                for all of it.
+        """
+        self._bind(model)
+        token_counts = policy_token_counts(model)
+        with self._lock:
+            if self.seed_path and self._is_empty():
+                self._import_csv(self.seed_path, token_counts)
+            where, parameters = self._filter_clause(filter)
+            rows = self._connection.execute(
+                f"SELECT ptype, {', '.join(_FIELDS)} FROM casbin_rule{where} ORDER BY ptype, priority, id",
+                parameters,
+            ).fetchall()
+
+        prefixes = filter.object_prefixes if filter is not None else ()
+        for row in rows:
+            ptype = row[0]
+            if ptype not in token_counts:
+                continue
+            rule = list(row[1 : token_counts[ptype]])
+            if prefixes and ptype in self._columns and not self._overlaps(ptype, rule, prefixes):
+                continue
+            model[ptype[0]][ptype].policy.append(rule)
+        self._filtered = filter is not None
+
+    def save_policy(self, model):
+        """Replaces every stored rule with the model's rules in one transaction."""
+        self._bind(model)
+        rows = []
+        for sec in ("p", "g"):
+            if sec not in model.keys():
+                continue
+            for ptype, ast in model[sec].items():
+                rows.extend(self._row(ptype, rule) for rule in ast.policy)
+        with self._transaction() as cursor:
+            cursor.execute("DELETE FROM casbin_rule")
+            cursor.executemany(_INSERT, rows)
+        return True
+
+    def add_policy(self, sec, ptype, rule):
+        """Inserts a rule."""
+        with self._transaction() as cursor:
+            cursor.execute(_INSERT, self._row(ptype, rule))
+
+    def add_policies(self, sec, ptype, rules):
+        """Inserts rules in one transaction."""
+        with self._transaction() as cursor:
+            cursor.executemany(_INSERT, [self._row(ptype, rule) for rule in rules])
+
+    def add_policies_ex(self, sec, ptype, rules):
+        """Inserts rules in one transaction."""
+        self.add_policies(sec, ptype, rules)
+
+    def remove_policy(self, sec, ptype, rule):
+        """Deletes one stored copy of a rule."""
+        with self._transaction() as cursor:
+            return self._delete_rule(cursor, ptype, rule)
+
+    def remove_policies(self, sec, ptype, rules):
+        """Deletes one stored copy of each rule in one transaction."""
+        with self._transaction() as cursor:
+            for rule in rules:
+                self._delete_rule(cursor, ptype, rule)
+
+    def remove_filtered_policy(self, sec, ptype, field_index, *field_values):
+        """Deletes the rules whose fields from `field_index` on match the non-empty values."""
+        conditions, parameters = ["ptype = ?"], [ptype]
+        for i, value in enumerate(field_values):
+            if value != "":
+                conditions.append(f"{_FIELDS[field_index + i]} = ?")
+                parameters.append(value)
+        with self._transaction() as cursor:
+            cursor.execute(f"DELETE FROM casbin_rule WHERE {' AND '.join(conditions)}", parameters)
+        return True
+
+    def update_policy(self, sec, ptype, old_rule, new_rule):
+        """Replaces one stored copy of a rule."""
+        with self._transaction() as cursor:
+            return self._update_rule(cursor, ptype, old_rule, new_rule)
+
+    def update_policies(self, sec, ptype, old_rules, new_rules):
+        """Replaces one stored copy of each rule in one transaction."""
+        with self._transaction() as cursor:
+            for old_rule, new_rule in zip(old_rules, new_rules):
+                self._update_rule(cursor, ptype, old_rule, new_rule)
+        return True
+
+    def has_policy(self, ptype, rule) -> bool:
+        """Tells whether a rule is stored."""
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT 1 FROM casbin_rule WHERE {_RULE_MATCH} LIMIT 1", self._match_parameters(ptype, rule)
+            ).fetchone()
+        return row is not None
+
+    def objects(self, ptype: str = "p") -> list:
+        """Returns the `p.obj` value of every stored rule of a policy type."""
+        columns = self._columns.get(ptype)
+        if columns is None:
+            return []
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {_FIELDS[columns[2]]} FROM casbin_rule WHERE ptype = ?", (ptype,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def rules(self, ptype: str, size: int) -> list:
+        """Returns the first `size` fields of every stored rule of a policy type."""
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {', '.join(_FIELDS[:size])} FROM casbin_rule WHERE ptype = ? ORDER BY id", (ptype,)
+            ).fetchall()
+        return [list(row) for row in rows]
+
+    def priority_counts(self, ptype: str = "p") -> dict:
+        """Returns the number of stored rules of a policy type by priority."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT priority, COUNT(*) FROM casbin_rule WHERE ptype = ? AND priority IS NOT NULL"
+                " GROUP BY priority",
+                (ptype,),
+            ).fetchall()
+        return dict(rows)
+
+    def iter_rules(self, token_counts, page_size: int = 1000):
+        """
+        Yields `(ptype, rule)` for every stored rule, reading one page at a time.
+
+        Args:
+            token_counts (dict): Line length per policy type (see
+                `policy_token_counts`); rules of other types are skipped.
+            page_size (int): Rows read per query.
+        """
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    f"SELECT id, ptype, {', '.join(_FIELDS)} FROM casbin_rule WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, page_size),
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            for row in rows:
+                ptype = row[1]
+                if ptype in token_counts:
+                    yield ptype, list(row[2 : token_counts[ptype] + 1])
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def _bind(self, model):
+        """Records where priority, subject and object live in each `p` type."""
+        if "p" not in model.keys():
+            return
+        for ptype, ast in model["p"].items():
+            if all(token in ast.tokens for token in ("p_priority", "p_sub", "p_obj")):
+                self._columns[ptype] = (
+                    ast.tokens.index("p_priority"),
+                    ast.tokens.index("p_sub"),
+                    ast.tokens.index("p_obj"),
+                )
+
+    def _row(self, ptype, rule):
+        if len(rule) > MAX_FIELDS:
+            raise ValueError(f"rules with more than {MAX_FIELDS} fields cannot be stored: {rule}")
+        priority = subject = root = None
+        columns = self._columns.get(ptype)
+        if columns is not None and len(rule) > max(columns):
+            priority_index, sub_index, obj_index = columns
+            if rule[priority_index].isdigit():
+                priority = int(rule[priority_index])
+            if is_literal_pattern(rule[sub_index]):
+                subject = rule[sub_index]
+            root = object_root(rule[obj_index])
+        fields = list(rule) + [""] * (MAX_FIELDS - len(rule))
+        return (ptype, *fields, priority, subject, root)
+
+    def _filter_clause(self, filter):
+        if filter is None:
+            return "", []
+        # Grouping rules and other types without derived columns are always loaded.
+        clauses, parameters = [], []
+        if filter.object_prefixes:
+            alternatives = ["obj_root IS NULL"]
+            for prefix in filter.object_prefixes:
+                head = prefix.split(".", 1)[0]
+                heads = [head[:end] for end in range(len(head) + 1)]
+                alternatives.append(f"obj_root IN ({', '.join('?' * len(heads))})")
+                parameters.extend(heads)
+                if "." not in prefix:
+                    # Roots that continue the prefix, e.g. `org1:team` for `org1:`.
+                    alternatives.append("(obj_root >= ? AND obj_root < ?)")
+                    parameters.extend((prefix, prefix + "\U0010ffff"))
+            clauses.append("(" + " OR ".join(alternatives) + ")")
+        if filter.subjects is not None:
+            clauses.append(f"(subject IS NULL OR subject IN ({', '.join('?' * len(filter.subjects))}))")
+            parameters.extend(filter.subjects)
+
+        condition = ""
+        if clauses:
+            bound = list(self._columns)
+            condition = " AND ".join(clauses)
+            if bound:
+                condition = f"ptype NOT IN ({', '.join('?' * len(bound))}) OR ({condition})"
+                parameters = bound + parameters
+        if filter.skipped_ptypes:
+            skipped = f"ptype NOT IN ({', '.join('?' * len(filter.skipped_ptypes))})"
+            condition = f"{skipped} AND ({condition})" if condition else skipped
+            parameters = list(filter.skipped_ptypes) + parameters
+        if not condition:
+            return "", []
+        return f" WHERE {condition}", parameters
+
+    def _overlaps(self, ptype, rule, prefixes):
+        obj = rule[self._columns[ptype][2]]
+        return any(pattern_overlaps(obj, prefix) for prefix in prefixes)
+
+    def _delete_rule(self, cursor, ptype, rule):
+        cursor.execute(
+            f"DELETE FROM casbin_rule WHERE id = (SELECT id FROM casbin_rule WHERE {_RULE_MATCH} LIMIT 1)",
+            self._match_parameters(ptype, rule),
+        )
+        return cursor.rowcount > 0
+
+    def _update_rule(self, cursor, ptype, old_rule, new_rule):
+        row = self._row(ptype, new_rule)
+        cursor.execute(
+            f"UPDATE casbin_rule SET {', '.join(f'{field} = ?' for field in _FIELDS)},"
+            " priority = ?, subject = ?, obj_root = ?"
+            f" WHERE id = (SELECT id FROM casbin_rule WHERE {_RULE_MATCH} LIMIT 1)",
+            list(row[1:]) + self._match_parameters(ptype, old_rule),
+        )
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _match_parameters(ptype, rule):
+        return [ptype] + list(rule) + [""] * (MAX_FIELDS - len(rule))
+
+    def _is_empty(self):
+        return self._connection.execute("SELECT 1 FROM casbin_rule LIMIT 1").fetchone() is None
+
+    def _import_csv(self, path, token_counts):
+        """Copies a casbin policy CSV into the (empty) table."""
+        if not os.path.isfile(path):
+            return
+        rows = []
+        with open(path, "r") as file:
+            for line in file:
+                tokens = parse_policy_line(line.strip(), token_counts)
+                if tokens and tokens[0] in token_counts:
+                    rows.append(self._row(tokens[0], tokens[1:]))
+        with self._begin() as cursor:
+            cursor.executemany(_INSERT, rows)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Runs statements in one transaction under the adapter lock."""
+        with self._lock, self._begin() as cursor:
+            yield cursor
+
+    @contextlib.contextmanager
+    def _begin(self):
+        cursor = self._connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
@@ -0,0 +1,211 @@
+"""
+subject_resolver.py
+===================
+Cached Subject Resolution for the Policy Matcher
+
+The matcher starts with `g(r.sub, p.sub) || regexMatch(r.sub, p.sub)`, so
+casbin walks the role graph and runs a subject regex for every rule it
+evaluates. `SubjectResolver` answers that clause once per request subject: it
+computes the set of `p.sub` values the subject matches (itself, its
+transitive roles and every subject pattern it satisfies) and caches it. The
+enforcer then skips rules whose subject is not in the set and evaluates the
+clause as a set-membership test.
+
+The resolver mirrors casbin's semantics exactly:
+
+- `g(sub, role)` is true when `role` is reachable from `sub` in fewer than
+  `max_hierarchy_level` steps of the default role manager (BFS, like
+  `RoleManager.has_link`).
+- `regexMatch(sub, pattern)` is `re.match`, anchored only at the start, so a
+  plain subject such as `cto` also matches `cto_backup`. Plain subjects are
+  therefore checked as prefixes of the request subject.
+
+The subject patterns are matched together by a `PatternSet` when there are
+many of them, so resolving a new subject takes a few regex calls instead of
+one per pattern.
+
+Cached sets are kept up to date incrementally: a new `p.sub` value is tested
+against every cached subject, and a grouping change only drops the subjects
+whose role set contains the changed user.
+
+Classes:
+--------
+- SubjectResolver: Per-subject cache of matching `p.sub` values.
+"""
+
+import re
+from collections import Counter, OrderedDict
+
+from services.pattern_set import MIN_PATTERNS, PatternSet, iter_bits
+from services.policy_index import is_literal_pattern
+
+
+class _Resolution:
+    """The roles of a subject and the `p.sub` values it matches."""
+
+    __slots__ = ("roles", "subjects")
+
+    def __init__(self, roles, subjects):
+        self.roles = roles
+        self.subjects = subjects
+
+
+class SubjectResolver:
+    """
+    Caches, per request subject, the set of policy subjects it matches.
+
+    Attributes:
+    - role_manager (RoleManager): The role manager behind `g`, or None.
+    - maxsize (int): Maximum number of cached subjects.
+    - hits (int): Resolutions answered from the cache.
+    - misses (int): Resolutions that had to be computed.
+    - invalidations (int): Cached subjects dropped by grouping changes.
+    """
+
+    def __init__(self, role_manager=None, maxsize: int = 10000):
+        self.role_manager = role_manager
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._counts = Counter()
+        self._plain = set()
+        self._patterns = {}
+        # PatternSet over the subject patterns and the patterns by ID, built on first use.
+        self._pattern_set = None
+        self._pattern_list = None
+        self._cache = OrderedDict()
+
+    def rebuild(self, policy_subjects, role_manager=None):
+        """Resets the resolver to a new set of `p.sub` values and role manager."""
+        self.role_manager = role_manager
+        self._counts = Counter()
+        self._plain = set()
+        self._patterns = {}
+        self._pattern_set = None
+        self._cache.clear()
+        self.add_subjects(policy_subjects)
+
+    def add_subjects(self, policy_subjects):
+        """Records `p.sub` values of added rules."""
+        for subject in policy_subjects:
+            self._counts[subject] += 1
+            if self._counts[subject] > 1:
+                continue
+            if is_literal_pattern(subject):
+                self._plain.add(subject)
+            else:
+                self._patterns[subject] = re.compile(subject)
+                self._pattern_set = None
+            for sub, resolution in self._cache.items():
+                if self._matches(sub, resolution.roles, subject):
+                    resolution.subjects.add(subject)
+
+    def remove_subjects(self, policy_subjects):
+        """Forgets `p.sub` values of removed rules."""
+        for subject in policy_subjects:
+            if self._counts[subject] <= 0:
+                continue
+            self._counts[subject] -= 1
+            if self._counts[subject] > 0:
+                continue
+            del self._counts[subject]
+            self._plain.discard(subject)
+            if self._patterns.pop(subject, None) is not None:
+                self._pattern_set = None
+            for resolution in self._cache.values():
+                resolution.subjects.discard(subject)
+
+    def links_changed(self, users):
+        """Drops the cached subjects whose roles include a user whose links changed."""
+        users = set(users)
+        stale = [sub for sub, resolution in self._cache.items() if not users.isdisjoint(resolution.roles)]
+        for sub in stale:
+            del self._cache[sub]
+        self.invalidations += len(stale)
+
+    def clear(self):
+        """Drops every cached subject (e.g. after the role links were rebuilt)."""
+        self.invalidations += len(self._cache)
+        self._cache.clear()
+
+    def matching_subjects(self, sub: str) -> set:
+        """
+        Returns the `p.sub` values for which the subject clause holds.
+
+        Args:
+            sub (str): The request subject.
+
+        Returns:
+            set: Policy subjects `p` with `g(sub, p) or regexMatch(sub, p)`.
+        """
+        resolution = self._cache.get(sub)
+        if resolution is not None:
+            self._cache.move_to_end(sub)
+            self.hits += 1
+            return resolution.subjects
+
+        self.misses += 1
+        roles = self._roles(sub)
+        subjects = {role for role in roles if role in self._counts}
+        subjects.update(sub[:end] for end in range(len(sub) + 1) if sub[:end] in self._plain)
+        subjects.update(self._matching_patterns(sub))
+
+        self._cache[sub] = _Resolution(roles, subjects)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return subjects
+
+    def stats(self):
+        """
+        Returns the resolver counters.
+
+        Returns:
+            dict: Cached subjects, distinct policy subjects, hits, misses and invalidations.
+        """
+        return {
+            "size": len(self._cache),
+            "policy_subjects": len(self._counts),
+            "subject_patterns": len(self._patterns),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    def _matching_patterns(self, sub):
+        if len(self._patterns) < MIN_PATTERNS:
+            return [pattern for pattern, regex in self._patterns.items() if regex.match(sub)]
+        if self._pattern_set is None:
+            self._pattern_list = list(self._patterns)
+            self._pattern_set = PatternSet(self._pattern_list)
+        return [self._pattern_list[position] for position in iter_bits(self._pattern_set.match(sub))]
+
+    def _matches(self, sub, roles, subject):
+        if subject in roles:
+            return True
+        regex = self._patterns.get(subject)
+        if regex is not None:
+            return regex.match(sub) is not None
+        return sub.startswith(subject)
+
+    def _roles(self, sub):
+        """Names reachable from `sub` the way `RoleManager.has_link` searches them."""
+        if self.role_manager is None:
+            # Without role links `g` compares the names.
+            return frozenset((sub,))
+
+        level = self.role_manager.max_hierarchy_level
+        start = self.role_manager.all_roles.get(sub)
+        if start is None:
+            return frozenset((sub,)) if level > 0 else frozenset()
+
+        names = set()
+        frontier = {start}
+        while level > 0 and frontier:
+            next_frontier = set()
+            for role in frontier:
+                names.add(role.name)
+                next_frontier.update(role.roles)
+            frontier = next_frontier
+            level -= 1
+        return frozenset(names)
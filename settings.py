@@ -3,3 +3,94 @@ MODEL_CONF_PATH = "/Users/zero/Projects/casbin_authorization_2/model.conf"
 
 # The file path to the Casbin policy CSV file (`policy.csv`)
 POLICY_CSV_PATH = "/Users/zero/Projects/casbin_authorization_2/policy.csv"
+
+# The maximum number of authorization decisions kept in the in-process LRU cache
+# (0 disables the cache)
+DECISION_CACHE_SIZE = 10000
+
+# The lifetime of a cached decision in seconds (None keeps it until the policy changes)
+DECISION_CACHE_TTL = None
+
+# How long (in seconds) policy changes are coalesced before they are written to storage
+POLICY_FLUSH_INTERVAL = 0.5
+
+# The number of pending policy save requests that triggers an immediate flush
+POLICY_FLUSH_BATCH_SIZE = 100
+
+# Where the policy is stored: "csv" rewrites `POLICY_CSV_PATH` on every flush, "journal" uses
+# `POLICY_CSV_PATH` as a snapshot and appends changes to journal segments next to it, "sqlite"
+# commits every change to `POLICY_SQLITE_PATH`
+POLICY_STORAGE = "csv"
+
+# The SQLite database used when `POLICY_STORAGE` is "sqlite" (seeded from `POLICY_CSV_PATH`
+# when empty)
+POLICY_SQLITE_PATH = "/Users/zero/Projects/casbin_authorization_2/policy.db"
+
+# The object prefixes this node serves with the "sqlite" storage, e.g. ["org1:", "default"]
+# (None loads the whole policy; a filtered policy cannot be saved as a whole)
+POLICY_LOAD_OBJECT_PREFIXES = None
+
+# Split the policy into per-tenant enforcers that are loaded on demand (requires the "sqlite"
+# storage; shards are not kept in sync across workers, so `POLICY_SYNC_PATH` must be None)
+ENFORCER_SHARDING = False
+
+# The maximum number of tenant enforcers kept in memory
+ENFORCER_MAX_SHARDS = 1000
+
+# How long (in seconds) an unused tenant enforcer stays in memory
+ENFORCER_SHARD_IDLE_TIMEOUT = 600
+
+# The number of journal records after which the journal is folded into a new snapshot
+POLICY_JOURNAL_COMPACT_THRESHOLD = 50000
+
+# The number of threads that evaluate authorization checks off the event loop
+# (0 evaluates them inline on the event loop)
+ENFORCE_POOL_WORKERS = 4
+
+# The maximum number of authorization checks queued on the enforcement pool at once
+ENFORCE_POOL_MAX_QUEUE = 256
+
+# The maximum number of checks accepted by one `/authz/batch-check` request
+AUTHZ_BATCH_MAX_SIZE = 1000
+
+# The maximum number of resources accepted by one `batch-create` (or `batch-upload`) request
+BULK_CREATE_MAX_ITEMS = 10000
+
+# Users allowed to export and import the whole policy at `/admin/v1/policy/...`
+# (an empty tuple disables the endpoints)
+POLICY_ADMIN_USERS = ("supreme",)
+
+# The number of rules a policy import adds to the enforcer at once (each batch is added on the
+# event loop, so larger batches hold up other requests longer)
+POLICY_IMPORT_BATCH_SIZE = 1000
+
+# The maximum page size of the list-filter endpoints
+RESOURCE_LIST_MAX_LIMIT = 1000
+
+# The maximum number of children a list-filter page evaluates before it returns a partial page
+RESOURCE_LIST_MAX_SCAN = 10000
+
+# The shared policy delta log that keeps the policy of all uvicorn workers in sync
+# (None disables synchronization, e.g. for a single worker; cannot be combined with the
+# "journal" storage, whose segments each worker would compact under the others)
+POLICY_SYNC_PATH = None
+
+# How often (in seconds) a worker polls the policy delta log for changes of other workers
+POLICY_SYNC_INTERVAL = 0.2
+
+# The size in bytes after which the policy delta log is folded into a new snapshot
+POLICY_SYNC_MAX_LOG_BYTES = 16 * 1024 * 1024
+
+# How often (in seconds) duplicate, shadowed and subsumed policy rules are removed from the
+# running policy (None disables it; requires POLICY_STORAGE = "csv" without POLICY_SYNC_PATH)
+POLICY_COMPACT_INTERVAL = None
+
+# Request header that asks for an authorization trace, returned in the same response header
+# (None disables it; traces reveal policy rules, e.g. "X-Authz-Explain" for debugging)
+AUTHZ_EXPLAIN_HEADER = None
+
+# The share of requests whose authorization checks are traced and logged (0 disables sampling)
+AUTHZ_EXPLAIN_SAMPLE_RATE = 0.0
+
+# Whether the app serves its metrics in the Prometheus text format at `/metrics`
+METRICS_ENABLED = True
@@ -0,0 +1,40 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# The tests import the service modules the way the app does, from the repository root.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+MODEL_PATH = os.path.join(ROOT, "model.conf")
+POLICY_PATH = os.path.join(ROOT, "policy.csv")
+
+
+@pytest.fixture(scope="session")
+def app_client(tmp_path_factory):
+    """
+    A client of the app, with the policy copied to a temporary directory.
+
+    The settings are read when `services.auth_service` is first imported, so
+    they are pointed at the copy before `main` is imported.
+    """
+    import settings
+
+    policy_path = tmp_path_factory.mktemp("app") / "policy.csv"
+    shutil.copy(POLICY_PATH, policy_path)
+    settings.MODEL_CONF_PATH = MODEL_PATH
+    settings.POLICY_CSV_PATH = str(policy_path)
+
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
+
+
+def bearer(username: str) -> dict:
+    """The authorization header of a user (the access token is the username)."""
+    return {"Authorization": f"Bearer {username}"}
@@ -0,0 +1,22 @@
+"""
+Tests of the setting combinations the service refuses to start with.
+"""
+
+import pytest
+
+
+def test_journal_storage_rejects_policy_sync(app_client, monkeypatch):
+    from services import auth_service
+
+    monkeypatch.setattr(auth_service, "POLICY_STORAGE", "journal")
+    monkeypatch.setattr(auth_service, "POLICY_SYNC_PATH", "/tmp/policy.sync")
+    with pytest.raises(ValueError, match="POLICY_SYNC_PATH"):
+        auth_service.create_policy_adapter()
+
+
+def test_sharding_rejects_other_storages(app_client, monkeypatch):
+    from services import auth_service
+
+    monkeypatch.setattr(auth_service, "ENFORCER_SHARDING", True)
+    with pytest.raises(ValueError, match="ENFORCER_SHARDING"):
+        auth_service.create_enforcer()
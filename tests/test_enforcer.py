@@ -0,0 +1,152 @@
+"""
+Tests of `IndexedEnforcer` against the stock `casbin.Enforcer`: the same
+seeded, route-shaped policy and changes, decided by both.
+"""
+
+import random
+
+import casbin
+import pytest
+
+from conftest import MODEL_PATH
+from constants import optional_trailing_colon, optional_trailing_dot, optional_trailing_forward_slash
+from services.enforcer import IndexedEnforcer
+
+MODEL_WITHOUT_SUBJECT_CLAUSE = """
+[request_definition]
+r = sub, obj, act, req_body
+
+[policy_definition]
+p = priority, sub, obj, act, req_body, eft
+
+[policy_effect]
+e = priority(p.eft) || deny
+
+[matchers]
+m = r.sub == p.sub && keyMatch(r.obj, p.obj) && regexMatch(r.act, p.act)
+"""
+
+
+def test_matcher_without_a_resolvable_subject_clause(tmp_path):
+    path = tmp_path / "policy.csv"
+    path.write_text(
+        "p, 10, alice, /ws/*, .*, .*, allow\n"
+        "p, 20, bob, /ws/private, .*, .*, deny\n"
+        "p, 30, bob, /ws/*, GET, .*, allow\n"
+    )
+    model_path = tmp_path / "model.conf"
+    model_path.write_text(MODEL_WITHOUT_SUBJECT_CLAUSE)
+    indexed = IndexedEnforcer(str(model_path), str(path))
+    stock = casbin.Enforcer(str(model_path), str(path))
+
+    assert indexed.subject_resolver is None and indexed.policy_index is not None
+    requests = [
+        (sub, obj, act, "")
+        for sub in ("alice", "bob", "carol")
+        for obj in ("/ws/a", "/ws/private", "/other")
+        for act in ("GET", "POST")
+    ]
+    assert [indexed.enforce(*request) for request in requests] == [stock.enforce(*request) for request in requests]
+    assert indexed.batch_enforce(requests) == stock.batch_enforce(requests)
+
+
+# Subjects of the generated rules: users whose names prefix each other,
+# roles and subject patterns.
+RULE_SUBJECTS = ["alice", "alice2", "bob", "carol", "dev", "readers", ".*", "alice.*", "dev_.*", "(alice|bob)"]
+REQUEST_SUBJECTS = ["alice", "alice2", "alice_x", "bob", "carol", "dev", "dev_1", "mallory", "readers", "root"]
+ROLES = ["dev", "readers", "alice", "bob"]
+NAMES = ["default", "ws1", "ws_1", "cat", "cat1", "s", "t", "org1", "b1", "f1"]
+PRIORITIES = ["10", "30", "31", "40", "41", "42", "50", "60", "140", "141", "150", "160", "1000"]
+
+
+def random_object(rng):
+    """A rule object shaped like the ones the routes write, or a cross-tenant pattern."""
+    draw = rng.random()
+    if draw < 0.6:
+        return ".".join(rng.choice(NAMES) for _ in range(rng.randint(1, 4))) + optional_trailing_dot
+    if draw < 0.75:
+        return rng.choice(NAMES) + optional_trailing_colon
+    if draw < 0.9:
+        path = "/".join(rng.choice(NAMES) for _ in range(rng.randint(1, 2)))
+        return f"{rng.choice(NAMES)}:{path}{optional_trailing_forward_slash}"
+    return rng.choice([".*", "ws1\\..*", "default(\\..*)?$", "org1:.*"])
+
+
+def random_rule(rng):
+    return [
+        rng.choice(PRIORITIES),
+        rng.choice(RULE_SUBJECTS),
+        random_object(rng),
+        rng.choice([".*", ".*", "GET", "POST", "(GET)|(POST)"]),
+        rng.choice([".*", ".*", ".*x.*"]),
+        rng.choice(["allow", "allow", "deny"]),
+    ]
+
+
+def random_request(rng):
+    draw = rng.random()
+    if draw < 0.6:
+        obj = ".".join(rng.choice(NAMES) for _ in range(rng.randint(1, 5)))
+    elif draw < 0.9:
+        obj = f"{rng.choice(NAMES)}:" + "/".join(rng.choice(NAMES) for _ in range(rng.randint(1, 3)))
+    else:
+        obj = rng.choice(NAMES)
+    return (rng.choice(REQUEST_SUBJECTS), obj, rng.choice(["GET", "POST", "DELETE"]), rng.choice(["", '{"x": 1}']))
+
+
+def assert_same_decisions(indexed, stock, requests):
+    expected = [stock.enforce_ex(*request) for request in requests]
+    assert [indexed.enforce_ex(*request) for request in requests] == expected
+    assert indexed.batch_enforce(requests) == [decision for decision, _ in expected]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_decisions_match_the_stock_enforcer(tmp_path, seed):
+    rng = random.Random(seed)
+    rules = {tuple(random_rule(rng)) for _ in range(250)}
+    groupings = {(rng.choice(REQUEST_SUBJECTS), rng.choice(ROLES)) for _ in range(8)}
+    path = tmp_path / "policy.csv"
+    path.write_text(
+        "".join("p, " + ", ".join(rule) + "\n" for rule in rules)
+        + "".join("g, " + ", ".join(grouping) + "\n" for grouping in groupings)
+    )
+    indexed = IndexedEnforcer(MODEL_PATH, str(path))
+    stock = casbin.Enforcer(MODEL_PATH, str(path))
+    # Changes go to memory only, like the stock enforcer without an adapter write.
+    indexed.auto_save = stock.auto_save = False
+
+    assert indexed.get_policy() == stock.get_policy()
+    assert_same_decisions(indexed, stock, [random_request(rng) for _ in range(200)])
+
+    for step in range(80):
+        draw = rng.random()
+        policy = stock.get_policy()
+        if draw < 0.3:
+            rule = random_rule(rng)
+            assert indexed.add_policy(*rule) == stock.add_policy(*rule)
+        elif draw < 0.45:
+            new = [rule for rule in (random_rule(rng) for _ in range(5)) if not stock.has_policy(*rule)]
+            new = [list(rule) for rule in dict.fromkeys(map(tuple, new))]
+            assert indexed.add_policies(new) == stock.add_policies(new)
+        elif draw < 0.6 and policy:
+            rule = rng.choice(policy)
+            assert indexed.remove_policy(*rule) == stock.remove_policy(*rule)
+        elif draw < 0.7 and len(policy) > 3:
+            removed = rng.sample(policy, 3)
+            assert indexed.remove_policies(removed) == stock.remove_policies(removed)
+        elif draw < 0.8 and policy:
+            positions = set(rng.sample(range(len(policy)), min(4, len(policy))))
+            assert indexed.remove_rules_at(positions, indexed.policy_generation)
+            assertion = stock.get_model()["p"]["p"]
+            assertion.policy = [rule for position, rule in enumerate(assertion.policy) if position not in positions]
+        elif draw < 0.9:
+            grouping = [rng.choice(REQUEST_SUBJECTS), rng.choice(ROLES)]
+            assert indexed.add_grouping_policy(*grouping) == stock.add_grouping_policy(*grouping)
+        else:
+            grouping = rng.choice(stock.get_grouping_policy() or [[rng.choice(REQUEST_SUBJECTS), rng.choice(ROLES)]])
+            assert indexed.remove_grouping_policy(*grouping) == stock.remove_grouping_policy(*grouping)
+
+        assert indexed.get_policy() == stock.get_policy()
+        assert_same_decisions(indexed, stock, [random_request(rng) for _ in range(15)])
+
+    assert indexed.policy_index is not None and indexed.policy_index.size == len(indexed.get_policy())
@@ -0,0 +1,136 @@
+"""
+Tests of `services.matcher_compiler`: compiled matchers against `simpleeval`,
+and the matchers that must fall back to it.
+"""
+
+import casbin
+import pytest
+from casbin.persist.adapters import FileAdapter
+
+from conftest import MODEL_PATH, POLICY_PATH
+from benchmarks.policy_generator import PolicyGenerator
+from services.enforcer import IndexedEnforcer
+from services.matcher_compiler import check_matcher, compile_matcher
+from services.policy_compactor import sample_requests
+
+MODEL_TEMPLATE = """
+[request_definition]
+r = sub, obj, act, req_body
+
+[policy_definition]
+p = priority, sub, obj, act, req_body, eft
+
+[role_definition]
+g = _, _
+
+[policy_effect]
+e = priority(p.eft) || deny
+
+[matchers]
+m = {matcher}
+"""
+
+# Matchers the compiler handles, besides the one of `model.conf`.
+COMPILED_MATCHERS = [
+    "r.sub == p.sub && keyMatch(r.obj, p.obj) && r.act in ('GET', 'POST')",
+    r"!(r.sub != p.sub) || regexMatch(r.obj, 'ws_1\\..*') && p.eft == 'deny'",
+    "g(r.sub, p.sub) && r.obj == p.obj || r.sub == 'root' && !regexMatch(r.act, 'DELETE')",
+    "(regexMatch(r.sub, p.sub) || g(r.sub, p.sub)) && keyMatch(r.obj, p.obj) && r.act != 'PATCH'",
+]
+
+# Matchers only `simpleeval` evaluates: `eval()`, attribute access, arithmetic and unknown names.
+FALLBACK_MATCHERS = [
+    "eval(p.sub) && r.obj == p.obj",
+    "r.sub.Name == p.sub && r.obj == p.obj",
+    "r.priority + 1 > p.priority",
+    "len(r.obj) > 3 && r.sub == p.sub",
+    "unknown == r.sub",
+    "r.obj[0] == p.obj",
+]
+
+
+def enforcer_for(policy_path, matcher=None):
+    if matcher is None:
+        return IndexedEnforcer(MODEL_PATH, policy_path)
+    model = IndexedEnforcer.new_model(text=MODEL_TEMPLATE.format(matcher=matcher))
+    return IndexedEnforcer(model, FileAdapter(policy_path))
+
+
+def model_requests(enforcer, count=500, seed=0):
+    model = enforcer.get_model()
+    return sample_requests(model["p"]["p"].policy, model["p"]["p"].tokens, count, seed)
+
+
+@pytest.fixture(scope="module")
+def generated_policy(tmp_path_factory):
+    generator = PolicyGenerator(users=60, seed=7)
+    rules = generator.rules(4000)
+    path = tmp_path_factory.mktemp("generated") / "policy.csv"
+    generator.write_csv(rules, str(path), [["user_1", "user_2"], ["user_3", "user_1"]])
+    return str(path), generator.requests(1000)
+
+
+def test_policy_csv_matches_simpleeval():
+    enforcer = enforcer_for(POLICY_PATH)
+    requests = model_requests(enforcer) + [("root", "default.catalog_1", "GET", ""), ("cto", "other", "POST", "")]
+    assert check_matcher(enforcer, requests, rules_per_request=50) == []
+
+
+def test_generated_policy_matches_simpleeval(generated_policy):
+    path, requests = generated_policy
+    enforcer = enforcer_for(path)
+    assert enforcer.subject_resolver is not None
+    assert check_matcher(enforcer, requests + model_requests(enforcer, seed=1), rules_per_request=50) == []
+
+
+@pytest.mark.parametrize("matcher", COMPILED_MATCHERS)
+def test_other_matchers_match_simpleeval(generated_policy, matcher):
+    path, requests = generated_policy
+    enforcer = enforcer_for(path, matcher)
+    model = enforcer.get_model()
+    functions = enforcer._enforce_functions()
+    assert compile_matcher(model["m"]["m"].value, model["r"]["r"].tokens, model["p"]["p"].tokens, functions)
+    assert check_matcher(enforcer, requests[:300], rules_per_request=100) == []
+
+
+@pytest.mark.parametrize("matcher", FALLBACK_MATCHERS)
+def test_unsupported_matchers_are_not_compiled(matcher):
+    enforcer = enforcer_for(POLICY_PATH, matcher)
+    model = enforcer.get_model()
+    functions = enforcer._enforce_functions()
+    assert compile_matcher(model["m"]["m"].value, model["r"]["r"].tokens, model["p"]["p"].tokens, functions) is None
+
+
+def test_abac_matcher_falls_back_to_simpleeval(tmp_path):
+    model_text = """
+[request_definition]
+r = sub, obj, act
+
+[policy_definition]
+p = sub_rule, obj, act
+
+[policy_effect]
+e = some(where (p.eft == allow))
+
+[matchers]
+m = eval(p.sub_rule) && r.obj == p.obj && r.act == p.act
+"""
+    model_path = tmp_path / "abac.conf"
+    model_path.write_text(model_text)
+    policy_path = tmp_path / "abac.csv"
+    policy_path.write_text("p, r.sub.Age > 18, /data1, read\np, r.sub.Age < 60, /data2, write\n")
+
+    class Subject:
+        def __init__(self, age):
+            self.Age = age
+
+    indexed = IndexedEnforcer(str(model_path), str(policy_path))
+    stock = casbin.Enforcer(str(model_path), str(policy_path))
+    model = indexed.get_model()
+    functions = indexed._enforce_functions()
+    assert compile_matcher(model["m"]["m"].value, model["r"]["r"].tokens, model["p"]["p"].tokens, functions) is None
+
+    for age in (10, 30, 70):
+        for obj, act in (("/data1", "read"), ("/data2", "write"), ("/data1", "write")):
+            request = (Subject(age), obj, act)
+            assert indexed.enforce(*request) == stock.enforce(*request)
@@ -0,0 +1,131 @@
+"""
+Differential tests of the policy compactor: the compacted policy must decide
+every request like the original, and keep the rules the resource registry is
+rebuilt from.
+"""
+
+import asyncio
+import random
+
+import pytest
+
+from conftest import MODEL_PATH
+from constants import AccessLevel, optional_trailing_dot
+from benchmarks.policy_generator import PolicyGenerator
+from services.enforcer import IndexedEnforcer
+from services.policy_compactor import (
+    OWNER_PRIORITIES,
+    PolicyCompactor,
+    find_redundant_rules,
+    sample_requests,
+    verify_compaction,
+)
+from services.policy_persister import PolicyPersister
+from services.resource_registry import CATALOG, SCHEMA, ResourceRegistry
+
+USERS = ["alice", "bob", "root"]
+
+
+def redundant_rules(rng, count):
+    """Rules the routes write, with repeated creates below owned subtrees."""
+    rules = [["10", "root", ".*", ".*", ".*", "allow"]]
+    for _ in range(count):
+        user = rng.choice(USERS)
+        catalog = f"ws.cat_{rng.randrange(4)}"
+        schema = f"{catalog}.schema_{rng.randrange(3)}"
+        level, obj = rng.choice(
+            [
+                (AccessLevel.WORKSPACE_OWNER, "ws"),
+                (AccessLevel.CATALOG_OWNER, catalog),
+                (AccessLevel.CATALOG_READER, catalog),
+                (AccessLevel.CATALOG_DENY_ALL, catalog),
+                (AccessLevel.SCHEMA_OWNER, schema),
+                (AccessLevel.SCHEMA_DENY_ALL, schema),
+            ]
+        )
+        deny = level.name.endswith("DENY_ALL")
+        rules.append(
+            [
+                level.value,
+                ".*" if deny else user,
+                obj + optional_trailing_dot,
+                "GET" if level.name.endswith("READER") else ".*",
+                ".*",
+                "deny" if deny else "allow",
+            ]
+        )
+    rules.append(["1000", ".*", ".*", ".*", ".*", "allow"])
+    return sorted(rules, key=lambda rule: int(rule[0]))
+
+
+def compacted(model, rules, report):
+    positions = set(report.positions)
+    return [rule for position, rule in enumerate(rules) if position not in positions]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_decisions_are_unchanged(seed):
+    rules = redundant_rules(random.Random(seed), 80)
+    model = IndexedEnforcer.new_model(path=MODEL_PATH)
+    report = find_redundant_rules(model, rules)
+    assert report.removed
+
+    after = compacted(model, rules, report)
+    tokens = model["p"]["p"].tokens
+    requests = sample_requests(rules, tokens, 2000, seed, [rule for rule, _, _ in report.removed])
+    with open(MODEL_PATH) as file:
+        model_text = file.read()
+    assert verify_compaction(model_text, {("p", "p"): rules}, {("p", "p"): after}, requests) == []
+
+
+def test_generated_policy_decisions_are_unchanged():
+    generator = PolicyGenerator(users=20, seed=3)
+    rules = sorted(generator.rules(3000), key=lambda rule: int(rule[0]))
+    model = IndexedEnforcer.new_model(path=MODEL_PATH)
+    report = find_redundant_rules(model, rules)
+    after = compacted(model, rules, report)
+    requests = sample_requests(rules, model["p"]["p"].tokens, 3000, 3, [rule for rule, _, _ in report.removed])
+    requests += generator.requests(2000)
+    with open(MODEL_PATH) as file:
+        model_text = file.read()
+    assert verify_compaction(model_text, {("p", "p"): rules}, {("p", "p"): after}, requests) == []
+
+
+def test_owner_rules_are_only_removed_as_duplicates():
+    owner = AccessLevel.CATALOG_OWNER.value
+    rules = [
+        ["10", "root", ".*", ".*", ".*", "allow"],
+        ["30", "alice", "ws" + optional_trailing_dot, ".*", ".*", "allow"],
+        [owner, "root", "ws.cat_1" + optional_trailing_dot, ".*", ".*", "allow"],
+        [owner, "alice", "ws.cat_2" + optional_trailing_dot, ".*", ".*", "allow"],
+        [owner, "alice", "ws.cat_2" + optional_trailing_dot, ".*", ".*", "allow"],
+        [AccessLevel.CATALOG_READER.value, "root", "ws.cat_1" + optional_trailing_dot, "GET", ".*", "allow"],
+        ["1000", ".*", ".*", ".*", ".*", "allow"],
+    ]
+    report = find_redundant_rules(IndexedEnforcer.new_model(path=MODEL_PATH), rules)
+    assert report.positions == [4, 5]
+    assert all(rule[0] not in OWNER_PRIORITIES or reason == "duplicate" for rule, reason, _ in report.removed)
+
+
+def test_registry_survives_online_compaction(tmp_path):
+    owner = AccessLevel.CATALOG_OWNER.value
+    lines = [
+        "p, 10, root, .*, .*, .*, allow",
+        f"p, {owner}, root, ws.public_1{optional_trailing_dot}, .*, .*, allow",
+        f"p, {owner}, root, ws.public_1{optional_trailing_dot}, .*, .*, allow",
+        f"p, {AccessLevel.SCHEMA_OWNER.value}, root, ws.public_1.schema_1{optional_trailing_dot}, .*, .*, allow",
+        "p, 1000, .*, .*, .*, .*, allow",
+    ]
+    path = tmp_path / "policy.csv"
+    path.write_text("\n".join(lines) + "\n")
+    enforcer = IndexedEnforcer(MODEL_PATH, str(path))
+    compactor = PolicyCompactor(enforcer, PolicyPersister(enforcer))
+
+    report = asyncio.run(compactor.compact())
+    assert [reason for _, reason, _ in report.removed] == ["duplicate"]
+
+    # As after a restart.
+    registry = ResourceRegistry()
+    registry.rebuild(IndexedEnforcer(MODEL_PATH, str(path)))
+    assert registry.children(CATALOG, ("ws",)) == ["public_1"]
+    assert registry.children(SCHEMA, ("ws", "public_1")) == ["schema_1"]
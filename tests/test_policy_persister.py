@@ -0,0 +1,61 @@
+"""
+Tests of `PolicyPersister`: the written policy file and retries of failed flushes.
+"""
+
+import asyncio
+
+from conftest import MODEL_PATH
+from services import policy_persister
+from services.enforcer import IndexedEnforcer
+from services.policy_persister import PolicyPersister
+
+
+def make_enforcer(tmp_path):
+    path = tmp_path / "policy.csv"
+    path.write_text("p, 30, alice, ws.cat, .*, .*, allow\ng, bob, alice\n")
+    return path, IndexedEnforcer(MODEL_PATH, str(path))
+
+
+def test_policy_file_ends_with_newline(tmp_path):
+    path, enforcer = make_enforcer(tmp_path)
+    enforcer.add_policy("40", "bob", "ws.cat.s", ".*", ".*", "allow")
+    PolicyPersister(enforcer).request_save()
+
+    content = path.read_text()
+    assert content.endswith("allow\n") or content.endswith("alice\n")
+    with open(path, "a") as file:
+        file.write("p, 50, carol, ws.x, .*, .*, allow\n")
+    reloaded = IndexedEnforcer(MODEL_PATH, str(path))
+    assert reloaded.has_policy("50", "carol", "ws.x", ".*", ".*", "allow")
+    assert reloaded.has_grouping_policy("bob", "alice")
+    assert len(reloaded.get_policy()) == 3
+
+
+def test_failed_flush_is_retried_without_further_changes(tmp_path, monkeypatch):
+    path, enforcer = make_enforcer(tmp_path)
+    monkeypatch.setattr(policy_persister, "RETRY_DELAY", 0.01)
+    write = PolicyPersister._write_policy_file
+    failures = []
+
+    def failing_write(snapshot):
+        if len(failures) < 2:
+            failures.append(snapshot)
+            raise OSError("disk full")
+        return write(snapshot)
+
+    monkeypatch.setattr(PolicyPersister, "_write_policy_file", staticmethod(failing_write))
+
+    async def scenario():
+        persister = PolicyPersister(enforcer, flush_interval=0.01)
+        enforcer.add_policy("40", "bob", "ws.cat.s", ".*", ".*", "allow")
+        ticket = persister.request_save()
+        for _ in range(200):
+            if persister.durable >= ticket:
+                break
+            await asyncio.sleep(0.01)
+        await persister.close()
+        return persister.durable >= ticket
+
+    assert asyncio.run(scenario())
+    assert len(failures) == 2
+    assert "p, 40, bob, ws.cat.s, .*, .*, allow\n" in path.read_text()
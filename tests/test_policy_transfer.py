@@ -0,0 +1,189 @@
+"""
+Round-trip tests of the streaming policy export and import, through the
+enforcer, the router, the admin endpoints and the CLI.
+"""
+
+import asyncio
+import json
+import random
+
+import pytest
+
+from conftest import MODEL_PATH, bearer
+from benchmarks.policy_generator import PolicyGenerator
+from services import policy_transfer
+from services.enforcer import IndexedEnforcer
+from services.enforcer_router import EnforcerRouter
+from services.policy_transfer import PolicyImporter, export_chunks, iter_policy
+from services.sqlite_adapter import SqliteAdapter
+
+GROUPINGS = [["dev_read", "employee_a"], ["bob", "alice"]]
+
+
+def write_policy(path, rules, groupings=GROUPINGS):
+    lines = [", ".join(["p"] + rule) for rule in rules] + [", ".join(["g"] + rule) for rule in groupings]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def generated_rules(count=3000, seed=1, generator=None):
+    return (generator or PolicyGenerator(users=50, seed=seed)).rules(count)
+
+
+def policy_of(enforcer):
+    return sorted(map(tuple, enforcer.get_policy())), sorted(map(tuple, enforcer.get_grouping_policy()))
+
+
+def import_text(enforcer, text, fmt, batch_size=500, chunk_size=4096):
+    importer = PolicyImporter(enforcer, fmt, batch_size)
+    data = text.encode()
+    for start in range(0, len(data), chunk_size):
+        importer.feed(data[start : start + chunk_size])
+    return importer.finish()
+
+
+@pytest.mark.parametrize("fmt", ["csv", "ndjson"])
+def test_round_trip(tmp_path, fmt):
+    generator = PolicyGenerator(users=50, seed=1)
+    source = tmp_path / "source.csv"
+    write_policy(source, generated_rules(generator=generator))
+    empty = tmp_path / "empty.csv"
+    empty.write_text("")
+    original = IndexedEnforcer(MODEL_PATH, str(source))
+
+    text = "".join(export_chunks(iter_policy(original), fmt, chunk_rules=100))
+    restored = IndexedEnforcer(MODEL_PATH, str(empty))
+    report = import_text(restored, text, fmt)
+
+    assert report.invalid == 0 and report.existing == 0
+    assert report.added == len(original.get_policy()) + len(GROUPINGS)
+    assert policy_of(restored) == policy_of(original)
+    requests = generator.requests(500)
+    assert restored.batch_enforce(requests) == original.batch_enforce(requests)
+
+    again = import_text(restored, text, fmt)
+    assert again.added == 0 and again.existing == report.added
+
+
+def test_router_round_trip(tmp_path):
+    source = tmp_path / "source.csv"
+    write_policy(source, generated_rules(1000))
+    original = IndexedEnforcer(MODEL_PATH, str(source))
+    router = EnforcerRouter(MODEL_PATH, SqliteAdapter(str(tmp_path / "policy.db")))
+
+    report = import_text(router, "".join(export_chunks(iter_policy(original), "ndjson")), "ndjson")
+    assert report.added == len(original.get_policy()) + len(GROUPINGS)
+    exported = "".join(export_chunks(iter_policy(router, page_size=64), "csv"))
+    assert sorted(exported.splitlines()) == sorted("".join(export_chunks(iter_policy(original), "csv")).splitlines())
+
+
+def test_invalid_rows_are_reported(tmp_path):
+    empty = tmp_path / "empty.csv"
+    empty.write_text("")
+    enforcer = IndexedEnforcer(MODEL_PATH, str(empty))
+    lines = [
+        json.dumps({"ptype": "p", "rule": ["30", "alice", "ws.cat", ".*", ".*", "allow"]}),
+        json.dumps({"ptype": "p", "rule": ["x", "alice", "ws.cat", ".*", ".*", "allow"]}),
+        json.dumps({"ptype": "p", "rule": ["30", "alice", "ws.cat", ".*", "allow"]}),
+        "{not json",
+        json.dumps({"ptype": "q", "rule": ["a"]}),
+        json.dumps({"ptype": "p", "rule": ["30", "alice", "ws.cat", ".*", ".*", "maybe"]}),
+    ]
+    report = import_text(enforcer, "\n".join(lines), "ndjson", chunk_size=7)
+    assert (report.rows, report.added, report.invalid) == (6, 1, 5)
+    assert [line for line, _ in report.errors] == [2, 3, 4, 5, 6]
+
+
+def test_export_pages_survive_concurrent_changes(tmp_path):
+    source = tmp_path / "source.csv"
+    write_policy(source, generated_rules(2000, seed=2))
+    enforcer = IndexedEnforcer(MODEL_PATH, str(source))
+    stable = {tuple(rule) for rule in enforcer.get_policy()}
+    rng = random.Random(0)
+    extra = []
+
+    exported = []
+    for count, (ptype, rule) in enumerate(iter_policy(enforcer, page_size=50)):
+        exported.append((ptype, tuple(rule)))
+        if count % 37 == 0:
+            # Add and remove other rules before and after the current page.
+            rule = [str(rng.choice([20, 40, 60, 900])), f"user_{count}", f"ws_{count}.x", ".*", ".*", "allow"]
+            enforcer.add_policy(*rule)
+            extra.append(rule)
+            if len(extra) > 3:
+                enforcer.remove_policy(*extra.pop(rng.randrange(len(extra))))
+
+    p_rules = [rule for ptype, rule in exported if ptype == "p"]
+    assert len(set(p_rules)) == len(p_rules)
+    assert stable <= set(p_rules)
+
+
+def test_endpoints(app_client):
+    from services.auth_service import casbin_enforcer
+
+    assert app_client.get("/admin/v1/policy/export", headers=bearer("employee")).status_code == 403
+    assert app_client.get("/admin/v1/policy/export?format=xml", headers=bearer("supreme")).status_code == 400
+
+    response = app_client.get("/admin/v1/policy/export?format=ndjson", headers=bearer("supreme"))
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert len([record for record in records if record["ptype"] == "p"]) == len(casbin_enforcer.get_policy())
+
+    new = {"ptype": "p", "rule": ["43", "alice", "default.imported_job(\\..*)?$", ".*", ".*", "allow"]}
+    body = "\n".join(json.dumps(record) for record in records + [new, {"ptype": "p", "rule": ["1"]}])
+    response = app_client.post("/admin/v1/policy/import?format=ndjson", headers=bearer("supreme"), content=body)
+    report = response.json()["report"]
+    assert (report["added"], report["existing"], report["invalid"]) == (1, len(records), 1)
+    assert casbin_enforcer.has_policy(*new["rule"])
+
+    jobs = app_client.get("/workflow-service/v1/job/list-filter?workspaceId=default", headers=bearer("supreme"))
+    assert "imported_job" in jobs.json()["items"]
+
+
+def test_import_changes_the_policy_on_the_event_loop(app_client, monkeypatch):
+    from services.auth_service import casbin_enforcer
+
+    calls = []
+    add = casbin_enforcer.add_named_policies
+
+    def recording_add(ptype, rules):
+        try:
+            asyncio.get_running_loop()
+            calls.append("loop")
+        except RuntimeError:
+            calls.append("thread")
+        return add(ptype, rules)
+
+    monkeypatch.setattr(casbin_enforcer, "add_named_policies", recording_add)
+    body = "\n".join(f"p, 40, loop_user, transfer_ws.loop_{i}(\\..*)?$, .*, .*, allow" for i in range(2500))
+    response = app_client.post("/admin/v1/policy/import", headers=bearer("supreme"), content=body)
+    assert response.json()["report"]["added"] == 2500
+    assert calls and set(calls) == {"loop"}
+
+
+def test_cli_import_appends_new_rules_on_their_own_lines(tmp_path, capsys):
+    target = tmp_path / "policy.csv"
+    target.write_text("p, 30, alice, ws.cat, .*, .*, allow\ng, dev_read, employee_a")
+    dump = tmp_path / "dump.ndjson"
+    dump.write_text(
+        "\n".join(
+            json.dumps(record)
+            for record in [
+                {"ptype": "g", "rule": ["dev_read", "employee_a"]},
+                {"ptype": "p", "rule": ["30", "alice", "ws.cat", ".*", ".*", "allow"]},
+                {"ptype": "p", "rule": ["40", "bob", "ws.cat.s", ".*", ".*", "allow"]},
+                {"ptype": "p", "rule": ["40", "bob", "ws.cat.s", ".*", ".*", "allow"]},
+            ]
+        )
+        + "\n"
+    )
+    assert policy_transfer.main(["import", str(dump), "--into", str(target), "--model", MODEL_PATH]) == 0
+    assert target.read_text().splitlines() == [
+        "p, 30, alice, ws.cat, .*, .*, allow",
+        "g, dev_read, employee_a",
+        "p, 40, bob, ws.cat.s, .*, .*, allow",
+    ]
+    assert "1 rules appended" in capsys.readouterr().out
+
+    reloaded = IndexedEnforcer(MODEL_PATH, str(target))
+    assert len(reloaded.get_policy()) == 2 and reloaded.has_grouping_policy("dev_read", "employee_a")
@@ -0,0 +1,135 @@
+"""
+Tests of `PolicyWatcher`: deltas between workers, gaps, log rotation and
+resyncs while publishing.
+"""
+
+import asyncio
+import shutil
+
+import pytest
+
+from conftest import MODEL_PATH, POLICY_PATH
+from services.enforcer import IndexedEnforcer
+from services.policy_watcher import FileDeltaLog, PolicyWatcher
+
+
+def rule(name):
+    return ["40", name, f"ws.{name}(\\..*)?$", ".*", ".*", "allow"]
+
+
+def worker(tmp_path, name, max_bytes=1024 * 1024):
+    """An enforcer on its own copy of the policy, following the shared log."""
+    path = tmp_path / f"{name}.csv"
+    shutil.copy(POLICY_PATH, path)
+    enforcer = IndexedEnforcer(MODEL_PATH, str(path))
+    watcher = PolicyWatcher(enforcer, FileDeltaLog(str(tmp_path / "delta.log"), max_bytes))
+    watcher.start()
+    return enforcer, watcher
+
+
+def policy_of(enforcer):
+    return sorted(map(tuple, enforcer.get_policy())), sorted(map(tuple, enforcer.get_grouping_policy()))
+
+
+def skip_versions(watcher, enforcer, count):
+    """Starts a new log past versions that the other workers never read, as if records were lost."""
+    with watcher.log.locked():
+        watcher.version += count
+        watcher.log.reset(watcher.version, [("p", enforcer.get_policy()), ("g", enforcer.get_grouping_policy())])
+
+
+def test_changes_reach_the_other_workers(tmp_path):
+    a, watcher_a = worker(tmp_path, "a")
+    b, watcher_b = worker(tmp_path, "b")
+    seen = []
+    watcher_b.listeners.append(seen.append)
+
+    a.add_policy(*rule("u1"))
+    a.add_policies([rule(f"u{i}") for i in range(2, 20)])
+    a.add_grouping_policy("u1", "admins")
+    b.add_policy(*rule("v1"))
+    a.remove_policy(*rule("u1"))
+    a.remove_filtered_policy(1, "u5")
+    watcher_a.poll()
+    watcher_b.poll()
+
+    assert policy_of(a) == policy_of(b)
+    assert b.has_policy(*rule("v1")) and not b.has_policy(*rule("u5"))
+    assert watcher_a.version == watcher_b.version == 6
+    assert [record["op"] for record in seen] == ["+", "+", "+", "-", "*"]
+    # Only the resync of joining the log.
+    assert watcher_b.stats()["resyncs"] == 1
+
+
+def test_a_gap_resyncs_from_the_snapshot(tmp_path):
+    a, watcher_a = worker(tmp_path, "a")
+    b, watcher_b = worker(tmp_path, "b")
+    with a.local_changes():
+        a.add_policy(*rule("lost"))
+    skip_versions(watcher_a, a, 5)
+    a.add_policy(*rule("after"))
+
+    watcher_b.poll()
+    assert watcher_b.stats()["resyncs"] == 2
+    assert b.has_policy(*rule("lost")) and b.has_policy(*rule("after"))
+    assert policy_of(a) == policy_of(b)
+    assert watcher_b.version == watcher_a.version
+
+
+def test_rotation_keeps_a_rule_added_without_an_event_loop(tmp_path):
+    # Every append rotates the log, so each snapshot must already hold the
+    # rule casbin adds after it notified the watcher.
+    a, watcher_a = worker(tmp_path, "a", max_bytes=1)
+    b, watcher_b = worker(tmp_path, "b", max_bytes=1)
+    a.add_policy(*rule("u1"))
+    a.add_grouping_policy("u1", "admins")
+    watcher_b.poll()
+    b.remove_policy(*rule("u1"))
+    b.add_policy(*rule("u2"))
+
+    watcher_a.poll()
+    late, watcher_late = worker(tmp_path, "late", max_bytes=1)
+    assert policy_of(late) == policy_of(a) == policy_of(b)
+    assert late.has_policy(*rule("u2")) and not late.has_policy(*rule("u1"))
+    assert late.has_grouping_policy("u1", "admins")
+    assert len(a.get_policy()) == len(set(map(tuple, a.get_policy())))
+
+
+@pytest.mark.parametrize("change", ["add", "remove", "grouping"])
+def test_own_change_survives_a_resync_while_publishing(tmp_path, change):
+    a, watcher_a = worker(tmp_path, "a")
+    b, watcher_b = worker(tmp_path, "b")
+    a.add_policy(*rule("old"))
+    watcher_b.poll()
+    skip_versions(watcher_b, b, 3)
+
+    async def change_policy():
+        if change == "add":
+            a.add_policy(*rule("new"))
+        elif change == "remove":
+            a.remove_policy(*rule("old"))
+        else:
+            a.add_grouping_policy("old", "admins")
+        # Publication runs once the current event-loop step has finished.
+        await asyncio.sleep(0)
+
+    asyncio.run(change_policy())
+    watcher_b.poll()
+    assert watcher_a.stats()["resyncs"] == 1
+    assert a.has_policy(*rule("new")) == (change == "add")
+    assert a.has_policy(*rule("old")) == (change != "remove")
+    assert a.has_grouping_policy("old", "admins") == (change == "grouping")
+    assert policy_of(a) == policy_of(b)
+
+
+def test_resync_without_an_event_loop_does_not_duplicate_the_rule(tmp_path):
+    a, watcher_a = worker(tmp_path, "a")
+    b, watcher_b = worker(tmp_path, "b")
+    skip_versions(watcher_b, b, 3)
+    a.add_policy(*rule("new"))
+    a.remove_policy(*rule("new"))
+    a.add_policy(*rule("new"))
+
+    watcher_b.poll()
+    assert a.get_policy().count(rule("new")) == 1
+    assert policy_of(a) == policy_of(b)
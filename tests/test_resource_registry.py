@@ -0,0 +1,136 @@
+"""
+Tests of `ResourceRegistry`: rebuilding it from the policy and listing children.
+"""
+
+from conftest import MODEL_PATH, bearer
+from constants import AccessLevel, optional_trailing_dot
+from services.enforcer import IndexedEnforcer
+from services.enforcer_router import EnforcerRouter
+from services.resource_registry import CATALOG, JOB, KIND_PTYPE, SCHEMA, TABLE, ResourceRegistry, kind_marker
+from services.sqlite_adapter import SqliteAdapter
+
+
+def owner_rule(level, obj):
+    return f"p, {level.value}, alice, {obj}{optional_trailing_dot}, .*, .*, allow"
+
+
+def deny_rule(level, obj):
+    return f"p, {level.value}, .*, {obj}{optional_trailing_dot}, .*, .*, deny"
+
+
+def test_rebuild_tells_jobs_from_catalogs(tmp_path):
+    lines = [
+        owner_rule(AccessLevel.JOB_OWNER, "ws.job_1"),
+        deny_rule(AccessLevel.JOB_DENY_ALL, "ws.job_1"),
+        owner_rule(AccessLevel.JOB_OWNER, "ws.job_2"),
+        owner_rule(AccessLevel.CATALOG_OWNER, "ws.cat_1"),
+        deny_rule(AccessLevel.CATALOG_DENY_ALL, "ws.cat_1"),
+        owner_rule(AccessLevel.CATALOG_OWNER, "ws.cat_2"),
+        owner_rule(AccessLevel.SCHEMA_OWNER, "ws.cat_2.schema_1"),
+        owner_rule(AccessLevel.TABLE_OWNER, "ws.cat_3.schema_2.table_1"),
+        owner_rule(AccessLevel.JOB_OWNER, "ws.legacy"),
+        "p, 10, root, .*, .*, .*, allow",
+        "g2, ws.job_1, job",
+        "g2, ws.job_2, job",
+        "g2, ws.cat_1, catalog",
+        "g2, ws.cat_2, catalog",
+    ]
+    path = tmp_path / "policy.csv"
+    path.write_text("\n".join(lines) + "\n")
+
+    registry = ResourceRegistry()
+    registry.rebuild(IndexedEnforcer(MODEL_PATH, str(path)))
+
+    # `legacy` has no marker, as written before markers were kept.
+    assert registry.children(JOB, ("ws",)) == ["job_1", "job_2", "legacy"]
+    assert registry.children(CATALOG, ("ws",)) == ["cat_1", "cat_2", "cat_3", "legacy"]
+    assert registry.children(SCHEMA, ("ws", "cat_2")) == ["schema_1"]
+    assert registry.children(TABLE, ("ws", "cat_3", "schema_2")) == ["table_1"]
+
+
+def test_markers_apply_in_either_order():
+    objects = [f"ws.{name}{optional_trailing_dot}" for name in ("job_1", "cat_1", "other")]
+    markers = [kind_marker(JOB, ("ws", "job_1")), kind_marker(CATALOG, ("ws", "cat_1"))]
+
+    before = ResourceRegistry()
+    before.set_kinds(markers)
+    before.register_objects(objects)
+    after = ResourceRegistry()
+    after.register_objects(objects)
+    after.set_kinds(markers + [["ws.x", "table"], ["ws.a.b", "job"]])
+
+    for registry in (before, after):
+        assert registry.children(JOB, ("ws",)) == ["job_1", "other"]
+        assert registry.children(CATALOG, ("ws",)) == ["cat_1", "other"]
+
+
+def test_router_keeps_markers_out_of_the_shards(tmp_path):
+    router = EnforcerRouter(MODEL_PATH, SqliteAdapter(str(tmp_path / "policy.db")), stored_ptypes=(KIND_PTYPE,))
+    router.add_policies([
+        [AccessLevel.JOB_OWNER.value, "alice", f"ws.job_1{optional_trailing_dot}", ".*", ".*", "allow"],
+        [AccessLevel.CATALOG_OWNER.value, "alice", f"ws.cat_1{optional_trailing_dot}", ".*", ".*", "allow"],
+    ])
+    router.enforce("alice", "ws.job_1", "GET", "")
+    router.add_named_grouping_policies(KIND_PTYPE, [kind_marker(JOB, ("ws", "job_1"))])
+
+    assert router.has_named_grouping_policy(KIND_PTYPE, "ws.job_1", JOB)
+    assert not router.shard("ws.job_1").get_named_grouping_policy(KIND_PTYPE)
+    assert not router.shard("other.x").get_named_grouping_policy(KIND_PTYPE)
+    assert router.policy_rules(KIND_PTYPE) == [["ws.job_1", JOB]]
+
+    registry = ResourceRegistry()
+    registry.set_kinds(router.policy_rules(KIND_PTYPE))
+    registry.register_objects(router.policy_objects())
+    assert registry.children(JOB, ("ws",)) == ["cat_1", "job_1"]
+    assert registry.children(CATALOG, ("ws",)) == ["cat_1"]
+
+
+def test_listings_after_rebuild(app_client):
+    from services.auth_service import casbin_enforcer, resource_registry
+
+    headers = bearer("employee")
+    job = {"name": "registry_job", "workspaceId": "default", "isPrivate": False}
+    catalog = {"name": "registry_catalog", "workspaceId": "default", "bucket": "b", "isPrivate": False}
+    assert app_client.post("/workflow-service/v1/job/create-new", json=job, headers=headers).status_code == 200
+    assert app_client.post("/workspace-service/v1/catalog/create-new", json=catalog, headers=headers).status_code == 200
+
+    assert casbin_enforcer.has_named_grouping_policy(KIND_PTYPE, "default.registry_job", JOB)
+    assert casbin_enforcer.has_named_grouping_policy(KIND_PTYPE, "default.registry_catalog", CATALOG)
+
+    batch = [{"name": "registry_batch", "workspaceId": "default", "bucket": "b", "isPrivate": True}]
+    assert app_client.post("/workspace-service/v1/catalog/batch-create", json=batch, headers=headers).status_code == 200
+    assert casbin_enforcer.has_named_grouping_policy(KIND_PTYPE, "default.registry_batch", CATALOG)
+
+    # As after a restart.
+    resource_registry.rebuild(casbin_enforcer)
+    jobs = app_client.get("/workflow-service/v1/job/list-filter?workspaceId=default", headers=headers).json()
+    catalogs = app_client.get("/workspace-service/v1/catalog/list-filter?workspaceId=default", headers=headers).json()
+    assert "registry_job" in jobs["items"] and "registry_job" not in catalogs["items"]
+    assert "registry_catalog" in catalogs["items"] and "registry_catalog" not in jobs["items"]
+    assert "registry_batch" in catalogs["items"] and "registry_batch" not in jobs["items"]
+
+
+def test_listing_reads_the_body_only_when_a_rule_inspects_it(app_client, monkeypatch):
+    from services import auth_service
+
+    reads = []
+    extract = auth_service.extract_request_body
+
+    async def counting_extract(req):
+        reads.append(req.url.path)
+        return await extract(req)
+
+    monkeypatch.setattr(auth_service, "extract_request_body", counting_extract)
+    response = app_client.get("/workflow-service/v1/job/list-filter?workspaceId=default", headers=bearer("employee"))
+    assert response.status_code == 200
+    assert not reads
+
+    rule = ["30", "employee", "default.body_job(\\..*)?$", ".*", '.*"isPrivate".*', "allow"]
+    auth_service.casbin_enforcer.add_policy(*rule)
+    auth_service.resource_registry.register(JOB, ("default", "body_job"))
+    try:
+        app_client.get("/workflow-service/v1/job/list-filter?workspaceId=default", headers=bearer("employee"))
+        assert reads
+    finally:
+        auth_service.casbin_enforcer.remove_policy(*rule)
+        auth_service.resource_registry.unregister(JOB, ("default", "body_job"))
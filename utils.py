@@ -13,7 +13,7 @@ Classes:
 - UsersDAO: Provides methods for user authentication and data retrieval.
 """
 
-from typing import Optional
+from typing import List, Optional
 from itertools import filterfalse
 from pydantic import BaseModel, Field
 
@@ -22,19 +22,32 @@ from fastapi import Request
 
 async def extract_request_body(req: Request) -> str:
     """
-    Extracts the JSON body from a FastAPI request and serializes it as a string.
-    
+    Extracts the JSON body from a FastAPI request as a string.
+
+    The body is read and parsed at most once per request. Starlette caches the
+    raw bytes and the parsed JSON on the request, and FastAPI validates body
+    models (e.g. `LoadDataRequest`) from that same cache, so the route and the
+    authorization check share one parse. The string is decoded straight from
+    the raw bytes instead of being re-encoded with `json.dumps`, and it is
+    kept on `req.state` for later checks on the same request.
+
     Args:
         req (Request): The FastAPI request object.
-    
+
     Returns:
-        str: The JSON body as a serialized string, or an empty string if extraction fails.
+        str: The JSON body as sent by the client, or an empty string if it is not valid JSON.
     """
+    req_body = getattr(req.state, "req_body", None)
+    if req_body is not None:
+        return req_body
+
     try:
-        req_body = await req.json()
-        return json.dumps(req_body)
+        await req.json()
+        req_body = (await req.body()).decode()
     except Exception:
-        return ""
+        req_body = ""
+    req.state.req_body = req_body
+    return req_body
 
 
 class User(BaseModel):
@@ -217,4 +230,12 @@ class UploadFileRequest(BaseModel):
 class FileDownloadRequest(BaseModel):
     organizationId: str
     folder: str
-    fileId: str
\ No newline at end of file
+    fileId: str
+    
+class AuthorizationCheck(BaseModel):
+    obj: str
+    act: str
+    req_body: str = ""
+    
+class BatchCheckRequest(BaseModel):
+    checks: List[AuthorizationCheck]